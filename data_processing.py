@@ -1,82 +1,299 @@
+import argparse
+import math
 import sys
+import time
+from contextlib import nullcontext
 
 import csv
-from utilities.company_data import FossilFuelCompanyYear
+from utilities.company_data import FossilFuelCompanyYear, parse_bloomberg_values
+from utilities.financed_emissions import FinancedEmissionsMatrix
+from utilities import instrumentation
+from utilities.result_cache import CACHE_FILENAME, ResultCache, cache_key, company_fingerprint, fi_fingerprint, load_cache, lookup, save_cache
+from utilities.run_journal import JOURNAL_FILENAME, finish_journal, load_journal, record_shard, record_year, run_key
+from utilities.output_writer import OUTPUT_FORMATS, LongFormatWriter, concatenate_parts, long_output_path, part_path
+from extraction_methods.extract_bloomberg_data import get_bloomberg_store, resolve_universe
+from extraction_methods.input_snapshot import DIR_snapshot, load_snapshot
+from render_charts import render_charts
 
-from global_values import FINANCIAL_INSTITUTIONS, YEARS_OF_INTEREST, FOSSIL_FUEL_TICKERS
+from global_values import FINANCIAL_INSTITUTIONS, YEARS_OF_INTEREST, HOLDINGS_DATA_COLLECTION, LOAN_DATA_COLLECTION, get_fossil_fuel_tickers
 
 import os
-from typing import List
-import matplotlib.pyplot as plt
-from string import ascii_lowercase
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 from alive_progress import alive_bar
 
 
 
 
-def main(fossil_csv_dir: str, years: List[int], output_dir: str, graph_dir: str):
+# Tickers per checkpointed unit of work
+CHECKPOINT_TICKERS = 100
+
+
+def process_tickers(fossil_csv_dir: str, year: int, tickers: List[str], year_dir: str, bar: Optional[Callable[[], Any]] = None, cache: Optional[ResultCache] = None, long_path: Optional[str] = None) -> Tuple[np.ndarray, ResultCache]:
+    """
+    Process one shard of tickers for one year: export each company's results
+    and return the (company, financial institution) total financed emissions.
+    Runs in a worker process when main is given more than one worker.
+
+    Results go to one csv per company-year in year_dir, or if long_path is
+    given to that single long format file (see utilities.output_writer).
+
+    If a cache is given, the holdings and loan value of a company-year and
+    financial institution are taken from it when none of their inputs changed
+    since last time (see utilities.result_cache), the others are looked up.
+    The returned cache holds the entries of every company-year in the shard.
+    """
+    with LongFormatWriter(long_path) if long_path is not None else nullcontext() as long_writer:
+        return _process_tickers(fossil_csv_dir, year, tickers, year_dir, bar, cache, long_writer)
+
+
+def _process_tickers(fossil_csv_dir: str, year: int, tickers: List[str], year_dir: str, bar: Optional[Callable[[], Any]], cache: Optional[ResultCache], long_writer: Optional[LongFormatWriter]) -> Tuple[np.ndarray, ResultCache]:
+    bloomberg_store = get_bloomberg_store(fossil_csv_dir)
+    companies : List[FossilFuelCompanyYear] = []
+    entries : ResultCache = {}
+    lines = [bloomberg_store.get((urgewald_ticker, year)) for urgewald_ticker in tickers]
+    # Numeric fields of every company-year of the shard, parsed in one go
+    with instrumentation.stage("bloomberg.parse_values"):
+        values = iter(parse_bloomberg_values([line for line in lines if line is not None]))
+    for urgewald_ticker, line in zip(tickers, lines):
+        if bar is not None:
+            bar()
+        if line is None:
+            continue
+        line_values = next(values)
+        known : Dict[str, Tuple[float, float]] = {}
+        fingerprint = None
+        if cache is not None:
+            fingerprint = company_fingerprint(urgewald_ticker, line[23] if len(line) > 23 else "")
+            for fi in FINANCIAL_INSTITUTIONS:
+                cached = lookup(cache, urgewald_ticker, year, fingerprint, fi)
+                if cached is not None:
+                    known[fi] = cached
+            instrumentation.count("result_cache.hits", len(known))
+            instrumentation.count("result_cache.misses", len(FINANCIAL_INSTITUTIONS) - len(known))
+        try:
+            company = FossilFuelCompanyYear(None, year, urgewald_ticker, line=line, values=line_values, known=known)
+        except Exception as e:
+            print(f"[ERROR] Failed processing {urgewald_ticker} for year {year}: {e}")
+            continue
+        companies.append(company)
+        if fingerprint is not None:
+            entries[cache_key(urgewald_ticker, year)] = {"fingerprint": fingerprint, "institutions": {
+                fi: [fi_fingerprint(fi, year), share_value, loan_value]
+                for fi, share_value, loan_value in zip(FINANCIAL_INSTITUTIONS, company.holdings, company.loans)
+            }}
+        try:
+            if long_writer is None:
+                company.export_with_financed_data_to_csv(os.path.join(year_dir, f"{line[0].replace("/", " - ")}_{year}.csv"))
+            else:
+                long_writer.write_company(company)
+        except Exception as e:
+            print(f"[ERROR] Failed processing {urgewald_ticker} for year {year}: {e}")
+
+    # Financed emissions of every company and FI in the shard in one pass
+    with instrumentation.stage("financed_emissions"):
+        totals = FinancedEmissionsMatrix(companies, FINANCIAL_INSTITUTIONS, [year]).total_financed_emissions()[:, :, 0]
+    return totals.reshape(len(companies), len(FINANCIAL_INSTITUTIONS)), entries
+
+
+def warm_inputs(years: List[int]) -> None:
+    """
+    Build the holdings and loan indexes of every FI and year (and the CUSIP
+    crosswalk) with one lookup each, so worker processes forked afterwards
+    inherit them instead of each parsing the same inputs again.
+    """
+    for fi in FINANCIAL_INSTITUTIONS:
+        for year in years:
+            HOLDINGS_DATA_COLLECTION("", "", fi, year)
+            LOAN_DATA_COLLECTION("", "", fi, year)
+
+
+def _process_shard(*args) -> Tuple[np.ndarray, ResultCache, Dict[str, Dict]]:
+    """process_tickers in a worker process, also sending back the worker's instrumentation."""
+    instrumentation.reset()
+    result, entries = process_tickers(*args)
+    return result, entries, instrumentation.snapshot()
+
+
+def main(fossil_csv_dir: str, years: List[int], output_dir: str, graph_dir: str, workers: int = 1, use_cache: bool = True, output_format: str = "long", resume: bool = True, charts: bool = True):
+    start = time.perf_counter()
+    instrumentation.reset()
     os.makedirs(output_dir, exist_ok=True)
+    cache_path = os.path.join(output_dir, CACHE_FILENAME)
+    cache = load_cache(cache_path) if use_cache else None
 
     # Initialize the fi dicts:
     fi_serialized_data = {}
     for fi in FINANCIAL_INSTITUTIONS:
         fi_serialized_data[fi] = [0] * len(years)
 
+    # Parse every Bloomberg extract once, keyed by (ticker, year), or take
+    # all parsed inputs from a current snapshot. Worker processes are forked
+    # after this so they inherit the store.
+    with instrumentation.stage("load_inputs"):
+        if load_snapshot(bloomberg_dir=fossil_csv_dir):
+            print(f"Loaded parsed inputs from {DIR_snapshot}")
+        get_bloomberg_store(fossil_csv_dir)
+    universe = get_fossil_fuel_tickers()
+    tickers, unmatched = resolve_universe(universe, fossil_csv_dir)
+    if not tickers:
+        raise ValueError(f"None of the {len(universe)} tickers of the universe has a row in the Bloomberg extracts of {fossil_csv_dir}")
+    if unmatched:
+        print(f"[WARNING] {len(unmatched)} of {len(universe)} tickers of the universe have no row in the Bloomberg extracts, e.g. {", ".join(unmatched[:5])}")
+
+    year_dirs = [os.path.join(output_dir, str(year)) for year in years]
+    long_paths : List[Optional[str]] = [None] * len(years)
+    if output_format == "per-file":
+        for year_dir in year_dirs:
+            os.makedirs(year_dir, exist_ok=True)
+    else:
+        long_paths = [long_output_path(output_dir, year) for year in years]
+    if cache is not None:
+        # Hash the inputs of every FI and year once, before any worker is forked
+        with instrumentation.stage("fingerprint_inputs"):
+            for fi in FINANCIAL_INSTITUTIONS:
+                for year in years:
+                    fi_fingerprint(fi, year)
+
+    # Work is split into (year, shard of tickers) units, each one is recorded
+    # in the journal as soon as it is done so an interrupted run can resume
+    shard_size = max(1, min(CHECKPOINT_TICKERS, math.ceil(len(tickers) / (workers * 4))))
+    shards = [tickers[x:x+shard_size] for x in range(0, len(tickers), shard_size)]
+    journal_path = os.path.join(output_dir, JOURNAL_FILENAME)
+    key = run_key(fossil_csv_dir=os.path.normpath(fossil_csv_dir), years=years, tickers=tickers, financial_institutions=FINANCIAL_INSTITUTIONS, shard_size=shard_size, use_cache=use_cache, output_format=output_format)
+    if not resume:
+        finish_journal(journal_path)
+    journal = load_journal(journal_path, key)
+
+    # With the long format each shard writes a part file, joined in order once the year is done
+    shard_paths = lambda i: [part_path(long_paths[i], s) if long_paths[i] is not None else None for s in range(len(shards))]
+
+    # (company, FI) results of each shard of each year, in ticker order
+    year_results : List[List[Optional[np.ndarray]]] = [[None] * len(shards) for _ in years]
+    new_cache : ResultCache = {}
+    pending : List[Tuple[int, int]] = []
     for i in range(len(years)):
+        for s in range(len(shards)):
+            record = journal["shards"].get((years[i], s))
+            # A shard's part file is gone once its year is joined, it must still be there otherwise
+            if record is not None and (years[i] in journal["years"] or long_paths[i] is None or os.path.isfile(shard_paths(i)[s])):
+                year_results[i][s] = np.array(record["rows"]).reshape(-1, len(FINANCIAL_INSTITUTIONS))
+                new_cache.update(record["cache"])
+            else:
+                pending.append((i, s))
+    if len(pending) < len(years) * len(shards):
+        print(f"Resuming: {len(years) * len(shards) - len(pending)} of {len(years) * len(shards)} units were completed by an earlier run")
+
+    def shard_cache(shard: List[str], year: int) -> Optional[ResultCache]:
+        # Only ship the entries a shard can use to its worker
+        if cache is None:
+            return None
+        keys = (cache_key(ticker, year) for ticker in shard)
+        return {key: cache[key] for key in keys if key in cache}
+
+    def shard_done(i: int, s: int, result: np.ndarray, entries: ResultCache) -> None:
+        year_results[i][s] = result
+        new_cache.update(entries)
+        with instrumentation.stage("checkpoint"):
+            record_shard(journal_path, years[i], s, result.tolist(), entries)
+        if long_paths[i] is not None and years[i] not in journal["years"] and all(result is not None for result in year_results[i]):
+            with instrumentation.stage("write_output"):
+                concatenate_parts(shard_paths(i), long_paths[i])
+            record_year(journal_path, years[i])
+            journal["years"].add(years[i])
+
+    process_start = time.perf_counter()
+    if workers <= 1:
+        for i in range(len(years)):
+            year_pending = [s for j, s in pending if j == i]
+            if not year_pending:
+                continue
+            print(f"Analyzing fossil fuel companies for year {years[i]}")
+            with alive_bar(sum(len(shards[s]) for s in year_pending)) as bar:
+                for s in year_pending:
+                    result, entries = process_tickers(fossil_csv_dir, years[i], shards[s], year_dirs[i], bar, shard_cache(shards[s], years[i]), shard_paths(i)[s])
+                    shard_done(i, s, result, entries)
+    elif pending:
+        print(f"Analyzing fossil fuel companies for years {years[0]}-{years[-1]} with {workers} workers")
+        with instrumentation.stage("warm_inputs"):
+            warm_inputs(years)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_process_shard, fossil_csv_dir, years[i], shards[s], year_dirs[i], None, shard_cache(shards[s], years[i]), shard_paths(i)[s]): (i, s) for i, s in pending}
+            with alive_bar(len(futures)) as bar:
+                for future in as_completed(futures):
+                    result, entries, worker_instrumentation = future.result()
+                    instrumentation.merge(worker_instrumentation)
+                    shard_done(*futures[future], result, entries)
+                    bar()
+    # Years whose shards were all completed by an earlier run but not joined yet
+    for i in range(len(years)):
+        if long_paths[i] is not None and years[i] not in journal["years"]:
+            with instrumentation.stage("write_output"):
+                concatenate_parts(shard_paths(i), long_paths[i])
+    # Wall time, the stages inside it are summed over workers
+    instrumentation.timings["process_companies"] = time.perf_counter() - process_start
+
+    if cache is not None:
+        with instrumentation.stage("save_cache"):
+            save_cache(cache_path, new_cache)
+
+    finish_journal(journal_path)
+
+    # Shards are concatenated back in ticker order before summing so the
+    # totals are the same however the run was split or resumed
+    for i in range(len(years)):
+        fi_totals = np.concatenate(year_results[i]).sum(axis=0)
+        for f, fi in enumerate(FINANCIAL_INSTITUTIONS):
+            fi_serialized_data[fi][i] += float(fi_totals[f])
         
-        year = years[i]
-        print(f"Analyzing fossil fuel companies for year {year}")
-        year_dir = os.path.join(output_dir, str(year))
-        os.makedirs(year_dir, exist_ok=True)
-
-        with alive_bar(len(FOSSIL_FUEL_TICKERS)) as bar:
-            for urgewald_ticker in FOSSIL_FUEL_TICKERS:
-                bar()
-                # Find relevant file:
-                first_character = urgewald_ticker[0].lower()
-                if first_character not in ascii_lowercase:
-                    possible_files = [os.path.join(fossil_csv_dir, filename) for filename in os.listdir(fossil_csv_dir) if filename.startswith(f"GHG_emissions_others_") and filename.endswith(".csv")]
-                else:
-                    possible_files = [os.path.join(fossil_csv_dir, filename) for filename in os.listdir(fossil_csv_dir) if filename.startswith(f"GHG_emissions_{first_character}") and filename.endswith(".csv") and not filename.startswith(f"GHG_emissions_others_")]
-                
-                for file in possible_files:
-                    try:
-                        company = FossilFuelCompanyYear(file, year, urgewald_ticker)
-                        for fi in FINANCIAL_INSTITUTIONS:
-                            fi_serialized_data[fi][i] += company.get_total_financed_emission(fi)
-                        output_path = os.path.join(year_dir, f"{company.ticker.replace("/", " - ")}_{year}.csv")
-                        company.export_with_financed_data_to_csv(output_path)
-                        
-                        break
-                    except StopIteration:
-                        continue
-                    except Exception as e:
-                        print(f"[ERROR] Failed processing {file} for year {year}: {e}")
-                
-        
-    for fi in FINANCIAL_INSTITUTIONS:
-        plt.bar(years, fi_serialized_data[fi])
-        plt.title(f"{fi} Emissions data")
-        plt.xlabel("Year")
-        plt.ylabel("Financed CO2 Emission")
-        plt.savefig(f"{graph_dir}/{fi}_plot.png")
-        plt.clf()
-    with open(f"{graph_dir}/data.csv", mode='w', newline='') as f:
+    with instrumentation.stage("write_summary"), open(f"{graph_dir}/data.csv", mode='w', newline='') as f:
         writer = csv.writer(f)
         writer.writerow(["Financial Institution"] + years)
         writer.writerows([[fi] +  fi_serialized_data[fi] for fi in FINANCIAL_INSTITUTIONS])
+    if charts:
+        with instrumentation.stage("charts"):
+            render_charts(graph_dir, workers)
+
+    report_path = os.path.join(graph_dir, "run_report.json")
+    instrumentation.write_report(report_path, years=years, workers=workers, total_seconds=time.perf_counter() - start)
+    print(f"Run report written to {report_path}")
         
     
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        fossil_csv_dir = "data/input_data/Bloomberg"
-        output_dir = "data/output_data/processed_info"
-        graph_dir = "./data/output_data/serialized_fi_data"
-
-    else:
-        fossil_csv_dir = sys.argv[1]
-        output_dir = sys.argv[2]
+    parser = argparse.ArgumentParser(description="Compute financed emissions from the Bloomberg extracts")
+    parser.add_argument("fossil_csv_dir", nargs="?", default="data/input_data/Bloomberg")
+    parser.add_argument("output_dir", nargs="?", default="data/output_data/processed_info")
+    parser.add_argument("graph_dir", nargs="?", default="./data/output_data/serialized_fi_data")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes, 1 runs serially")
+    parser.add_argument("--no-cache", action="store_true", help="recompute every company-year instead of reusing results whose inputs are unchanged")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoints of an interrupted run and start over")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="long", help="long writes one financed_emissions_<year>.csv per year, per-file the legacy csv per company-year")
+    parser.add_argument("--no-charts", action="store_true", help="only write data.csv, draw the charts later with render_charts.py")
+    parser.add_argument("--profile", metavar="PATH", help="profile the run (main process only) and save the profile to PATH")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile", help="cprofile writes a .prof file for pstats/snakeviz, pyinstrument an html report")
+    args = parser.parse_args()
     years = [int(year) for year in YEARS_OF_INTEREST]
-    main(fossil_csv_dir, years, output_dir, graph_dir)
\ No newline at end of file
+    run = lambda: main(args.fossil_csv_dir, years, args.output_dir, args.graph_dir, args.workers, not args.no_cache, args.output_format, not args.restart, not args.no_charts)
+    if args.profile is None:
+        run()
+    elif args.profiler == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall(run)
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to {args.profile}")
+    else:
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            sys.exit("pyinstrument is not installed, run: pip install pyinstrument")
+        profiler = Profiler()
+        profiler.start()
+        run()
+        profiler.stop()
+        with open(args.profile, mode='w') as f:
+            f.write(profiler.output_html())
+        print(f"Profile written to {args.profile}")
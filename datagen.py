@@ -1,10 +1,15 @@
 import xlsxwriter
 import os
+import sys
+import glob
+import json
 import traceback
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from utilities.helper_functions import print_cond
 from string import ascii_lowercase
-from global_values import FOSSIL_FUEL_TICKERS, YEARS_OF_INTEREST
+from global_values import get_fossil_fuel_tickers, YEARS_OF_INTEREST
+from extraction_methods.extract_bloomberg_data import DIR_bloomberg, get_bloomberg_store, is_pulled
 # Fields to include in columns (column label and Bloomberg field)
 fields = [
     ("GHG_SCOPE_1", "B"),
@@ -38,6 +43,10 @@ fields = [
 ]
 
 directory = "data/input_data/Bloomberg_template"
+MANIFEST_FILENAME = "manifest.json"
+
+# (ticker, year) -> indexes into fields of the requests still to pull
+MissingRequests = Dict[Tuple[str, int], List[int]]
 
 
 def col_index_to_excel_col(index: int) -> str:
@@ -49,47 +58,159 @@ def col_index_to_excel_col(index: int) -> str:
     return result
 
 
-def generate_tables_alphabetical(tickers: List[str], years: List[int], verbose=False):
-    tickers_copy = tickers.copy()
+def excel_col_to_col_index(col: str) -> int:
+    """Convert Excel-style column letters to a 0-based column index (e.g., 'A' -> 0, 'AB' -> 27)"""
+    index = 0
+    for char in col:
+        index = index * 26 + ord(char) - ord('A') + 1
+    return index - 1
+
+
+def partition_alphabetical(tickers: List[str]) -> Dict[str, List[str]]:
+    """
+    Group tickers by their first letter in one pass. Tickers that do not start
+    with a letter go under 'others' in their order, the tickers of a letter
+    are in reverse order like the original pop-based split produced them, so
+    the workbooks and their rows come out the same.
+    """
+    partitions : Dict[str, List[str]] = {char: [] for char in ascii_lowercase}
+    partitions['others'] = []
+    for ticker in tickers:
+        first = ticker[:1].lower()
+        partitions[first if first in ascii_lowercase and first != '' else 'others'].append(ticker)
     for char in ascii_lowercase:
-        indexes = [i for i in range(len(tickers_copy)) if tickers_copy[i].lower().startswith(char)]
-        indexes.sort()
-        indexes.reverse()
-        # sort and reverse list so that the later indexes are first to avoid issues when popping
-        tickers_of_char = [tickers_copy.pop(i) for i in indexes]
-        generate_tables_of_size(tickers_of_char, years, 428, verbose, f'GHG_emissions_{char}')
-    generate_tables_of_size(tickers_copy, years, 428, verbose, f'GHG_emissions_others')
+        partitions[char].reverse()
+    return partitions
+
+
+def chunk_tables(tickers: List[str], max_size: int, name = "GHG_Emission") -> List[Tuple[List[str], str]]:
+    """Split tickers into workbooks of at most max_size tickers, return (tickers, workbook name) pairs"""
+    return [(tickers[x:x+max_size], f"{name}_{i}") for i, x in enumerate(range(0, len(tickers), max_size))]
+
+
+def _generate_table_job(job: Tuple[List[str], str], years: List[int], verbose: bool, missing: Optional[MissingRequests]) -> None:
+    generate_table(job[0], years, verbose, name=job[1], missing=missing)
 
-def generate_tables_of_size(tickers: List[str], years: List[int], max_size: int, verbose=False, name = "GHG_Emission"):
-    chunks = [tickers[x:x+max_size] for x in range(0, len(tickers), max_size)]
-    for i in range(len(chunks)):
-        chunk = chunks[i]
-        generate_table(chunk, years, verbose, name=name+"_"+str(i))
+
+def _requests_of(tickers: List[str], missing: Optional[MissingRequests]) -> Optional[MissingRequests]:
+    if missing is None:
+        return None
+    tickers_set = set(tickers)
+    return {key: requested for key, requested in missing.items() if key[0] in tickers_set}
+
+
+def generate_chunks(chunks: List[Tuple[List[str], str]], years: List[int], verbose=False, workers: int = 1, missing: Optional[MissingRequests] = None) -> None:
+    """Write every chunk to its own workbook, over a pool of workers processes if workers > 1"""
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            _generate_table_job(chunk, years, verbose, missing)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Only send each worker the requests of its own tickers
+        requests = [_requests_of(chunk[0], missing) for chunk in chunks]
+        for _ in executor.map(_generate_table_job, chunks, [years] * len(chunks), [verbose] * len(chunks), requests):
+            pass
+
+
+def generate_tables_alphabetical(tickers: List[str], years: List[int], verbose=False, workers: int = 1):
+    partitions = partition_alphabetical(tickers)
+    chunks = []
+    for char, tickers_of_char in partitions.items():
+        chunks += chunk_tables(tickers_of_char, 428, f'GHG_emissions_{char}')
+    generate_chunks(chunks, years, verbose, workers)
+
+def missing_requests(tickers: List[str], years: List[int], bloomberg_dir: str = DIR_bloomberg) -> Tuple[MissingRequests, Dict[str, List[str]]]:
+    """
+    Compare the (ticker, year, field) requests of the templates with the
+    extracts already in bloomberg_dir. Return the requests that are missing
+    or were not pulled (see is_pulled), and the satisfied ones as
+    "TICKER YEAR" -> field names.
+    """
+    store = get_bloomberg_store(bloomberg_dir) if os.path.isdir(bloomberg_dir) else {}
+    columns = [excel_col_to_col_index(field[1]) for field in fields]
+    missing : MissingRequests = {}
+    satisfied : Dict[str, List[str]] = {}
+    for ticker in tickers:
+        for year in years:
+            line = store.get((ticker, year))
+            pulled = [line is not None and col < len(line) and is_pulled(line[col]) for col in columns]
+            if not all(pulled):
+                missing[(ticker, year)] = [i for i, done in enumerate(pulled) if not done]
+            if any(pulled):
+                satisfied[f"{ticker} {year}"] = [fields[i][0] for i, done in enumerate(pulled) if done]
+    return missing, satisfied
 
 
+def generate_delta_tables_alphabetical(tickers: List[str], years: List[int], verbose=False, workers: int = 1, bloomberg_dir: str = DIR_bloomberg) -> MissingRequests:
+    """
+    Like generate_tables_alphabetical but the templates only hold the requests
+    the extracts in bloomberg_dir do not satisfy yet: rows that are complete
+    are left out and complete cells are left empty. Extracts of these
+    templates can be saved next to the others, load_bloomberg_store fills in
+    the gaps from them.
+
+    The satisfied requests are recorded in the template directory's
+    manifest.json. Returns the missing requests.
+    """
+    missing, satisfied = missing_requests(tickers, years, bloomberg_dir)
+    os.makedirs(directory, exist_ok=True)
+    # Templates of an earlier delta run are superseded by this one
+    for path in glob.glob(os.path.join(directory, "GHG_emissions_delta_*.xlsx")):
+        os.remove(path)
+    with open(os.path.join(directory, MANIFEST_FILENAME), mode='w') as f:
+        json.dump({"bloomberg_dir": bloomberg_dir, "years": years, "satisfied": satisfied}, f)
+
+    requested = len(tickers) * len(years) * len(fields)
+    still_missing = sum(len(fields_of_row) for fields_of_row in missing.values())
+    print_cond(verbose, f"{requested - still_missing} of {requested} requests are satisfied by the extracts in {bloomberg_dir}, {still_missing} left to pull")
+
+    partitions = partition_alphabetical([ticker for ticker in tickers if any((ticker, year) in missing for year in years)])
+    chunks = []
+    for char, tickers_of_char in partitions.items():
+        chunks += chunk_tables(tickers_of_char, 428, f'GHG_emissions_delta_{char}')
+    generate_chunks(chunks, years, verbose, workers, missing)
+    return missing
+
+
+def generate_tables_of_size(tickers: List[str], years: List[int], max_size: int, verbose=False, name = "GHG_Emission", workers: int = 1):
+    generate_chunks(chunk_tables(tickers, max_size, name), years, verbose, workers)
+
+
+def _field_formulas(ticker: str) -> List[Tuple[int, str, Optional[str]]]:
+    """
+    (column index, formula, None) of each BDP field of ticker and (column index,
+    start, end) of each BDH field, whose formula is start + year + end.
+    """
+    formulas = []
+    for field in fields:
+        field_name = field[0]
+        col = excel_col_to_col_index(field[1])
+        formula_type = field[2] if len(field) == 3 else "BDH"
+        if formula_type == "BDP":
+            formulas.append((col, f'=BDP("{ticker}", "{field_name}")', None))
+        else:
+            formulas.append((col, f'=BDH("{ticker}", "{field_name}", "FY ', '")'))
+    return formulas
+
+
+def _write_ticker_row(worksheet, row: int, ticker: str, year: int, formulas: List[Tuple[int, str, Optional[str]]], requested: Optional[List[int]] = None) -> None:
+    worksheet.write_string(row, 0, f'{ticker} {year}')
+    # Write environmental + financial fields, only the requested ones if given
+    for col, start, end in (formulas if requested is None else [formulas[i] for i in requested]):
+        worksheet.write_formula(row, col, start if end is None else f'{start}{year}{end}')
+
 def generate_tables(tickers: List[str], years: List[int], verbose=False):
     os.makedirs(directory, exist_ok=True)
 
     for ticker in tickers:
         try:
             sanitized_ticker = ticker.replace("/", "-")
-            workbook = xlsxwriter.Workbook(f'{directory}/GHG_Emissions_{sanitized_ticker}.xlsx')
+            workbook = xlsxwriter.Workbook(f'{directory}/GHG_Emissions_{sanitized_ticker}.xlsx', {'constant_memory': True})
             worksheet = workbook.add_worksheet()
+            formulas = _field_formulas(ticker)
 
-            for i, year in enumerate(years):
-                row = i + 1  # Excel rows are 1-indexed
-                worksheet.write(f'A{row}', f'{ticker} {year}')
-                
-                # Write environmental + financial fields
-                for field in fields:
-                    field_name = field[0]
-                    col = field[1]
-                    formula_type = field[2] if len(field) == 3 else "BDH"
-                    if formula_type == "BDP":
-                        formula = f'=BDP("{ticker}", "{field_name}")'
-                    else:
-                        formula = f'=BDH("{ticker}", "{field_name}", "FY {year}")'
-                    worksheet.write(f'{col}{row}', formula)
+            for row, year in enumerate(years):
+                _write_ticker_row(worksheet, row, ticker, year, formulas)
 
                 # Offset to place financial institution data after existing fields
                 start_col_index = len(fields) + 1
@@ -100,28 +221,24 @@ def generate_tables(tickers: List[str], years: List[int], verbose=False):
             print(f'\nProcess failed for {ticker}! Error: {e}')
             traceback.print_exc()
 
-def generate_table(tickers: List[str], years: List[int], verbose=False, name='GHG_Emission'):
+def generate_table(tickers: List[str], years: List[int], verbose=False, name='GHG_Emission', missing: Optional[MissingRequests] = None):
+    """
+    Write one template workbook with a row per ticker and year. If missing is
+    given only its rows and fields are written.
+    """
     os.makedirs(directory, exist_ok=True)
-    workbook = xlsxwriter.Workbook(f'{directory}/{name}.xlsx')
+    # constant_memory flushes each row to disk once the next one is started,
+    # so rows have to be written in order
+    workbook = xlsxwriter.Workbook(f'{directory}/{name}.xlsx', {'constant_memory': True})
     worksheet = workbook.add_worksheet()
-    row = 1 # Excel rows are 1-indexed
+    row = 0
     for ticker in tickers:
         try:
-            for i, year in enumerate(years):
-                worksheet.write(f'A{row}', f'{ticker} {year}')
-                # Write environmental + financial fields
-                for field in fields:
-                    field_name = field[0]
-                    col = field[1]
-                    formula_type = field[2] if len(field) == 3 else "BDH"
-                    if formula_type == "BDP":
-                        formula = f'=BDP("{ticker}", "{field_name}")'
-                    else:
-                        formula = f'=BDH("{ticker}", "{field_name}", "FY {year}")'
-                    worksheet.write(f'{col}{row}', formula)
-
-                # Offset to place financial institution data after existing fields
-                start_col_index = len(fields) + 1
+            formulas = _field_formulas(ticker)
+            for year in years:
+                if missing is not None and (ticker, year) not in missing:
+                    continue
+                _write_ticker_row(worksheet, row, ticker, year, formulas, missing[(ticker, year)] if missing is not None else None)
                 row += 1
         except Exception as e:
             print(f'\nProcess failed for {ticker}! Error: {e}')
@@ -135,39 +252,26 @@ def generate_tables_with_fi(tickers: List[str], years: List[int], banks: List[st
     for ticker in tickers:
         try:
             sanitized_ticker = ticker.replace("/", "-")
-            workbook = xlsxwriter.Workbook(f'{directory}/GHG_Emissions_{sanitized_ticker}.xlsx')
+            workbook = xlsxwriter.Workbook(f'{directory}/GHG_Emissions_{sanitized_ticker}.xlsx', {'constant_memory': True})
             worksheet = workbook.add_worksheet()
+            formulas = _field_formulas(ticker)
 
-            for i, year in enumerate(years):
-                row = i + 1  # Excel rows are 1-indexed
-                worksheet.write(f'A{row}', f'{ticker} {year}')
-                
-                # Write environmental + financial fields
-                for field in fields:
-                    field_name = field[0]
-                    col = field[1]
-                    formula_type = field[2] if len(field) == 3 else "BDH"
-                    if formula_type == "BDP":
-                        formula = f'=BDP("{ticker}", "{field_name}")'
-                    else:
-                        formula = f'=BDH("{ticker}", "{field_name}", "FY {year}")'
-                    worksheet.write(f'{col}{row}', formula)
+            for row, year in enumerate(years):
+                _write_ticker_row(worksheet, row, ticker, year, formulas)
 
                 # Offset to place financial institution data after existing fields
                 start_col_index = len(fields) + 1
 
                 # Add Bank Loan/Bond exposure
                 for j, bank_ticker in enumerate(banks):
-                    col_letter = col_index_to_excel_col(start_col_index + j)
                     formula = f'=BDP("{bank_ticker} Equity", "BANK_LOAN_TO_{ticker}")'
-                    worksheet.write(f'{col_letter}{row}', formula)
+                    worksheet.write_formula(row, start_col_index + j, formula)
 
                 # Add Financial Institution Shareholding
                 fi_offset = start_col_index + len(banks)
                 for k, fi_ticker in enumerate(financial_institutions):
-                    col_letter = col_index_to_excel_col(fi_offset + k)
                     formula = f'=BDP("{fi_ticker} Equity", "HOLDINGS_VALUE_IN_{ticker}")'
-                    worksheet.write(f'{col_letter}{row}', formula)
+                    worksheet.write_formula(row, fi_offset + k, formula)
 
             print_cond(verbose, f'\nA new .xlsx file for {ticker} from {years[0]}–{years[-1]} has been successfully created.')
             workbook.close()
@@ -192,4 +296,8 @@ if __name__ == "__main__":
     # years = list(range(2023, 2017, -1))
     # generate_tables(tickers, years, True)
     # print("\nTask fully completed!!\n")
-    generate_tables_alphabetical(FOSSIL_FUEL_TICKERS, YEARS_OF_INTEREST, True)
\ No newline at end of file
+    if "--delta" in sys.argv:
+        # Only what the extracts in data/input_data/Bloomberg are still missing
+        generate_delta_tables_alphabetical(get_fossil_fuel_tickers(), YEARS_OF_INTEREST, True, os.cpu_count() or 1)
+    else:
+        generate_tables_alphabetical(get_fossil_fuel_tickers(), YEARS_OF_INTEREST, True, os.cpu_count() or 1)
\ No newline at end of file
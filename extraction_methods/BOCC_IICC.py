@@ -1,11 +1,23 @@
 import os
-from typing import Any
-from utilities.helper_functions import safe_to_float
+from typing import Any, Dict
+from utilities.helper_functions import safe_to_float, lowercase_substrings, parse_float_rows
+from utilities import instrumentation
 import csv
+import numpy as np
 
 DIR_loan_data = "./data/input_data/BOCC Big 5"
 DIR_share_data = "./data/input_data/IICC"
 
+# Both datasets are a single 2022 snapshot, every other year is 0
+BOCC_IICC_YEAR = 2022
+
+# lowercase Bloomberg code (BOCC) or company name (IICC) -> total for that key
+BOCCIICCIndex = Dict[str, float]
+
+# Global caches, one index per financial institution
+_BOCC_indexes: Dict[str, BOCCIICCIndex] = {}
+_IICC_indexes: Dict[str, BOCCIICCIndex] = {}
+
 
 def get_BOCC_loan(ticker: str, company_name: str, bank: str, year: int) -> float:
     path_to_csv = os.path.join(DIR_loan_data, bank+".csv")
@@ -26,3 +38,83 @@ def get_IICC_share(ticker: str, company_name: str, fi: str, year: int) -> float:
             return sum(safe_to_float(row[3], 0) * safe_to_float(row[1], 0) for row in reader if row[0] != '' and row[0].lower() in company_name.lower() and year==2022)
     except FileNotFoundError:
         return 0
+
+def _read_rows(path_to_csv: str) -> Any:
+    with open(path_to_csv, mode='r', newline='') as source_file:
+        reader : Any = csv.reader(source_file)
+        return [row for row in reader if row and any(cell.strip() for cell in row)]
+
+def build_BOCC_index(bank: str) -> BOCCIICCIndex:
+    """
+    Read a bank's BOCC loans once, summing the 2022 loan amount of each
+    lowercase Bloomberg code. Loans without a code are kept under "", which
+    like in get_BOCC_loan matches every ticker.
+    """
+    index : BOCCIICCIndex = {}
+    instrumentation.count("bocc.files_opened")
+    try:
+        with instrumentation.stage("bocc.parse"):
+            rows = [row for row in _read_rows(os.path.join(DIR_loan_data, bank+".csv")) if row[2] != '']
+            for row, loan in zip(rows, np.nan_to_num(parse_float_rows(rows, [2])[:, 0]).tolist()):
+                code = row[1].lower()
+                index[code] = index.get(code, 0) + loan
+    except FileNotFoundError:
+        pass
+    return index
+
+def build_IICC_index(fi: str) -> BOCCIICCIndex:
+    """Read an institution's IICC holdings once, summing shareholding * closing price of each lowercase company name."""
+    index : BOCCIICCIndex = {}
+    instrumentation.count("iicc.files_opened")
+    try:
+        with instrumentation.stage("iicc.parse"):
+            rows = [row for row in _read_rows(os.path.join(DIR_share_data, fi+".csv")) if row[0] != '']
+            # Closing price and shareholding columns
+            values = np.nan_to_num(parse_float_rows(rows, [3, 1]))
+            for row, value in zip(rows, (values[:, 0] * values[:, 1]).tolist()):
+                name = row[0].lower()
+                index[name] = index.get(name, 0) + value
+    except FileNotFoundError:
+        pass
+    return index
+
+def get_BOCC_index(bank: str) -> BOCCIICCIndex:
+    if bank not in _BOCC_indexes:
+        _BOCC_indexes[bank] = build_BOCC_index(bank)
+    return _BOCC_indexes[bank]
+
+def get_IICC_index(fi: str) -> BOCCIICCIndex:
+    if fi not in _IICC_indexes:
+        _IICC_indexes[fi] = build_IICC_index(fi)
+    return _IICC_indexes[fi]
+
+def _matching_total(index: BOCCIICCIndex, value: str) -> float:
+    """
+    Total of the keys of index contained in value, the set intersection only
+    walks the smaller side. The empty key is contained in every value.
+    """
+    if not index:
+        return 0
+    return sum(index[key] for key in index.keys() & lowercase_substrings(value)) + index.get("", 0)
+
+def get_BOCC_loan_from_index(ticker: str, company_name: str, bank: str, year: int) -> float:
+    """
+    Same matching rule as get_BOCC_loan (Bloomberg code contained in the
+    ticker), without reading the file again. Years other than 2022 return 0
+    before anything is looked up.
+    """
+    if year != BOCC_IICC_YEAR:
+        return 0
+    instrumentation.count("bocc.lookups")
+    return _matching_total(get_BOCC_index(bank), ticker)
+
+def get_IICC_share_from_index(ticker: str, company_name: str, fi: str, year: int) -> float:
+    """
+    Same matching rule as get_IICC_share (company name contained in
+    company_name), without reading the file again. Years other than 2022
+    return 0 before anything is looked up.
+    """
+    if year != BOCC_IICC_YEAR:
+        return 0
+    instrumentation.count("iicc.lookups")
+    return _matching_total(get_IICC_index(fi), company_name)
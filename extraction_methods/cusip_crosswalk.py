@@ -0,0 +1,194 @@
+import os
+import re
+import csv
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from utilities.helper_functions import parse_float_rows
+from utilities.ticker_resolution import SUFFIX_TO_BLOOMBERG, TickerResolver, split_symbol
+from utilities import instrumentation
+from extraction_methods.extract_13F_data import DIR_13F, DirectoryNode, HoldingsTable, _share_value_from_node, index_directory
+from extraction_methods.extract_bloomberg_data import get_company_names, parse_row_key
+
+# CUSIP -> Bloomberg ticker of the security, built once from the CUSIP and Sym
+# columns of every 13F file. Holdings are then attributed by a hash join on
+# the CUSIP, so "E" or "A" no longer match every ticker containing the letter
+# the way the symbol root substring test of extract_13F_data does.
+Crosswalk = Dict[str, str]
+
+# A 13F file as CUSIP -> (symbol, issuer name, value in dollars)
+CusipTable = Dict[str, Tuple[str, str, float]]
+
+# Words left out when comparing a 13F issuer name with a Bloomberg NAME
+LEGAL_WORDS = {"INC", "CORP", "CORPORATION", "CO", "COMPANY", "LTD", "LIMITED", "PLC", "NEW", "ADR", "ADS", "SPONSORED", "SPON", "SPONS", "THE"}
+
+# Global caches, filled lazily and kept for the lifetime of the process
+_cusip_tables: Dict[str, CusipTable] = {}
+_ticker_tables: Dict[str, HoldingsTable] = {}
+_ticker_index: Dict[Tuple[str, int], DirectoryNode] = {}
+_crosswalk: Optional[Crosswalk] = None
+_ticker_cusips: Optional[Dict[str, List[str]]] = None
+
+
+def read_cusip_table(path_to_csv: str) -> CusipTable:
+    """Parse a 13F csv once into CUSIP -> (symbol, issuer name, value in dollars)."""
+    if path_to_csv in _cusip_tables:
+        return _cusip_tables[path_to_csv]
+    table : CusipTable = {}
+    instrumentation.count("crosswalk.files_opened")
+    with instrumentation.stage("crosswalk.parse"), open(path_to_csv, mode='r', newline='') as source_file:
+        reader : Any = csv.reader(source_file)
+        next(reader, None) # skip header
+        rows = [row for row in reader if len(row) > 4 and row[0] != '']
+        values = np.nan_to_num(parse_float_rows(rows, [4])[:, 0]) * 1000
+        for row, value in zip(rows, values.tolist()):
+            # Rows without a CUSIP fall back to their symbol
+            cusip = row[3].strip() or f"Sym:{row[0]}"
+            symbol, issuer, total = table.get(cusip, (row[0], row[1], 0))
+            table[cusip] = (symbol, issuer, total + value)
+    _cusip_tables[path_to_csv] = table
+    return table
+
+
+def _name_words(name: str) -> List[str]:
+    return [word for word in re.split(r"[^A-Z0-9]+", name.upper()) if word and word not in LEGAL_WORDS]
+
+
+def same_issuer(issuer: str, name: str) -> bool:
+    """
+    True if a 13F issuer name and a Bloomberg NAME are the same company
+    ("BHP GROUP LIMITED" and "BHP GROUP LTD"): once the legal words are left
+    out, one is the start of the other. Both sources cut long names short, so
+    the last word compared only has to be the start of the other one.
+    """
+    issuer_words, name_words = _name_words(issuer), _name_words(name)
+    length = min(len(issuer_words), len(name_words))
+    if length == 0:
+        return False
+    for i in range(length):
+        a, b = issuer_words[i], name_words[i]
+        if a != b and not (length > 1 and i == length - 1 and (a.startswith(b) or b.startswith(a))):
+            return False
+    return True
+
+
+def resolve_13F_symbol(resolver: TickerResolver, symbol: str, issuer: str = "", names: Optional[Dict[str, str]] = None) -> Optional[str]:
+    """
+    Bloomberg ticker of a 13F symbol with exactly the same root. A suffix is
+    either an exchange ("SU.TO") or a share class ("BRK.B", Bloomberg's
+    "BRK/B"), and London tickers of one or two letters end in "/" ("BP/").
+
+    The listing has to be on the exchange of the suffix (US without one):
+    "ADX" is Adams Diversified Equity Fund, not ADX Energy of "ADX AU". A
+    listing on another exchange is only taken if its Bloomberg NAME (names)
+    is the 13F issuer, e.g. the "BP" ADR for "BP/ LN". The Bloomberg extracts
+    have no CUSIP or ISIN to check the issuer with, and an issuer renamed
+    since (TransCanada, now TC Energy) is not matched.
+    """
+    root, suffix = split_symbol(symbol.strip().upper())
+    root = root.replace("-", "/")
+    candidates = []
+    if suffix not in SUFFIX_TO_BLOOMBERG:
+        candidates.append(f"{root}/{suffix}")
+        suffix = ""
+    exchange_suffix = f".{suffix}" if suffix else ""
+    candidates += [root + exchange_suffix, root + "/" + exchange_suffix]
+    for candidate in candidates:
+        ticker = resolver.resolve(candidate, strict=True)
+        if ticker is not None:
+            return ticker
+    if names:
+        for candidate in candidates:
+            ticker = resolver.resolve(candidate)
+            if ticker is not None and same_issuer(issuer, names.get(ticker, "")):
+                return ticker
+    return None
+
+
+def _csv_paths(directory: str) -> List[str]:
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, file) for file in files if file.lower().endswith(".csv"))
+    return sorted(paths)
+
+
+def build_crosswalk(tickers: List[str], directory: str = DIR_13F, names: Optional[Dict[str, str]] = None) -> Crosswalk:
+    """
+    Map every CUSIP in the 13F files under directory to the Bloomberg ticker
+    in tickers its symbol resolves to, names being the Bloomberg NAME of the
+    tickers (see resolve_13F_symbol). A CUSIP filed under several symbols
+    (after a rename) takes the first one that resolves.
+    """
+    resolver = TickerResolver(tickers)
+    crosswalk : Crosswalk = {}
+    seen = set()
+    for path in _csv_paths(directory):
+        for cusip, (symbol, issuer, _) in read_cusip_table(path).items():
+            if cusip in crosswalk or (cusip, symbol) in seen:
+                continue
+            seen.add((cusip, symbol))
+            ticker = resolve_13F_symbol(resolver, symbol, issuer, names)
+            if ticker is not None:
+                crosswalk[cusip] = ticker
+    return crosswalk
+
+
+def get_crosswalk() -> Crosswalk:
+    global _crosswalk
+    if _crosswalk is None:
+        # Imported here, global_values imports this module
+        from global_values import get_fossil_fuel_tickers
+        _crosswalk = build_crosswalk(get_fossil_fuel_tickers(), names=get_company_names())
+    return _crosswalk
+
+
+def ticker_cusips(ticker: str) -> List[str]:
+    """The CUSIPs the crosswalk maps to a Bloomberg ticker, sorted."""
+    global _ticker_cusips
+    if _ticker_cusips is None:
+        _ticker_cusips = {}
+        for cusip, crosswalk_ticker in sorted(get_crosswalk().items()):
+            _ticker_cusips.setdefault(crosswalk_ticker, []).append(cusip)
+    return _ticker_cusips.get(ticker, [])
+
+
+def read_ticker_table(path_to_csv: str) -> HoldingsTable:
+    """
+    A 13F file joined with the crosswalk: Bloomberg ticker -> value in dollars,
+    one pass over the file's holdings.
+    """
+    if path_to_csv not in _ticker_tables:
+        crosswalk = get_crosswalk()
+        table : HoldingsTable = {}
+        for cusip, (_, _, value) in read_cusip_table(path_to_csv).items():
+            ticker = crosswalk.get(cusip)
+            if ticker is not None:
+                table[ticker] = table.get(ticker, 0) + value
+        _ticker_tables[path_to_csv] = table
+    return _ticker_tables[path_to_csv]
+
+
+def get_ticker_index(financial_institution_name: str, year: int) -> DirectoryNode:
+    key = (financial_institution_name, year)
+    if key not in _ticker_index:
+        company_directory = os.path.join(DIR_13F, financial_institution_name)
+        _ticker_index[key] = index_directory(company_directory, year, read_ticker_table) if os.path.isdir(company_directory) else []
+    return _ticker_index[key]
+
+
+def get_share_value_from_crosswalk(company_ticker: str, financial_institution_name: str, year: int, aggregation_method = sum) -> float:
+    """
+    Value a financial institution held in company_ticker ("XOM US Equity" or
+    "XOM US Equity 2022") in year, counting only the holdings whose CUSIP maps
+    to that ticker. Files are aggregated like get_share_value_from_index.
+    """
+    instrumentation.count("crosswalk.lookups")
+    key = parse_row_key(company_ticker)
+    ticker = key[0] if key is not None else company_ticker.strip()
+    return _share_value_from_node({ticker}, get_ticker_index(financial_institution_name, year), aggregation_method)
+
+
+if __name__ == "__main__":
+    from extraction_methods.extract_13F_data import get_share_value_from_index
+    for ticker in ["XOM US Equity", "SU CN Equity", "ENB CN Equity", "CNQ CN Equity", "BP/ LN Equity"]:
+        for bank in ["RBC", "TD", "BMO"]:
+            print(ticker, bank, get_share_value_from_crosswalk(ticker, bank, 2022, max), get_share_value_from_index(ticker, bank, 2022, max))
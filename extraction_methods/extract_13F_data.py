@@ -1,11 +1,47 @@
 import os
+import re
 import csv
-from utilities.helper_functions import safe_to_float
-from typing import Any
+import numpy as np
+from utilities.helper_functions import safe_to_float, all_substrings, parse_float_rows
+from utilities import instrumentation
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
 
 DIR_13F = './data/input_data/13f_data'
 
+# (year, quarter), e.g. (2022, 4) for a "Q4 2022" filing
+Quarter = Tuple[int, int]
+
+QUARTER_PATTERN = re.compile(r'\bQ([1-4])\s+(\d{4})\b')
+
+# A holdings table maps the symbol root of a 13F row (the part of "Sym" before
+# the first '.') to the total value in dollars held under that root. A
+# directory node mirrors the on-disk layout so the aggregation rules of
+# get_share_value_from_directory can be replayed without touching the files.
+HoldingsTable = Dict[str, float]
+DirectoryNode = List[Union[HoldingsTable, "DirectoryNode"]]
+
+# Global caches, filled lazily and kept for the lifetime of the process
+_holdings_tables: Dict[str, HoldingsTable] = {}
+_holdings_index: Dict[Tuple[str, int], DirectoryNode] = {}
+
+def parse_quarter(filename: str) -> Optional[Quarter]:
+    """Period of a 13F file from its name ("... Q3 2021 13F ..." -> (2021, 3)), None if it has none."""
+    match = QUARTER_PATTERN.search(filename)
+    if match is None:
+        return None
+    return int(match.group(2)), int(match.group(1))
+
+def is_year_end_filing(filename: str, year: int) -> bool:
+    """
+    Whether a 13F file holds the year's holdings: the Q4 filing of year, or
+    any file with year in its name if it has no quarter in it.
+    """
+    quarter = parse_quarter(filename)
+    if quarter is None:
+        return str(year) in filename
+    return quarter == (year, 4)
+
 def get_share_value_from_13F(company_ticker : str , financial_institution_name : str, year : int, aggregation_method = sum) -> float:
 
     company_directory = os.path.join(DIR_13F, financial_institution_name)
@@ -15,7 +51,7 @@ def get_share_value_from_directory(company_ticker: str, directory: str, year: in
     aggregated_so_far = 0
     for filename in os.listdir(directory):  
         filepath = os.path.join(directory, filename)
-        if os.path.isfile(filepath) and str(year) in filename:
+        if os.path.isfile(filepath) and is_year_end_filing(filename, year):
             aggregated_so_far = aggregation_method((get_share_value_from_management_csv(company_ticker, filepath), aggregated_so_far))
         elif os.path.isdir(filepath):
             aggregated_so_far = aggregation_method((get_share_value_from_directory(company_ticker, filepath, year), aggregated_so_far))
@@ -24,11 +60,86 @@ def get_share_value_from_directory(company_ticker: str, directory: str, year: in
 
 
 def get_share_value_from_management_csv(company_ticker: str, path_to_csv: str) -> float:
+    instrumentation.count("13f.files_opened")
     with open(path_to_csv, mode='r', newline='') as source_file:
         reader : Any = csv.reader(source_file)
         reader = (row for row in reader if row and any(cell.strip() for cell in row))
         return sum(safe_to_float(row[4], 0) for row in reader if row[0] != '' and row[0].split('.')[0] in company_ticker) * 1000
 
+def read_holdings_table(path_to_csv: str) -> HoldingsTable:
+    """
+    Parse a 13F csv once into a table of symbol root -> value in dollars.
+    Parsed tables are cached by path so each file is read at most once per run.
+    """
+    if path_to_csv in _holdings_tables:
+        instrumentation.count("13f.table_cache_hits")
+        return _holdings_tables[path_to_csv]
+    table : HoldingsTable = {}
+    instrumentation.count("13f.files_opened")
+    with instrumentation.stage("13f.parse"), open(path_to_csv, mode='r', newline='') as source_file:
+        reader : Any = csv.reader(source_file)
+        rows = [row for row in reader if row and any(cell.strip() for cell in row)]
+        instrumentation.count("13f.rows_parsed", len(rows))
+        rows = [row for row in rows if row[0] != '']
+        # The value column of the whole file in one go
+        values = np.nan_to_num(parse_float_rows(rows, [4])[:, 0]) * 1000
+        for row, value in zip(rows, values.tolist()):
+            root = row[0].split('.')[0]
+            table[root] = table.get(root, 0) + value
+    _holdings_tables[path_to_csv] = table
+    return table
+
+def index_directory(directory: str, year: int, read_table: Callable[[str], HoldingsTable] = read_holdings_table) -> DirectoryNode:
+    """
+    Build the holdings tree for one year of a 13F directory, following the
+    same file selection as get_share_value_from_directory. read_table turns
+    a file into a table (symbol roots by default).
+    """
+    node : DirectoryNode = []
+    instrumentation.count("13f.directories_listed")
+    for filename in os.listdir(directory):
+        filepath = os.path.join(directory, filename)
+        if os.path.isfile(filepath) and is_year_end_filing(filename, year):
+            node.append(read_table(filepath))
+        elif os.path.isdir(filepath):
+            node.append(index_directory(filepath, year, read_table))
+    return node
+
+def get_holdings_index(financial_institution_name: str, year: int) -> DirectoryNode:
+    key = (financial_institution_name, year)
+    if key in _holdings_index:
+        instrumentation.count("13f.index_cache_hits")
+    else:
+        company_directory = os.path.join(DIR_13F, financial_institution_name)
+        # git does not keep empty directories, so a missing one means no 13F filings
+        _holdings_index[key] = index_directory(company_directory, year) if os.path.isdir(company_directory) else []
+    return _holdings_index[key]
+
+def symbol_roots_in(company_ticker: str) -> Set[str]:
+    """
+    Every symbol root r with `r in company_ticker`, i.e. all substrings of the
+    ticker including the empty one.
+    """
+    return all_substrings(company_ticker) | {''}
+
+def _share_value_from_node(roots: Set[str], node: DirectoryNode, aggregation_method = sum) -> float:
+    aggregated_so_far = 0
+    for child in node:
+        if isinstance(child, dict):
+            value = sum(child[root] for root in roots if root in child)
+            aggregated_so_far = aggregation_method((value, aggregated_so_far))
+        else:
+            aggregated_so_far = aggregation_method((_share_value_from_node(roots, child), aggregated_so_far))
+    return aggregated_so_far
+
+def get_share_value_from_index(company_ticker : str , financial_institution_name : str, year : int, aggregation_method = sum) -> float:
+    """
+    Same result as get_share_value_from_13F, but served from the in-memory
+    holdings index so each 13F file is parsed only once per run.
+    """
+    instrumentation.count("13f.lookups")
+    return _share_value_from_node(symbol_roots_in(company_ticker), get_holdings_index(financial_institution_name, year), aggregation_method)
+
 
 if __name__ == "__main__":
     banks = ["RBC", "CIBC", "TD", "BMO", "Scotiabank"]
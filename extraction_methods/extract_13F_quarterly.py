@@ -0,0 +1,182 @@
+import os
+import csv
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from utilities.helper_functions import parse_float_rows
+from utilities import instrumentation
+from extraction_methods.extract_13F_data import DIR_13F, Quarter, parse_quarter, symbol_roots_in
+
+
+def quarter_ordinal(quarter: Quarter) -> int:
+    return quarter[0] * 4 + quarter[1] - 1
+
+
+def ordinal_quarter(ordinal: int) -> Quarter:
+    return ordinal // 4, ordinal % 4 + 1
+
+
+class QuarterlyHoldings:
+    """
+    Every 13F filing of one financial institution, all quarters, as columns:
+    one row per (quarter, filer, security) with the value in dollars and the
+    number of shares. A filer is the directory (relative to the institution's
+    folder) the file is in, so subsidiaries filing separately stay apart.
+    A security is a (CUSIP, symbol) pair: tickers match on the symbol as
+    before, CUSIPs match across symbol changes. Rows are sorted by quarter so
+    a period is a contiguous slice.
+
+    Several files of one filer for the same quarter are summed, as parts of
+    one filing. The yearly lookups of extract_13F_data keep their original
+    rule, the max over the files directly in the institution's folder (files
+    in subfolders are summed there too), so the two only differ if that
+    folder holds more than one file for a quarter, which no 13f.info download
+    does.
+    """
+    def __init__(self, financial_institution: str, directory: str):
+        self.financial_institution = financial_institution
+        self.filers : List[str] = []
+        self.securities : List[Tuple[str, str]] = []
+        filer_ids : Dict[str, int] = {}
+        security_ids : Dict[Tuple[str, str], int] = {}
+        quarter_column, filer_column, security_column, value_column, shares_column = [], [], [], [], []
+        # (quarter ordinal, filer) of every file, a quarter with a filing but no position holds 0
+        self.filings : Set[Tuple[int, int]] = set()
+
+        for root, _, files in os.walk(directory) if os.path.isdir(directory) else []:
+            for filename in sorted(files):
+                quarter = parse_quarter(filename)
+                if quarter is None or not filename.lower().endswith(".csv"):
+                    continue
+                filer = os.path.relpath(root, directory)
+                filer_id = filer_ids.setdefault(filer, len(filer_ids))
+                if filer_id == len(self.filers):
+                    self.filers.append(filer)
+                self.filings.add((quarter_ordinal(quarter), filer_id))
+                instrumentation.count("13f_quarterly.files_opened")
+                with instrumentation.stage("13f_quarterly.parse"), open(os.path.join(root, filename), mode='r', newline='') as source_file:
+                    reader = csv.reader(source_file)
+                    next(reader, None) # skip header
+                    rows = [row for row in reader if len(row) >= 7 and row[0] != '']
+                    for row in rows:
+                        security = (row[3], row[0])
+                        security_id = security_ids.setdefault(security, len(security_ids))
+                        if security_id == len(self.securities):
+                            self.securities.append(security)
+                        security_column.append(security_id)
+                    quarter_column.extend([quarter_ordinal(quarter)] * len(rows))
+                    filer_column.extend([filer_id] * len(rows))
+                    # Value and shares columns of the whole file in one go
+                    values = np.nan_to_num(parse_float_rows(rows, [4, 6]))
+                    value_column.append(values[:, 0] * 1000)
+                    shares_column.append(values[:, 1])
+
+        order = np.lexsort((np.array(security_column, dtype=np.int32), np.array(quarter_column, dtype=np.int32)))
+        self.quarter = np.array(quarter_column, dtype=np.int32)[order]
+        self.filer = np.array(filer_column, dtype=np.int16)[order]
+        self.security = np.array(security_column, dtype=np.int32)[order]
+        self.value = np.concatenate(value_column or [np.empty(0)])[order]
+        self.shares = np.concatenate(shares_column or [np.empty(0)])[order]
+
+        # symbol root -> securities, for the ticker matching of extract_13F_data
+        self.by_root : Dict[str, List[int]] = {}
+        self.by_cusip : Dict[str, List[int]] = {}
+        for security_id, (cusip, symbol) in enumerate(self.securities):
+            self.by_root.setdefault(symbol.split('.')[0], []).append(security_id)
+            self.by_cusip.setdefault(cusip, []).append(security_id)
+
+    def quarters(self) -> List[Quarter]:
+        return [ordinal_quarter(ordinal) for ordinal in sorted({ordinal for ordinal, _ in self.filings})]
+
+    def match_ticker(self, company_ticker: str) -> np.ndarray:
+        """Securities whose symbol root is in company_ticker, like get_share_value_from_13F."""
+        matched = [security_id for root in symbol_roots_in(company_ticker) for security_id in self.by_root.get(root, [])]
+        return np.array(sorted(matched), dtype=np.int32)
+
+    def match_cusip(self, cusip: str) -> np.ndarray:
+        return np.array(self.by_cusip.get(cusip, []), dtype=np.int32)
+
+    def holding(self, securities: np.ndarray, quarter: Quarter, aggregation_method: Callable[[Iterable[float]], float] = max) -> Optional[Tuple[float, float]]:
+        """
+        (value, shares) of the securities at the end of quarter: summed within
+        each filer, then aggregated across filers. None if the institution
+        did not file for that quarter.
+        """
+        ordinal = quarter_ordinal(quarter)
+        filers = [filer for filing_ordinal, filer in self.filings if filing_ordinal == ordinal]
+        if not filers:
+            return None
+        start, end = np.searchsorted(self.quarter, [ordinal, ordinal + 1])
+        rows = slice(start, end)
+        matched = np.isin(self.security[rows], securities)
+        filer_column = self.filer[rows][matched]
+        values = np.bincount(filer_column, weights=self.value[rows][matched], minlength=len(self.filers))
+        shares = np.bincount(filer_column, weights=self.shares[rows][matched], minlength=len(self.filers))
+        # Aggregate both on the filer chosen for the value, so shares stay consistent with it
+        value = aggregation_method(float(values[filer]) for filer in filers)
+        if aggregation_method is max:
+            best = max(filers, key=lambda filer: values[filer])
+            return value, float(shares[best])
+        return value, aggregation_method(float(shares[filer]) for filer in filers)
+
+
+# Global cache, one store per financial institution
+_quarterly_holdings: Dict[str, QuarterlyHoldings] = {}
+
+
+def get_quarterly_holdings(financial_institution: str) -> QuarterlyHoldings:
+    if financial_institution not in _quarterly_holdings:
+        _quarterly_holdings[financial_institution] = QuarterlyHoldings(financial_institution, os.path.join(DIR_13F, financial_institution))
+    return _quarterly_holdings[financial_institution]
+
+
+def _securities(holdings: QuarterlyHoldings, company_ticker: Optional[str], cusip: Optional[str]) -> np.ndarray:
+    if cusip is not None:
+        return holdings.match_cusip(cusip)
+    if company_ticker is None:
+        raise ValueError("Give either a company ticker or a CUSIP")
+    return holdings.match_ticker(company_ticker)
+
+
+def get_holding_at(financial_institution: str, quarter: Quarter, company_ticker: Optional[str] = None, cusip: Optional[str] = None, aggregation_method = max) -> Optional[Tuple[float, float]]:
+    """
+    Point-in-time (value in dollars, shares) a financial institution held in a
+    company at the end of quarter, None if it did not file for that quarter.
+    The company is a Bloomberg ticker (matched like get_share_value_from_13F)
+    or a CUSIP.
+    """
+    holdings = get_quarterly_holdings(financial_institution)
+    return holdings.holding(_securities(holdings, company_ticker, cusip), quarter, aggregation_method)
+
+
+def get_period_average(financial_institution: str, start: Quarter, end: Quarter, company_ticker: Optional[str] = None, cusip: Optional[str] = None, aggregation_method = max) -> Optional[Tuple[float, float]]:
+    """
+    Average (value in dollars, shares) over the quarters from start to end
+    inclusive that the institution filed for. Quarters with a filing but no
+    position count as 0, quarters without a filing are left out. None if
+    there is no filing in the period.
+    """
+    holdings = get_quarterly_holdings(financial_institution)
+    securities = _securities(holdings, company_ticker, cusip)
+    points = [holdings.holding(securities, ordinal_quarter(ordinal), aggregation_method) for ordinal in range(quarter_ordinal(start), quarter_ordinal(end) + 1)]
+    points = [point for point in points if point is not None]
+    if not points:
+        return None
+    return sum(value for value, _ in points) / len(points), sum(shares for _, shares in points) / len(points)
+
+
+if __name__ == "__main__":
+    from extraction_methods.extract_13F_data import get_share_value_from_index
+    from global_values import FINANCIAL_INSTITUTIONS
+    # Q4 holdings match the yearly values data_processing uses
+    mismatches = 0
+    for fi in FINANCIAL_INSTITUTIONS:
+        for year in range(2018, 2025):
+            for ticker in ["XOM US Equity 2022", "SU CN Equity 2022", "CNQ CN Equity 2022", "ENB CN Equity 2022", "META US Equity 2022", "BRK/B US Equity 2022"]:
+                holding = get_holding_at(fi, (year, 4), ticker)
+                expected = get_share_value_from_index(ticker, fi, year, max)
+                if (holding[0] if holding is not None else 0) != expected:
+                    mismatches += 1
+    print(f"{mismatches} mismatches against get_share_value_from_index")
+    print("RBC quarters:", get_quarterly_holdings("RBC").quarters())
+    print("RBC in XOM at Q4 2022:", get_holding_at("RBC", (2022, 4), "XOM US Equity"))
+    print("RBC in XOM 2018-2024 average:", get_period_average("RBC", (2018, 1), (2024, 4), "XOM US Equity"))
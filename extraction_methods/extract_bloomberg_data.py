@@ -0,0 +1,116 @@
+import os
+import csv
+from typing import Dict, Iterable, List, Optional, Tuple
+from utilities import instrumentation
+from utilities.ticker_resolution import TickerResolver
+
+DIR_bloomberg = "./data/input_data/Bloomberg"
+
+# (bloomberg ticker, year) -> raw row of the Bloomberg extract
+BloombergStore = Dict[Tuple[str, int], List[str]]
+
+# Values the terminal leaves in a cell when it could not answer the request
+# this time, the field has to be pulled again. "#N/A N/A" (no data) and
+# "#N/A Invalid Security" are final answers.
+UNPULLED_VALUES = ("", "#N/A Daily Capacity", "#N/A Requesting Data...", "#N/A Connection", "#N/A Limit", "#NAME?")
+
+# Global cache, one store per extract directory
+_bloomberg_stores: Dict[str, BloombergStore] = {}
+
+
+def parse_row_key(cell: str) -> Optional[Tuple[str, int]]:
+    """
+    Split the first cell of an extract row ("XOM US Equity 2021") into its
+    ticker and year, return None if the cell does not end with a year.
+    """
+    ticker, _, year = cell.strip().rpartition(" ")
+    if not ticker or not year.isdigit():
+        return None
+    return ticker, int(year)
+
+
+def is_pulled(cell: str) -> bool:
+    return cell.strip() not in UNPULLED_VALUES
+
+
+def load_bloomberg_store(directory: str = DIR_bloomberg) -> BloombergStore:
+    """
+    Read every GHG_emissions_*.csv extract in directory once and key each row
+    by (ticker, year). If a key appears in several files the first one in
+    filename order wins, except for cells it has not pulled which are taken
+    from the later files (e.g. extracts of datagen's delta templates).
+    """
+    store : BloombergStore = {}
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith("GHG_emissions_") and filename.endswith(".csv")):
+            continue
+        instrumentation.count("bloomberg.files_opened")
+        # utf-8-sig drops the byte order mark Excel puts in front of the first ticker
+        with instrumentation.stage("bloomberg.parse"), open(os.path.join(directory, filename), mode='r', newline='', encoding='utf-8-sig') as source_file:
+            for line in csv.reader(source_file):
+                if not line:
+                    continue
+                instrumentation.count("bloomberg.rows_parsed")
+                key = parse_row_key(line[0])
+                if key is None:
+                    continue
+                if key not in store:
+                    store[key] = line
+                    continue
+                row = store[key]
+                for i in range(1, len(line)):
+                    if i >= len(row):
+                        row.append(line[i])
+                    elif not is_pulled(row[i]) and is_pulled(line[i]):
+                        row[i] = line[i]
+    return store
+
+
+def get_bloomberg_store(directory: str = DIR_bloomberg) -> BloombergStore:
+    if directory not in _bloomberg_stores:
+        _bloomberg_stores[directory] = load_bloomberg_store(directory)
+    return _bloomberg_stores[directory]
+
+
+def get_company_names(directory: str = DIR_bloomberg) -> Dict[str, str]:
+    """Bloomberg ticker -> NAME field of its extract rows."""
+    names : Dict[str, str] = {}
+    for (ticker, _), row in get_bloomberg_store(directory).items():
+        if len(row) > 23 and is_pulled(row[23]) and not row[23].startswith("#N/A"):
+            names.setdefault(ticker, row[23])
+    return names
+
+
+def resolve_universe(tickers: Iterable[str], directory: str = DIR_bloomberg) -> Tuple[List[str], List[str]]:
+    """
+    The Bloomberg tickers of the store for a ticker universe, in order and
+    without duplicates, and the universe tickers that have none. Bloomberg
+    tickers ("XOM US Equity") are taken as they are, bare or Yahoo symbols
+    ("XOM", "SU.TO") are resolved to a listing of the same root symbol.
+    """
+    store_tickers = {ticker for ticker, _ in get_bloomberg_store(directory)}
+    resolver = None
+    resolved : Dict[str, None] = {}
+    unmatched : List[str] = []
+    for ticker in tickers:
+        if ticker in store_tickers:
+            resolved[ticker] = None
+            continue
+        if " " not in ticker.strip():
+            resolver = resolver or TickerResolver(store_tickers)
+            bloomberg_ticker = resolver.resolve(ticker.strip())
+            if bloomberg_ticker is not None:
+                resolved[bloomberg_ticker] = None
+                continue
+        unmatched.append(ticker)
+    return list(resolved), unmatched
+
+
+def get_bloomberg_row(ticker: str, year: int, directory: str = DIR_bloomberg) -> Optional[List[str]]:
+    return get_bloomberg_store(directory).get((ticker, year))
+
+
+if __name__ == "__main__":
+    store = get_bloomberg_store()
+    print(f"Loaded {len(store)} company-years from {DIR_bloomberg}")
+    print(get_bloomberg_row("XOM US Equity", 2022))
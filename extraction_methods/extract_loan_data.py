@@ -1,13 +1,25 @@
 import os
-from typing import Any
-from utilities.helper_functions import safe_to_float
+import re
+from typing import Any, Dict
+from utilities.helper_functions import safe_to_float, lowercase_substrings, parse_float_rows
+from utilities import instrumentation
 import csv
+import numpy as np
 
 DIR_loan_data = "./data/input_data/Loan Data"
 
+# year -> lowercase issuer name -> total league credit for that year
+LoanIndex = Dict[int, Dict[str, float]]
+
+# Global cache, one index per bank
+_loan_indexes: Dict[str, LoanIndex] = {}
+
+YEAR_PATTERN = re.compile(r'(?<!\d)\d{4}(?!\d)')
+
 
 def get_loan_value(company_name: str, bank: str, year: int) -> float:
     path_to_csv = os.path.join(DIR_loan_data, bank+".csv")
+    instrumentation.count("loans.files_opened")
     try:
         with open(path_to_csv, mode='r', newline='') as source_file:
             reader : Any = csv.reader(source_file)
@@ -16,5 +28,48 @@ def get_loan_value(company_name: str, bank: str, year: int) -> float:
     except FileNotFoundError:
         return 0
 
+def build_loan_index(bank: str) -> LoanIndex:
+    """
+    Read a bank's loan league table once, grouping the league credit of each
+    deal by the year of its effective date and its lowercase issuer name.
+    """
+    index : LoanIndex = {}
+    path_to_csv = os.path.join(DIR_loan_data, bank+".csv")
+    instrumentation.count("loans.files_opened")
+    try:
+        with instrumentation.stage("loans.parse"), open(path_to_csv, mode='r', newline='') as source_file:
+            reader : Any = csv.reader(source_file)
+            rows = [row for row in reader if row and any(cell.strip() for cell in row)]
+            instrumentation.count("loans.rows_parsed", len(rows))
+            rows = [row for row in rows if row[2] != '']
+            values = np.nan_to_num(parse_float_rows(rows, [4])[:, 0])
+            for row, value in zip(rows, values.tolist()):
+                issuer = row[2].lower()
+                for year in {int(match) for match in YEAR_PATTERN.findall(row[1])}:
+                    issuers = index.setdefault(year, {})
+                    issuers[issuer] = issuers.get(issuer, 0) + value
+    except FileNotFoundError:
+        pass
+    return index
+
+def get_loan_index(bank: str) -> LoanIndex:
+    if bank not in _loan_indexes:
+        _loan_indexes[bank] = build_loan_index(bank)
+    return _loan_indexes[bank]
+
+def get_loan_value_from_index(company_name: str, bank: str, year: int) -> float:
+    """
+    Same matching rule as get_loan_value (issuer name contained in the company
+    name), answered by looking up the substrings of the company name in the
+    bank's index instead of scanning every deal. The substrings are computed
+    once per company name, not once per bank and year.
+    """
+    instrumentation.count("loans.lookups")
+    issuers = get_loan_index(bank).get(year)
+    if not issuers:
+        return 0
+    return sum(issuers[name] for name in issuers.keys() & lowercase_substrings(company_name))
+
 if __name__ == "__main__":
-    print(get_loan_value("American Tower Corp","RBC", 2018))
\ No newline at end of file
+    print(get_loan_value("American Tower Corp","RBC", 2018))
+    print(get_loan_value_from_index("American Tower Corp","RBC", 2018))
@@ -0,0 +1,276 @@
+import os
+import mmap
+import json
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from extraction_methods import cusip_crosswalk, extract_13F_data, extract_loan_data, extract_bloomberg_data, BOCC_IICC
+import global_values
+from utilities import urgewald, sfh, yahoo
+
+DIR_snapshot = "./data/output_data/input_snapshot"
+SNAPSHOT_VERSION = 3
+
+# A snapshot is a directory of flat NumPy arrays holding the CUSIP table of
+# every 13F file (what the crosswalk reads), the loan, BOCC and IICC indexes,
+# the Bloomberg extracts and the ticker universe, plus one string table that
+# all the string columns point into:
+#
+#     strings.bin / string_offsets.npy      utf-8 blob and the offsets of each string
+#     cusip_{cusip,symbol,issuer,value}.npy one row per (13F file, CUSIP)
+#     loans_{year,issuer,value}.npy         one row per (bank, year, issuer)
+#     bocc_{key,value}.npy, iicc_{key,value}.npy
+#                                           one row per (institution, code or name)
+#     bloomberg_cells.npy                   one row per extract row, cells are string ids (-1 = no cell)
+#     universe.npy                          the tickers of the universe it was compiled for
+#     manifest.json                         size and mtime of every source file, and the
+#                                           [start, end) rows of each file / institution
+#
+# Arrays are memory-mapped on load and a file's or institution's table is only
+# built from its rows the first time it is asked for, so a warm start never
+# re-tokenizes the csv and only decodes what the run reads.
+
+# Files each ticker universe is read from
+UNIVERSE_SOURCES = {
+    "urgewald": [urgewald.DIR_GOGEL, urgewald.DIR_GCEL],
+    "sfh": [sfh.DIR_SFH],
+    "yahoo": [yahoo.DIR_yahoo_tickers],
+}
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids : Dict[str, int] = {}
+        self.strings : List[str] = []
+
+    def id(self, value: str) -> int:
+        if value not in self.ids:
+            self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.ids[value]
+
+    def save(self, snapshot_dir: str) -> None:
+        encoded = [string.encode('utf-8') for string in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=offsets[1:])
+        with open(os.path.join(snapshot_dir, "strings.bin"), mode='wb') as f:
+            f.write(b"".join(encoded))
+        np.save(os.path.join(snapshot_dir, "string_offsets.npy"), offsets)
+
+
+class _MappedStrings:
+    """The string table of a snapshot, each string is decoded from the mapped blob when first read."""
+    def __init__(self, snapshot_dir: str):
+        self.offsets = np.load(os.path.join(snapshot_dir, "string_offsets.npy"), mmap_mode='r')
+        with open(os.path.join(snapshot_dir, "strings.bin"), mode='rb') as f:
+            # mmap refuses empty files
+            self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        self.decoded : Dict[int, str] = {}
+
+    def __getitem__(self, i: int) -> str:
+        if i not in self.decoded:
+            self.decoded[i] = self.blob[int(self.offsets[i]):int(self.offsets[i + 1])].decode('utf-8')
+        return self.decoded[i]
+
+
+class _LazyTables(dict):
+    """
+    A cache of the extraction methods whose snapshot entries are only built
+    from their rows when first read. The getters only use `in` and `[]`.
+    """
+    def __init__(self, entries: Dict[str, Any], builders: Dict[str, Callable[[], Any]]):
+        super().__init__(entries)
+        self.builders = builders
+
+    def __contains__(self, key: object) -> bool:
+        return dict.__contains__(self, key) or key in self.builders
+
+    def __missing__(self, key: str) -> Any:
+        value = self[key] = self.builders.pop(key)()
+        return value
+
+
+class _SnapshotStore(Mapping):
+    """A Bloomberg store whose rows are only decoded from the mapped cells when read."""
+    def __init__(self, cells: np.ndarray, strings: _MappedStrings):
+        self.cells = cells
+        self.strings = strings
+        self.rows : Dict[Tuple[str, int], int] = {}
+        for i, first in enumerate(cells[:, 0].tolist() if cells.size else []):
+            key = extract_bloomberg_data.parse_row_key(strings[first])
+            if key is not None:
+                self.rows[key] = i
+        self.lines : Dict[Tuple[str, int], List[str]] = {}
+
+    def __getitem__(self, key: Tuple[str, int]) -> List[str]:
+        if key not in self.lines:
+            self.lines[key] = [self.strings[cell] for cell in self.cells[self.rows[key]].tolist() if cell >= 0]
+        return self.lines[key]
+
+    def __iter__(self) -> Iterator[Tuple[str, int]]:
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def _csv_files(directory: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, file) for file in os.listdir(directory) if file.endswith(".csv")]
+
+
+def _universe_sources() -> List[str]:
+    return [path for path in UNIVERSE_SOURCES.get(global_values.TICKER_UNIVERSE, []) if os.path.isfile(path)]
+
+
+def _source_files(bloomberg_dir: str) -> List[str]:
+    paths = []
+    for root, _, files in os.walk(extract_13F_data.DIR_13F):
+        paths.extend(os.path.join(root, file) for file in files if file.lower().endswith(".csv"))
+    paths.extend(_csv_files(extract_loan_data.DIR_loan_data))
+    paths.extend(_csv_files(BOCC_IICC.DIR_loan_data))
+    paths.extend(_csv_files(BOCC_IICC.DIR_share_data))
+    bloomberg_dir = os.path.normpath(bloomberg_dir)
+    paths.extend(os.path.join(bloomberg_dir, file) for file in os.listdir(bloomberg_dir) if file.startswith("GHG_emissions_") and file.endswith(".csv"))
+    paths.extend(_universe_sources())
+    return sorted(paths)
+
+
+def _stat_manifest(paths: List[str]) -> Dict[str, Tuple[int, int]]:
+    manifest = {}
+    for path in paths:
+        stat = os.stat(path)
+        manifest[path] = (stat.st_size, stat.st_mtime_ns)
+    return manifest
+
+
+def _institution(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def compile_inputs(snapshot_dir: str = DIR_snapshot, bloomberg_dir: str = extract_bloomberg_data.DIR_bloomberg) -> None:
+    """Parse every 13F, loan, BOCC, IICC, Bloomberg and ticker universe input once and write the snapshot."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    sources = _source_files(bloomberg_dir)
+    strings = _StringTable()
+    columns : Dict[str, List[Any]] = {name: [] for name in (
+        "cusip_cusip", "cusip_symbol", "cusip_issuer", "cusip_value",
+        "loans_year", "loans_issuer", "loans_value",
+        "bocc_key", "bocc_value", "iicc_key", "iicc_value",
+    )}
+    # [start, end) rows of each 13F file / institution in its columns
+    groups : Dict[str, Dict[str, Tuple[int, int]]] = {"cusip": {}, "loans": {}, "bocc": {}, "iicc": {}}
+
+    for path in sources:
+        if not path.startswith(extract_13F_data.DIR_13F):
+            continue
+        start = len(columns["cusip_cusip"])
+        for cusip, (symbol, issuer, value) in cusip_crosswalk.read_cusip_table(path).items():
+            columns["cusip_cusip"].append(strings.id(cusip))
+            columns["cusip_symbol"].append(strings.id(symbol))
+            columns["cusip_issuer"].append(strings.id(issuer))
+            columns["cusip_value"].append(value)
+        groups["cusip"][path] = (start, len(columns["cusip_cusip"]))
+
+    for path in _csv_files(extract_loan_data.DIR_loan_data):
+        start = len(columns["loans_year"])
+        for year, issuers in extract_loan_data.get_loan_index(_institution(path)).items():
+            for issuer, value in issuers.items():
+                columns["loans_year"].append(year)
+                columns["loans_issuer"].append(strings.id(issuer))
+                columns["loans_value"].append(value)
+        groups["loans"][_institution(path)] = (start, len(columns["loans_year"]))
+
+    for name, directory, get_index in (("bocc", BOCC_IICC.DIR_loan_data, BOCC_IICC.get_BOCC_index), ("iicc", BOCC_IICC.DIR_share_data, BOCC_IICC.get_IICC_index)):
+        for path in _csv_files(directory):
+            start = len(columns[name + "_key"])
+            for key, value in get_index(_institution(path)).items():
+                columns[name + "_key"].append(strings.id(key))
+                columns[name + "_value"].append(value)
+            groups[name][_institution(path)] = (start, len(columns[name + "_key"]))
+
+    lines = list(extract_bloomberg_data.get_bloomberg_store(bloomberg_dir).values())
+    width = max((len(line) for line in lines), default=0)
+    cells = np.full((len(lines), width), -1, dtype=np.int32)
+    for i, line in enumerate(lines):
+        cells[i, :len(line)] = [strings.id(cell) for cell in line]
+
+    # The universe is only snapshotted if all of its files are there
+    universe = global_values.TICKER_UNIVERSE if global_values.TICKER_UNIVERSE in UNIVERSE_SOURCES and len(_universe_sources()) == len(UNIVERSE_SOURCES[global_values.TICKER_UNIVERSE]) else None
+    universe_tickers = [strings.id(ticker) for ticker in global_values.get_fossil_fuel_tickers()] if universe is not None else []
+
+    arrays = {name: np.array(values, dtype=np.float64 if name.endswith("_value") else np.int32) for name, values in columns.items()}
+    arrays["bloomberg_cells"] = cells
+    arrays["universe"] = np.array(universe_tickers, dtype=np.int32)
+    for name, array in arrays.items():
+        np.save(os.path.join(snapshot_dir, name + ".npy"), array)
+    strings.save(snapshot_dir)
+    with open(os.path.join(snapshot_dir, "manifest.json"), mode='w') as f:
+        json.dump({"version": SNAPSHOT_VERSION, "bloomberg_dir": os.path.normpath(bloomberg_dir), "universe": universe, "groups": groups, "sources": _stat_manifest(sources)}, f)
+
+
+def _read_manifest(snapshot_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(snapshot_dir, "manifest.json"), mode='r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def is_snapshot_current(snapshot_dir: str = DIR_snapshot, bloomberg_dir: str = extract_bloomberg_data.DIR_bloomberg) -> bool:
+    """True if a snapshot exists and no source file was added, removed or modified since it was compiled."""
+    manifest = _read_manifest(snapshot_dir)
+    if manifest is None or manifest.get("version") != SNAPSHOT_VERSION or manifest.get("bloomberg_dir") != os.path.normpath(bloomberg_dir):
+        return False
+    sources = {path: tuple(stat) for path, stat in manifest["sources"].items()}
+    return sources == _stat_manifest(_source_files(bloomberg_dir))
+
+
+def load_snapshot(snapshot_dir: str = DIR_snapshot, bloomberg_dir: str = extract_bloomberg_data.DIR_bloomberg) -> bool:
+    """
+    Hand the snapshot to the in-memory caches of the extraction methods, each
+    table is built from the mapped arrays the first time it is asked for.
+    Returns False (and loads nothing) if there is no snapshot or it is stale,
+    in which case the inputs are parsed from csv as usual.
+    """
+    if not is_snapshot_current(snapshot_dir, bloomberg_dir):
+        return False
+    manifest = _read_manifest(snapshot_dir)
+    strings = _MappedStrings(snapshot_dir)
+    column = lambda name: np.load(os.path.join(snapshot_dir, name + ".npy"), mmap_mode='r')
+
+    def tables(group: str, build: Callable[[int, int], Any]) -> Dict[str, Callable[[], Any]]:
+        return {key: (lambda start=start, end=end: build(start, end)) for key, (start, end) in manifest["groups"][group].items()}
+
+    cusips, symbols, issuers, values = (column("cusip_" + name) for name in ("cusip", "symbol", "issuer", "value"))
+    cusip_crosswalk._cusip_tables = _LazyTables(cusip_crosswalk._cusip_tables, tables("cusip", lambda start, end: {
+        strings[cusip]: (strings[symbol], strings[issuer], value)
+        for cusip, symbol, issuer, value in zip(cusips[start:end].tolist(), symbols[start:end].tolist(), issuers[start:end].tolist(), values[start:end].tolist())
+    }))
+
+    loan_years, loan_issuers, loan_values = (column("loans_" + name) for name in ("year", "issuer", "value"))
+    def loan_index(start: int, end: int) -> extract_loan_data.LoanIndex:
+        index : extract_loan_data.LoanIndex = {}
+        for year, issuer, value in zip(loan_years[start:end].tolist(), loan_issuers[start:end].tolist(), loan_values[start:end].tolist()):
+            index.setdefault(year, {})[strings[issuer]] = value
+        return index
+    extract_loan_data._loan_indexes = _LazyTables(extract_loan_data._loan_indexes, tables("loans", loan_index))
+
+    for name, module_cache in (("bocc", "_BOCC_indexes"), ("iicc", "_IICC_indexes")):
+        keys, key_values = column(name + "_key"), column(name + "_value")
+        setattr(BOCC_IICC, module_cache, _LazyTables(getattr(BOCC_IICC, module_cache), tables(name, lambda start, end, keys=keys, key_values=key_values: {
+            strings[key]: value for key, value in zip(keys[start:end].tolist(), key_values[start:end].tolist())
+        })))
+
+    extract_bloomberg_data._bloomberg_stores[bloomberg_dir] = _SnapshotStore(column("bloomberg_cells"), strings)
+
+    if manifest["universe"] is not None:
+        universe = column("universe")
+        global_values.TICKER_PROVIDERS[manifest["universe"]] = lambda: [strings[ticker] for ticker in universe.tolist()]
+    return True
+
+
+if __name__ == "__main__":
+    compile_inputs()
+    print(f"Compiled inputs to {DIR_snapshot}")
@@ -1,11 +1,13 @@
 from functools import partial
-from extraction_methods.extract_13F_data import get_share_value_from_13F
-from extraction_methods.extract_loan_data import get_loan_value
-from utilities.urgewald import urgewald_tickers
+from extraction_methods.extract_13F_data import get_share_value_from_13F, get_share_value_from_index
+from extraction_methods.extract_loan_data import get_loan_value, get_loan_value_from_index
+from extraction_methods.cusip_crosswalk import get_share_value_from_crosswalk
+from typing import Callable, Dict, List
+from utilities.urgewald import get_urgewald_tickers
 
-from extraction_methods.BOCC_IICC import get_IICC_share, get_BOCC_loan
+from extraction_methods.BOCC_IICC import get_IICC_share, get_BOCC_loan, get_IICC_share_from_index, get_BOCC_loan_from_index
 
-from utilities.sfh import sfh_tickers
+from utilities.sfh import get_sfh_tickers
 from utilities.yahoo import get_yahoo_tickers
 
 FINANCIAL_INSTITUTIONS = [
@@ -32,16 +34,45 @@ FINANCIAL_INSTITUTIONS = [
     "Investment Management of Ontario",
 ]
 
-HOLDINGS_DATA_COLLECTION = lambda ticker, name, fi, year : get_share_value_from_13F(ticker, fi, year, max)
-LOAN_DATA_COLLECTION = lambda ticker, name, fi, year : get_loan_value(name, fi, year)
+# Results are cached per methodology (see utilities/result_cache.py): switch
+# the *_METHODOLOGY line together with its *_DATA_COLLECTION, and give a new
+# name to a collection method whose results change
+HOLDINGS_METHODOLOGY = "13F cusip crosswalk, max over files"
+HOLDINGS_DATA_COLLECTION = lambda ticker, name, fi, year : get_share_value_from_crosswalk(ticker, fi, year, max)
+# HOLDINGS_METHODOLOGY = "13F symbol root, max over files"
+# HOLDINGS_DATA_COLLECTION = lambda ticker, name, fi, year : get_share_value_from_index(ticker, fi, year, max)
+# HOLDINGS_DATA_COLLECTION = lambda ticker, name, fi, year : get_share_value_from_13F(ticker, fi, year, max)
+LOAN_METHODOLOGY = "league table issuer in name"
+LOAN_DATA_COLLECTION = lambda ticker, name, fi, year : get_loan_value_from_index(name, fi, year)
+# LOAN_DATA_COLLECTION = lambda ticker, name, fi, year : get_loan_value(name, fi, year)
+
+# Ticker universes, each one is only loaded the first time it is asked for
+TICKER_PROVIDERS : Dict[str, Callable[[], List[str]]] = {
+    "urgewald": get_urgewald_tickers,
+    "sfh": get_sfh_tickers,
+    "yahoo": get_yahoo_tickers,
+}
 
 YEARS_OF_INTEREST = [i for i in range(2018,2025)]
-FOSSIL_FUEL_TICKERS = urgewald_tickers
+TICKER_UNIVERSE = "urgewald"
 
 # YEARS_OF_INTEREST = [2022]
-# FOSSIL_FUEL_TICKERS = sfh_tickers
+# TICKER_UNIVERSE = "sfh"
 
+# HOLDINGS_METHODOLOGY = "IICC"
+# LOAN_METHODOLOGY = "BOCC"
+# HOLDINGS_DATA_COLLECTION = get_IICC_share_from_index
+# LOAN_DATA_COLLECTION = get_BOCC_loan_from_index
 # HOLDINGS_DATA_COLLECTION = get_IICC_share
 # LOAN_DATA_COLLECTION = get_BOCC_loan
 
-# FOSSIL_FUEL_TICKERS = get_yahoo_tickers()
\ No newline at end of file
+# TICKER_UNIVERSE = "yahoo"
+
+def get_fossil_fuel_tickers() -> List[str]:
+    return TICKER_PROVIDERS[TICKER_UNIVERSE]()
+
+def __getattr__(name: str):
+    # FOSSIL_FUEL_TICKERS is resolved on access so importing this module never loads a universe
+    if name == "FOSSIL_FUEL_TICKERS":
+        return get_fossil_fuel_tickers()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import resource
+import subprocess
+from typing import Callable, Dict, List
+
+STAGES = ["tickers", "13F scan", "13F index", "crosswalk build", "crosswalk lookup", "loan scan", "loan index", "parse per-cell", "parse bulk", "datagen", "data_processing"]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_stages(stages: List[str], years: List[int], samples: int, workers: int, seed: int) -> Dict[str, Dict[str, float]]:
+    """
+    Run the selected stages against the dataset in the current directory and
+    return the wall time and peak RSS after each one. Meant to be run in a
+    fresh process (see main) so that caches and RSS start from zero.
+    """
+    results : Dict[str, Dict[str, float]] = {}
+
+    def measure(stage: str, action: Callable[[], object]) -> None:
+        if stage not in stages:
+            return
+        start = time.perf_counter()
+        action()
+        results[stage] = {"seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb()}
+
+    from global_values import FINANCIAL_INSTITUTIONS, get_fossil_fuel_tickers
+    measure("tickers", get_fossil_fuel_tickers)
+    from extraction_methods.extract_13F_data import DIR_13F, get_share_value_from_13F, get_share_value_from_index
+    from extraction_methods.extract_loan_data import get_loan_value, get_loan_value_from_index
+    from extraction_methods.extract_bloomberg_data import get_bloomberg_store
+    # Institutions beyond the real 18 only exist in the synthetic dataset, the
+    # lookups sample them too but datagen and data_processing keep to the
+    # configured FINANCIAL_INSTITUTIONS
+    institutions = FINANCIAL_INSTITUTIONS + sorted(name for name in os.listdir(DIR_13F) if name.startswith("Synthetic FI") and name not in FINANCIAL_INSTITUTIONS)
+
+    rng = random.Random(seed)
+    store = get_bloomberg_store()
+    keys = rng.sample(sorted(store), min(samples, len(store)))
+    queries = [(store[key][0], store[key][23] if len(store[key]) > 23 else "", rng.choice(institutions), key[1]) for key in keys]
+
+    measure("13F scan", lambda: [get_share_value_from_13F(ticker, fi, year, max) for ticker, _, fi, year in queries])
+    measure("13F index", lambda: [get_share_value_from_index(ticker, fi, year, max) for ticker, _, fi, year in queries])
+    # Parsing every 13F file into CUSIP tables and resolving their symbols,
+    # then the lookups of the default methodology (which build the per ticker
+    # tables of the files they touch)
+    from extraction_methods.cusip_crosswalk import get_crosswalk, get_share_value_from_crosswalk
+    measure("crosswalk build", get_crosswalk)
+    measure("crosswalk lookup", lambda: [get_share_value_from_crosswalk(ticker, fi, year, max) for ticker, _, fi, year in queries])
+    measure("loan scan", lambda: [get_loan_value(name, fi, year) for _, name, fi, year in queries])
+    measure("loan index", lambda: [get_loan_value_from_index(name, fi, year) for _, name, fi, year in queries])
+
+    # Every numeric cell of the Bloomberg extracts, through safe_to_float and column at a time
+    from utilities.helper_functions import safe_to_float
+    from utilities.company_data import NUMERIC_COLUMNS, parse_bloomberg_values
+    lines = list(store.values())
+    measure("parse per-cell", lambda: [[safe_to_float(line[column]) if len(line) > column else None for column in NUMERIC_COLUMNS] for line in lines])
+    measure("parse bulk", lambda: parse_bloomberg_values(lines))
+
+    def run_datagen():
+        import datagen
+        datagen.generate_tables_alphabetical(get_fossil_fuel_tickers(), years)
+    measure("datagen", run_datagen)
+
+    def run_data_processing():
+        import data_processing
+        graph_dir = "data/output_data/serialized_fi_data"
+        os.makedirs(graph_dir, exist_ok=True)
+        data_processing.main("data/input_data/Bloomberg", years, "data/output_data/processed_info", graph_dir, workers, use_cache=False)
+    measure("data_processing", run_data_processing)
+    return results
+
+
+def print_report(report: Dict[str, Dict]) -> None:
+    print("\n|Scale|Stage|Wall time (s)|Peak RSS (MB)|")
+    print("| --- | --- | --- | --- |")
+    for scale, run in report.items():
+        print(f"|{scale}x|generate|{run['generate_seconds']:.2f}| |")
+        for stage in STAGES:
+            if stage in run["stages"]:
+                print(f"|{scale}x|{stage}|{run['stages'][stage]['seconds']:.2f}|{run['stages'][stage]['peak_rss_mb']:.0f}|")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data sized like production")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1], help="dataset sizes relative to the real inputs, e.g. 1 10 100")
+    parser.add_argument("--years", type=int, default=7, help="number of years starting at 2018")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--samples", type=int, default=200, help="number of lookups for the 13F and loan stages")
+    parser.add_argument("--workers", type=int, default=1, help="workers for the data_processing stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="where to generate the datasets, a temporary directory by default")
+    parser.add_argument("--keep", action="store_true", help="keep the generated datasets")
+    parser.add_argument("--output", help="also write the report as json to this path")
+    # Internal: run the stages in the current directory and write the results to this path
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    years = [2018 + i for i in range(args.years)]
+
+    if args.run:
+        with open(args.run, mode='w') as f:
+            json.dump(run_stages(args.stages, years, args.samples, args.workers, args.seed), f)
+        return
+
+    from helper_scripts.synthetic_data import generate_dataset
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bay_street_benchmark_")
+    report : Dict[str, Dict] = {}
+    for scale in args.scale:
+        root = os.path.join(data_dir, f"scale_{scale:g}")
+        start = time.perf_counter()
+        generate_dataset(root, scale, years, args.seed)
+        generate_seconds = time.perf_counter() - start
+
+        # A fresh interpreter per scale, run from inside the dataset so the
+        # relative input paths of the pipeline resolve to the synthetic data
+        result_path = os.path.join(root, "benchmark.json")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+        command = [sys.executable, "-m", "helper_scripts.benchmark", "--run", result_path, "--years", str(args.years), "--samples", str(args.samples), "--workers", str(args.workers), "--seed", str(args.seed), "--stages", *args.stages]
+        subprocess.run(command, cwd=root, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(result_path, mode='r') as f:
+            report[f"{scale:g}"] = {"generate_seconds": generate_seconds, "stages": json.load(f)}
+        if not args.keep:
+            shutil.rmtree(root)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, mode='w') as f:
+            json.dump(report, f, indent=2)
+    if not args.keep and not args.data_dir:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
-from utilities.urgewald import urgewald_tickers
+from utilities.urgewald import get_urgewald_resolver
 from utilities.sfh import sfh_tickers
-ticker1 = urgewald_tickers
+resolver = get_urgewald_resolver()
 ticker2 = sfh_tickers
 
-missing = [ticker for ticker in ticker2 if not any(ticker in t for t in ticker1)]
+missing = [ticker for ticker in ticker2 if not resolver.contains(ticker)]
 
 print(f"The following {len(missing)} tickers are missing from urgewald: {missing}")
\ No newline at end of file
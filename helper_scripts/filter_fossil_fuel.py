@@ -1,158 +1,124 @@
-
 import csv
-from typing import Set, Callable, Tuple, Optional, Any, Dict
+import heapq
+from typing import List, Set, Callable, Tuple, Optional, Dict
 import os
-from functools import cmp_to_key
-from utilities.helper_functions import print_cond, contains_which
+from concurrent.futures import ProcessPoolExecutor
+from utilities.helper_functions import print_cond, contains_which, safe_to_float
 from datagen import generate_tables_alphabetical
 import sys
-from utilities.urgewald import urgewald_tickers
+from utilities.urgewald import get_urgewald_resolver
 
-from utilities.yahoo import is_fossil_fuel_company
+from utilities.yahoo import YahooClassifier
 
 def is_urgewald(ticker: str) -> Optional[Tuple[str,str]]:
-    for urgewald_ticker in urgewald_tickers:
-        if urgewald_ticker.split(" ")[0] == ticker.split(".")[0]:
-            return ticker, urgewald_ticker
+    urgewald_ticker = get_urgewald_resolver().resolve(ticker)
+    if urgewald_ticker is not None:
+        return ticker, urgewald_ticker
     return None
 
-def filter_csv(source_path: str, destination_path: str, top_number: int = -1, filter_method : Callable[[str], Optional[Tuple[str,str]]] = is_urgewald) -> Set[Tuple[str, str]]:
+def select_top_csv(source_path: str, destination_path: str, column_index: int, top_number: int = -1, filter_method : Callable[[str], Optional[Tuple[str,str]]] = is_urgewald) -> Set[Tuple[str, str]]:
     """
-    Given a path to a csv file, filter the CSV to only include fossil fuel 
-    companies and save it as a new csv
-
-    if top_number >= 0 only report the first top_number of fossil fuel companies
-    based on the order of the csv
+    Sort and filter in one pass: stream the csv, keep the top_number fossil
+    fuel companies with the largest value in column_index in a bounded heap
+    (all of them if top_number < 0) and write only those, largest first.
+    Rows with the same value keep their order in the file and rows whose value
+    is not a number come last. Only the kept rows are held in memory.
 
     return a set containing all fossil fuel companies and tickers
     """
-    number_of_fossil_fuels_needed = top_number
-    bloomberg_codes : Set[Tuple[str, str]] = set()
-    with open(source_path, mode ='r', newline='')as source_file:
+    with open(source_path, mode='r', newline='', encoding='utf-8') as source_file:
         reader = csv.reader(source_file)
-        with open(destination_path, mode= 'w', newline='')as destination_file:
-            writer = csv.writer(destination_file)
-            writer.writerow(next(reader)) # copy header
-            for line in reader:
-                ticker = line[0]
-                bloomberg_code = filter_method(ticker)
-                if bloomberg_code is not None:
-                    number_of_fossil_fuels_needed -= 1
-                    # include
-                    bloomberg_codes.add(bloomberg_code)
-                    writer.writerow(line)
-                if number_of_fossil_fuels_needed == 0:
-                    return bloomberg_codes
-
-    return bloomberg_codes
+        header = next(reader, None)
+        if header is None:
+            # Empty file, just write an empty file
+            open(destination_path, mode='w').close()
+            return set()
+
+        def candidates():
+            # (negated value, position in the file, row, bloomberg code), the
+            # position breaks ties so rows and codes are never compared
+            for index, row in enumerate(reader):
+                bloomberg_code = filter_method(row[0]) if row else None
+                if bloomberg_code is None:
+                    continue
+                value = safe_to_float(row[column_index]) if len(row) > column_index else None
+                yield (-value if value is not None else float('inf'), index, row, bloomberg_code)
+
+        # nsmallest keeps a heap of top_number rows while it reads the file
+        selected = heapq.nsmallest(top_number, candidates()) if top_number >= 0 else sorted(candidates())
+
+    with open(destination_path, mode='w', newline='') as destination_file:
+        writer = csv.writer(destination_file)
+        writer.writerow(header)
+        writer.writerows(row for _, _, row, _ in selected)
+    return {bloomberg_code for _, _, _, bloomberg_code in selected}
 
 
+# Classifications of the symbols, set once per worker process by
+# _set_classifications instead of being sent along with every file
+_classifications : Dict[str, Optional[Tuple[str,str]]] = {}
 
+def _set_classifications(classifications: Dict[str, Optional[Tuple[str,str]]]) -> None:
+    global _classifications
+    _classifications = classifications
 
-def reorder_csv(source_path: str, destination_path: str, column_index: int, comparison_function: Callable[[Any, Any], bool] = lambda a,b : float(a) >= float(b) ) -> None:
-    """
-    Helper function, given a path to a csv file, reorder the rows such that they are sorted according to comparison_function
-    where comparison_function(a,b) = true => a is before b in the destination csv. column_index is the column index (starting with 0)
-    """
-    with open(source_path, newline='', encoding='utf-8') as src_file:
-        reader = list(csv.reader(src_file))
-        
-        if not reader:
-            # Empty file, just write back an empty file
-            with open(destination_path, 'w', newline='', encoding='utf-8') as dest_file:
-                pass
-            return
-
-        header, rows = reader[0], reader[1:]
-
-    def compare(row_a, row_b):
-        val_a, val_b = row_a[column_index], row_b[column_index]
-        # Attempt to convert to float for numeric sorting
-        try:
-            return -1 if comparison_function(val_a, val_b) else 1
-        except:
-            return 1
-
-    sorted_rows = sorted(rows, key=cmp_to_key(compare))
-
-    # Write the reordered CSV
-    with open(destination_path, 'w', newline='', encoding='utf-8') as dest_file:
-        writer = csv.writer(dest_file)
-        writer.writerow(header)
-        writer.writerows(sorted_rows)
+def _classification(symbol: str) -> Optional[Tuple[str,str]]:
+    return _classifications.get(symbol)
 
 
-def reorder_bulk_csv(source_root: str, destination_root: str, column_index: int,  comparison_function: Callable = lambda a, b : float(a.replace(',', '')) >= float(b.replace(',', '')), verbose = False) -> None:
+def select_top_bulk_csv(source_root: str, destination_root: str, column_index: int, classifications: Dict[str, Optional[Tuple[str,str]]], top_number: int = -1, workers: int = 1, verbose = False) -> Dict[str, Set[Tuple[str, str]]]:
     """
-    Given a path to a source directory, sort all the csv to using the comparison_function
-    where comparison_function(a,b) = true => a is before b in the destination csv. column_index is the column index (starting with 0) 
-    save the new ones to a new directory.
-    
-    New CSV names match the old names with '_sorted' appended at the end.
-    For example if a csv is in 'source_root/directory/data.csv' would be saved
-    as 'destination_root/directory/data_sorted.csv'
+    Run select_top_csv on every csv under source_root, over `workers`
+    processes, and save the results under destination_root with the same
+    layout and '_fossil_fuel' appended to the names. classifications maps
+    each symbol to its fossil fuel classification (see
+    YahooClassifier.classify_many), symbols missing from it are left out.
+
+    return a set containing all fossil fuel companies and bloomberg codes per year
     """
+    jobs : List[Tuple[str, str, str]] = []
     for root, _, files in os.walk(source_root):
         for file in files:
             if file.lower().endswith(".csv"):
-                # Construct source file path
-                source_path = os.path.join(root, file)
-
-                # Preserve subdirectory structure under destination_root
-                rel_dir = os.path.relpath(root, source_root)
-                dest_dir = os.path.join(destination_root, rel_dir)
+                year = contains_which(file, list(map(str, range(2018, 2025))))
+                if year is None:
+                    raise ValueError(f"Could not find year for: {file} Make sure that each 13F file has the year in it's name")
+                dest_dir = os.path.join(destination_root, os.path.relpath(root, source_root))
                 os.makedirs(dest_dir, exist_ok=True)
-
-                
                 name, ext = os.path.splitext(file)
-                dest_file = f"{name}_sorted{ext}"
-                destination_path = os.path.join(dest_dir, dest_file)
-
-                print_cond(verbose, f"Sorting {source_path}...")
-                reorder_csv(source_path, destination_path, column_index, comparison_function)
-                print_cond(verbose, f"Sorted to {destination_path}")
-
+                jobs.append((year, os.path.join(root, file), os.path.join(dest_dir, f"{name}_fossil_fuel{ext}")))
+
+    sources = [job[1] for job in jobs]
+    destinations = [job[2] for job in jobs]
+    arguments = ([column_index] * len(jobs), [top_number] * len(jobs), [_classification] * len(jobs))
+    if workers <= 1:
+        _set_classifications(classifications)
+        results = list(map(select_top_csv, sources, destinations, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_set_classifications, initargs=(classifications,)) as executor:
+            results = list(executor.map(select_top_csv, sources, destinations, *arguments))
 
+    bloomberg_codes : Dict[str, Set[Tuple[str, str]]] = {}
+    for (year, source_path, destination_path), codes in zip(jobs, results):
+        bloomberg_codes.setdefault(year, set()).update(codes)
+        print_cond(verbose, f"Filtered {source_path} to {destination_path}")
+    return bloomberg_codes
 
 
-def filter_bulk_csv(source_root: str, destination_root: str, top_number : int = -1, filter_method : Callable[[str], Optional[Tuple[str,str]]] = is_urgewald, verbose = False) -> Dict[str, Set[Tuple[str, str]]]:
+def csv_symbols(source_root: str) -> Set[str]:
     """
-    Given a path to a source directory, filter all the csv to only include 
-    fossil fuel companies and save the new ones to a new directory.
-    
-    New CSV names match the old names with '_fossil_fuel' appended at the end.
-    For example if a csv is in 'source_root/directory/data.csv' would be saved
-    as 'destination_root/directory/data_fossil_fuel.csv'
-
-    return a set containing all fossil fuel companies and bloomberg codes
+    Return every distinct symbol (first column) across all the csv files
+    under source_root, so that each one is looked up only once.
     """
-    bloomberg_codes : Dict[str, Set[Tuple[str, str]]] = {}
+    symbols : Set[str] = set()
     for root, _, files in os.walk(source_root):
         for file in files:
             if file.lower().endswith(".csv"):
-
-                year = contains_which(file, list(map(str, range(2018, 2025))))
-                if year is None:
-                    raise ValueError(f"Could not find year for: {file} Make sure that each 13F file has the year in it's name")
-                if year not in bloomberg_codes:
-                    bloomberg_codes[year] = set()
-                # Construct source file path
-                source_path = os.path.join(root, file)
-
-                # Preserve subdirectory structure under destination_root
-                rel_dir = os.path.relpath(root, source_root)
-                dest_dir = os.path.join(destination_root, rel_dir)
-                os.makedirs(dest_dir, exist_ok=True)
-
-                
-                name, ext = os.path.splitext(file)
-                dest_file = f"{name}_fossil_fuel{ext}"
-                destination_path = os.path.join(dest_dir, dest_file)
-
-                print_cond(verbose, f"Filtering {source_path}...")
-                bloomberg_codes[year] |= filter_csv(source_path, destination_path, top_number, filter_method)
-                print_cond(verbose, f"Filtered to {destination_path}")
-    return bloomberg_codes
+                with open(os.path.join(root, file), mode='r', newline='') as source_file:
+                    reader = csv.reader(source_file)
+                    next(reader, None) # skip header
+                    symbols.update(line[0] for line in reader if line)
+    return symbols
 
 
 if __name__ == "__main__":
@@ -163,8 +129,10 @@ if __name__ == "__main__":
         print("If you wish to specify the number of fossil fuel companies to find per file (for example only find the top 20 fossil fuel companies invested in for each year/company) run the following:")
         print("\t python -m filter_fossil_fuel 20")
         top_number = -1
-    reorder_bulk_csv("./data/input_data/13f_data", "./data/output_data/sorted_by_value", 4)
-    fossil_fuel_country_codes = filter_bulk_csv("./data/output_data/sorted_by_value", "./data/output_data/filtered_data", top_number = top_number, filter_method = is_fossil_fuel_company, verbose = True)
+    # Classify every symbol up front with the rate-limited pool, the worker
+    # processes filtering afterwards only read the classifications
+    classifications = YahooClassifier().classify_many(csv_symbols("./data/input_data/13f_data"), verbose = True)
+    fossil_fuel_country_codes = select_top_bulk_csv("./data/input_data/13f_data", "./data/output_data/filtered_data", 4, classifications, top_number = top_number, workers = os.cpu_count() or 1, verbose = True)
     print(f"found {len(fossil_fuel_country_codes)} tickers")
     for year in fossil_fuel_country_codes:
         codes = fossil_fuel_country_codes[year]
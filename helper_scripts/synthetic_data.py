@@ -0,0 +1,127 @@
+import os
+import csv
+import sys
+import random
+from string import ascii_uppercase
+from typing import List, Optional, Sequence
+
+# Sizes of the real inputs, scale 1 generates a dataset of roughly this size
+BASE_TICKERS = 3500
+BASE_INSTITUTIONS = 18
+BASE_HOLDINGS_PER_FILE = 1300
+BASE_LOANS_PER_BANK = 3000
+BASE_BANKS = 6
+
+EXCHANGES = ["US", "CN", "LN", "AU", "CH", "JP", "GY", "FP", "HK"]
+
+HEADER_13F = ["Sym", "Issuer Name", "Cl", "CUSIP", "Value ($000)", "%", "Shares", "Principal", "Option Type"]
+HEADER_LOANS = ["Facility ID", "Deal Effective Date", "Issuer Name", "Deal Size (USD)", "League Credit (USD)", "Tranches"]
+
+
+def _money(rng: random.Random, low: int, high: int) -> str:
+    return f"{rng.randint(low, high):,}"
+
+
+def _bloomberg_cell(rng: random.Random, low: float, high: float) -> str:
+    # About a third of Bloomberg fields come back empty in the real extracts
+    return "#N/A N/A" if rng.random() < 0.35 else f"{rng.uniform(low, high):.4f}"
+
+
+def generate_tickers(rng: random.Random, count: int) -> List[str]:
+    tickers = set()
+    while len(tickers) < count:
+        symbol = "".join(rng.choice(ascii_uppercase) for _ in range(rng.randint(1, 5)))
+        tickers.add(f"{symbol} {rng.choice(EXCHANGES)} Equity")
+    return sorted(tickers)
+
+
+def generate_dataset(root: str, scale: float = 1, years: Optional[Sequence[int]] = None, seed: int = 0) -> None:
+    """
+    Write a synthetic copy of data/input_data under root with the same file
+    layout and formats as the real one, `scale` times its size: 13F folders
+    for every financial institution, loan league tables, Bloomberg extracts,
+    the Urgewald and SFH ticker lists.
+
+    The first 18 institutions use the real names so global_values needs no
+    changes, further ones are called "Synthetic FI <n>". years defaults to
+    2018 to 2024.
+    """
+    from global_values import FINANCIAL_INSTITUTIONS
+
+    years = list(years) if years is not None else [year for year in range(2018, 2025)]
+
+    rng = random.Random(seed)
+    input_dir = os.path.join(root, "data", "input_data")
+    tickers = generate_tickers(rng, int(BASE_TICKERS * scale))
+    names = {ticker: f"SYNTHETIC {ticker.split(' ')[0]} {rng.choice(['CORP', 'INC', 'LTD', 'PLC'])}" for ticker in tickers}
+    institutions = FINANCIAL_INSTITUTIONS[:BASE_INSTITUTIONS] + [f"Synthetic FI {i}" for i in range(int(BASE_INSTITUTIONS * scale) - BASE_INSTITUTIONS)]
+
+    # Ticker universes
+    tickers_dir = os.path.join(input_dir, "tickers")
+    os.makedirs(tickers_dir, exist_ok=True)
+    half = len(tickers) // 2
+    with open(os.path.join(tickers_dir, "urgewald GOGEL 2024.csv"), mode='w', newline='', encoding='iso-8859-1') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Company Name", "BB Ticker", "Primary Business Sectors"])
+        writer.writerows([names[ticker], ticker, "Oil & Gas"] for ticker in tickers[:half])
+    with open(os.path.join(tickers_dir, "urgewald GCEL 2024 for FI.csv"), mode='w', newline='', encoding='iso-8859-1') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Company Name", "BB Ticker", "Coal Industry Sector"])
+        writer.writerows([names[ticker], ticker, "Coal Mining"] for ticker in tickers[half:])
+    with open(os.path.join(tickers_dir, "SFH_data.csv"), mode='w', newline='', encoding='iso-8859-1') as f:
+        writer = csv.writer(f)
+        writer.writerow([f"column_{i}" for i in range(19)] + ["ticker"])
+        writer.writerows([""] * 19 + [ticker] for ticker in tickers[::10])
+
+    # Bloomberg extracts, one file per first letter like the real pulls
+    bloomberg_dir = os.path.join(input_dir, "Bloomberg")
+    os.makedirs(bloomberg_dir, exist_ok=True)
+    by_letter = {}
+    for ticker in tickers:
+        by_letter.setdefault(ticker[0].lower(), []).append(ticker)
+    for letter, letter_tickers in by_letter.items():
+        with open(os.path.join(bloomberg_dir, f"GHG_emissions_{letter}.csv"), mode='w', newline='') as f:
+            writer = csv.writer(f)
+            for ticker in letter_tickers:
+                for year in years:
+                    writer.writerow(
+                        [f"{ticker} {year}"]
+                        + [_bloomberg_cell(rng, 0, 50000) for _ in range(19)]
+                        + [_bloomberg_cell(rng, 100, 200000) for _ in range(3)]
+                        + [names[ticker]]
+                        + [_bloomberg_cell(rng, 1, 5000) for _ in range(5)]
+                    )
+
+    # 13F holdings, one directory per institution with a Q4 file per year
+    for institution in institutions:
+        directory = os.path.join(input_dir, "13f_data", institution)
+        os.makedirs(directory, exist_ok=True)
+        for year in years:
+            held = rng.sample(tickers, min(len(tickers), BASE_HOLDINGS_PER_FILE))
+            with open(os.path.join(directory, f"{institution} Q4 {year} 13F Top Portfolio Holdings.csv"), mode='w', newline='') as f:
+                writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+                writer.writerow(HEADER_13F)
+                for ticker in held:
+                    symbol = ticker.split(" ")[0]
+                    writer.writerow([symbol, names[ticker], "COM", f"{rng.randrange(10 ** 9):09d}", _money(rng, 1, 5000000), "0.1%", _money(rng, 1, 10 ** 8), "", ""])
+
+    # Loan league tables for the banks
+    loan_dir = os.path.join(input_dir, "Loan Data")
+    os.makedirs(loan_dir, exist_ok=True)
+    for bank in institutions[:int(BASE_BANKS * scale)]:
+        with open(os.path.join(loan_dir, bank+".csv"), mode='w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER_LOANS)
+            for i in range(int(BASE_LOANS_PER_BANK * scale)):
+                year = rng.choice(years)
+                issuer = names[rng.choice(tickers)] if rng.random() < 0.3 else f"Private Borrower {i} LLC"
+                writer.writerow([f"BF{i:06d} Corp-{year}0101", f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/{year}", issuer, _money(rng, 10 ** 6, 10 ** 9), _money(rng, 10 ** 5, 10 ** 8), rng.randint(1, 3)])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m helper_scripts.synthetic_data <destination> [scale]")
+        sys.exit(1)
+    scale = float(sys.argv[2]) if len(sys.argv) >= 3 else 1
+    generate_dataset(sys.argv[1], scale)
+    print(f"Generated a {scale}x synthetic dataset in {sys.argv[1]}")
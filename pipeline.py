@@ -0,0 +1,222 @@
+import os
+import sys
+import time
+import argparse
+import traceback
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+from global_values import TICKER_UNIVERSE, YEARS_OF_INTEREST
+
+DIR_tickers = "data/input_data/tickers"
+DIR_13F = "data/input_data/13f_data"
+DIR_loans = "data/input_data/Loan Data"
+DIR_BOCC = "data/input_data/BOCC Big 5"
+DIR_IICC = "data/input_data/IICC"
+DIR_bloomberg = "data/input_data/Bloomberg"
+DIR_templates = "data/input_data/Bloomberg_template"
+DIR_filtered = "data/output_data/filtered_data"
+DIR_snapshot = "data/output_data/input_snapshot"
+DIR_processed_info = "data/output_data/processed_info"
+DIR_graphs = "data/output_data/serialized_fi_data"
+
+
+class Stage(NamedTuple):
+    name: str
+    # Called with the number of worker processes the stage may use
+    action: Callable[[int], None]
+    # Files or directories (all the files under them) the stage reads and writes
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    # Stages that have to finish first
+    needs: Tuple[str, ...] = ()
+    # Whether the action starts a process pool of its own with the workers it is given
+    pooled: bool = False
+
+
+# Stage actions are module level functions so they can run in worker processes
+
+def filter_fossil_fuel(workers: int) -> None:
+    from utilities.yahoo import YahooClassifier
+    from helper_scripts.filter_fossil_fuel import csv_symbols, select_top_bulk_csv
+    classifications = YahooClassifier().classify_many(csv_symbols(DIR_13F), verbose = True)
+    codes = select_top_bulk_csv(DIR_13F, DIR_filtered, 4, classifications, top_number = -1, workers = workers, verbose = True)
+    with open(os.path.join(DIR_tickers, "yahoo_tickers.txt"), "w") as text_file:
+        text_file.write("\n".join(sorted({company[1] for year in codes for company in codes[year]})))
+
+
+def generate_templates(workers: int) -> None:
+    from datagen import generate_delta_tables_alphabetical
+    from global_values import get_fossil_fuel_tickers
+    generate_delta_tables_alphabetical(get_fossil_fuel_tickers(), YEARS_OF_INTEREST, True, workers, DIR_bloomberg)
+
+
+def check_bloomberg_pull(workers: int) -> None:
+    # Pulling from Bloomberg is done by hand in Excel, all this stage can do is say what is left
+    from datagen import missing_requests
+    from global_values import get_fossil_fuel_tickers
+    missing, _ = missing_requests(get_fossil_fuel_tickers(), YEARS_OF_INTEREST, DIR_bloomberg)
+    left = sum(len(fields) for fields in missing.values())
+    if left:
+        print(f"{left} Bloomberg requests are still unanswered: open the templates in {DIR_templates} in Excel with the Bloomberg plugin and save the extracts as csv in {DIR_bloomberg}")
+
+
+def compile_snapshot(workers: int) -> None:
+    from extraction_methods.input_snapshot import compile_inputs
+    compile_inputs(DIR_snapshot, DIR_bloomberg)
+
+
+def process_data(workers: int) -> None:
+    import data_processing
+    os.makedirs(DIR_processed_info, exist_ok=True)
+    os.makedirs(DIR_graphs, exist_ok=True)
+    data_processing.main(DIR_bloomberg, [int(year) for year in YEARS_OF_INTEREST], DIR_processed_info, DIR_graphs, workers, charts=False)
+
+
+def draw_charts(workers: int) -> None:
+    from render_charts import render_charts
+    render_charts(DIR_graphs, workers)
+
+
+def build_query_cache(workers: int) -> None:
+    from query_results import FinancedEmissionsResults
+    FinancedEmissionsResults.load(DIR_processed_info)
+
+
+def default_stages() -> List[Stage]:
+    from global_values import FINANCIAL_INSTITUTIONS
+    results = tuple(os.path.join(DIR_processed_info, f"financed_emissions_{year}.csv") for year in YEARS_OF_INTEREST)
+    # Stages that run in one process come before the pooled stages they can
+    # run next to, so those get the workers that are left
+    stages = [
+        Stage("input snapshot", compile_snapshot, (DIR_tickers, DIR_13F, DIR_loans, DIR_BOCC, DIR_IICC, DIR_bloomberg), (os.path.join(DIR_snapshot, "manifest.json"),)),
+        Stage("datagen", generate_templates, (DIR_tickers, DIR_bloomberg), (os.path.join(DIR_templates, "manifest.json"),), pooled=True),
+        Stage("bloomberg pull", check_bloomberg_pull, (os.path.join(DIR_templates, "manifest.json"),), (DIR_bloomberg,), needs=("datagen",)),
+        Stage("data_processing", process_data, (DIR_tickers, DIR_bloomberg, DIR_13F, DIR_loans, DIR_BOCC, DIR_IICC, os.path.join(DIR_snapshot, "manifest.json")), results + (os.path.join(DIR_graphs, "data.csv"),), needs=("bloomberg pull", "input snapshot"), pooled=True),
+        Stage("query cache", build_query_cache, results, (os.path.join(DIR_processed_info, ".query_cache.npz"),), needs=("data_processing",)),
+        Stage("charts", draw_charts, (os.path.join(DIR_graphs, "data.csv"),), tuple(os.path.join(DIR_graphs, f"{fi}_plot.png") for fi in FINANCIAL_INSTITUTIONS), needs=("data_processing",), pooled=True),
+    ]
+    if TICKER_UNIVERSE == "yahoo":
+        # The yahoo universe is the output of the 13F filtering
+        stages.insert(0, Stage("filter_fossil_fuel", filter_fossil_fuel, (DIR_13F,), (os.path.join(DIR_tickers, "yahoo_tickers.txt"),), pooled=True))
+        stages = [stage._replace(needs=("filter_fossil_fuel",)) if stage.name == "datagen" else stage for stage in stages]
+    return stages
+
+
+def _modified_times(path: str) -> List[float]:
+    """mtime of path, or of every file under it for a directory. Empty if it does not exist."""
+    if os.path.isfile(path):
+        return [os.path.getmtime(path)]
+    times = []
+    for root, _, files in os.walk(path):
+        times.extend(os.path.getmtime(os.path.join(root, file)) for file in files)
+    return times
+
+
+def is_up_to_date(stage: Stage) -> bool:
+    """True if every output exists and none is older than the newest input."""
+    output_times = [_modified_times(path) for path in stage.outputs]
+    if not all(output_times):
+        return False
+    newest_input = max((t for path in stage.inputs for t in _modified_times(path)), default=0)
+    return min(t for times in output_times for t in times) >= newest_input
+
+
+def _run_stage(stage: Stage, workers: int) -> float:
+    start = time.perf_counter()
+    stage.action(workers)
+    return time.perf_counter() - start
+
+
+def run_pipeline(stages: List[Stage], workers: int = 1, force: bool = False, only: Optional[List[str]] = None) -> Dict[str, Tuple[str, float]]:
+    """
+    Run the stages in dependency order, stages whose dependencies are done
+    running concurrently. The `workers` are shared between the running
+    stages: a stage takes one of them, a pooled stage all the free ones for
+    its own pool, and a stage only starts when one is free, so there are never
+    much more than `workers` processes busy. A stage whose outputs are newer
+    than its inputs is skipped unless force is set, and only the stages in
+    `only` are run if it is given (the others count as done).
+    Returns stage -> (status, seconds) with status one of ran, skipped,
+    failed or blocked (a stage it needs failed).
+    """
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        unknown = [need for need in stage.needs if need not in names]
+        if unknown:
+            raise ValueError(f"Stage {stage.name} needs unknown stages {unknown}")
+    report : Dict[str, Tuple[str, float]] = {}
+    pending = list(stages)
+    # future -> (stage, workers it was given)
+    running : Dict[Future, Tuple[Stage, int]] = {}
+    free = workers
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def settle(stage: Stage, status: str, seconds: float) -> None:
+        report[stage.name] = (status, seconds)
+        print(f"[{stage.name}] {status}" + (f" in {seconds:.1f}s" if status == "ran" else ""), flush=True)
+
+    try:
+        while pending or running:
+            for stage in list(pending):
+                if any(report.get(need, ("", 0))[0] in ("failed", "blocked") for need in stage.needs):
+                    pending.remove(stage)
+                    settle(stage, "blocked", 0)
+                elif all(need in report for need in stage.needs):
+                    if (only is not None and stage.name not in only) or (not force and is_up_to_date(stage)):
+                        pending.remove(stage)
+                        settle(stage, "skipped", 0)
+                    elif executor is None:
+                        pending.remove(stage)
+                        try:
+                            settle(stage, "ran", _run_stage(stage, workers))
+                        except Exception:
+                            traceback.print_exc()
+                            settle(stage, "failed", 0)
+                    elif free > 0:
+                        pending.remove(stage)
+                        given = free if stage.pooled else 1
+                        free -= given
+                        running[executor.submit(_run_stage, stage, given)] = (stage, given)
+            if not running:
+                if pending and not any(all(need in report for need in stage.needs) for stage in pending):
+                    raise ValueError(f"Stages {[stage.name for stage in pending]} depend on each other")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, given = running.pop(future)
+                free += given
+                try:
+                    settle(stage, "ran", future.result())
+                except Exception:
+                    traceback.print_exc()
+                    settle(stage, "failed", 0)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return report
+
+
+def print_report(report: Dict[str, Tuple[str, float]]) -> None:
+    print("\n|Stage|Status|Wall time (s)|")
+    print("| --- | --- | --- |")
+    for name, (status, seconds) in report.items():
+        print(f"|{name}|{status}|{seconds:.2f}|")
+
+
+if __name__ == "__main__":
+    stages = default_stages()
+    parser = argparse.ArgumentParser(description="Run the datagen, Bloomberg, data_processing and reporting stages that are out of date")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes, independent stages run side by side when more than 1")
+    parser.add_argument("--force", action="store_true", help="run the stages even if their outputs are newer than their inputs")
+    parser.add_argument("--stages", nargs="+", choices=[stage.name for stage in stages], help="only run these stages")
+    parser.add_argument("--list", action="store_true", help="show the stages and whether they are up to date")
+    args = parser.parse_args()
+    if args.list:
+        for stage in stages:
+            print(f"{stage.name}: {'up to date' if is_up_to_date(stage) else 'out of date'}" + (f", after {', '.join(stage.needs)}" if stage.needs else ""))
+        sys.exit(0)
+    report = run_pipeline(stages, args.workers, args.force, args.stages)
+    print_report(report)
+    if any(status in ("failed", "blocked") for status, _ in report.values()):
+        sys.exit(1)
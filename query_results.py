@@ -0,0 +1,242 @@
+import os
+import re
+import sys
+import csv
+import json
+import heapq
+import argparse
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+from utilities.company_data import LONG_FORMAT_HEADER
+from extraction_methods.extract_bloomberg_data import parse_row_key
+
+DIR_processed_info = "data/output_data/processed_info"
+QUERY_CACHE_FILENAME = ".query_cache.npz"
+QUERY_CACHE_VERSION = 1
+
+METRICS = ["share_value", "loan_value", "financed_scope_1", "financed_scope_2", "financed_scope_3", "total_financed_emissions"]
+GROUP_KEYS = ["fi", "year", "ticker", "sector"]
+
+# A filter is one value or a list of accepted values
+Filter = Union[None, Any, Sequence[Any]]
+
+
+def _output_files(output_dir: str) -> Dict[int, str]:
+    """year -> long format output file written by data_processing"""
+    files = {}
+    for filename in os.listdir(output_dir):
+        match = re.fullmatch(r'financed_emissions_(\d{4})\.csv', filename)
+        if match:
+            files[int(match.group(1))] = os.path.join(output_dir, filename)
+    return files
+
+
+def _stat(paths: Iterable[str]) -> List[List[Any]]:
+    return [[path, os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in sorted(paths)]
+
+
+class FinancedEmissionsResults:
+    """
+    The company x financial institution x year results of data_processing as
+    columns, one entry per row of the long format output, with an index of
+    the rows of every financial institution, year and ticker. Filters start
+    from the smallest index that applies, so lookups do not scan the table.
+    """
+    def __init__(self, tickers: List[str], names: List[str], financial_institutions: List[str], company: np.ndarray, fi: np.ndarray, year: np.ndarray, metrics: Dict[str, np.ndarray], sectors: Optional[Dict[str, str]] = None):
+        self.tickers = tickers
+        self.names = names
+        self.financial_institutions = financial_institutions
+        self.company = company
+        self.fi = fi
+        self.year = year
+        self.metrics = metrics
+        self.sectors = sectors
+        self._indexes : Dict[str, Dict[Any, np.ndarray]] = {
+            "fi": self._index(fi, financial_institutions),
+            "year": self._index(year, None),
+            "ticker": self._index(company, tickers),
+        }
+
+    @staticmethod
+    def _index(column: np.ndarray, labels: Optional[List[str]]) -> Dict[Any, np.ndarray]:
+        order = np.argsort(column, kind='stable')
+        values, starts = np.unique(column[order], return_index=True)
+        bounds = list(starts) + [len(order)]
+        return {(labels[value] if labels is not None else int(value)): order[bounds[i]:bounds[i + 1]] for i, value in enumerate(values)}
+
+    @classmethod
+    def from_csv(cls, paths: Iterable[str]) -> "FinancedEmissionsResults":
+        ticker_ids : Dict[str, int] = {}
+        fi_ids : Dict[str, int] = {}
+        names : List[str] = []
+        company, fi, year = [], [], []
+        metrics : Dict[str, List[float]] = {metric: [] for metric in METRICS}
+        columns = {metric: LONG_FORMAT_HEADER.index(metric) for metric in METRICS}
+        ticker_column, name_column, fi_column = LONG_FORMAT_HEADER.index("ticker"), LONG_FORMAT_HEADER.index("name"), LONG_FORMAT_HEADER.index("financial_institution")
+        for path in paths:
+            with open(path, mode='r', newline='') as source_file:
+                reader = csv.reader(source_file)
+                next(reader, None)
+                for row in reader:
+                    key = parse_row_key(row[ticker_column])
+                    ticker = key[0] if key is not None else row[ticker_column]
+                    if ticker not in ticker_ids:
+                        ticker_ids[ticker] = len(ticker_ids)
+                        names.append(row[name_column])
+                    company.append(ticker_ids[ticker])
+                    fi.append(fi_ids.setdefault(row[fi_column], len(fi_ids)))
+                    year.append(int(row[0]))
+                    for metric, column in columns.items():
+                        metrics[metric].append(float(row[column]) if row[column] != '' else 0.0)
+        return cls(list(ticker_ids), names, list(fi_ids),
+                   np.array(company, dtype=np.int32), np.array(fi, dtype=np.int16), np.array(year, dtype=np.int16),
+                   {metric: np.array(values, dtype=np.float64) for metric, values in metrics.items()})
+
+    @classmethod
+    def load(cls, output_dir: str = DIR_processed_info) -> "FinancedEmissionsResults":
+        """
+        Load every financed_emissions_<year>.csv in output_dir. The parsed
+        columns are cached in output_dir/.query_cache.npz and reused as long
+        as the csv files are unchanged, so repeated queries start instantly.
+        """
+        files = _output_files(output_dir)
+        if not files:
+            raise FileNotFoundError(f"No financed_emissions_<year>.csv in {output_dir}, run data_processing first")
+        sources = _stat(files.values())
+        cache_path = os.path.join(output_dir, QUERY_CACHE_FILENAME)
+        try:
+            with np.load(cache_path, allow_pickle=False) as cached:
+                header = json.loads(str(cached["header"]))
+                if header["version"] == QUERY_CACHE_VERSION and header["sources"] == sources:
+                    return cls(header["tickers"], header["names"], header["financial_institutions"], cached["company"], cached["fi"], cached["year"], {metric: cached[metric] for metric in METRICS})
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            pass
+        results = cls.from_csv(files[year] for year in sorted(files))
+        header = {"version": QUERY_CACHE_VERSION, "sources": sources, "tickers": results.tickers, "names": results.names, "financial_institutions": results.financial_institutions}
+        temporary_path = cache_path + ".tmp.npz"
+        np.savez(temporary_path, header=np.array(json.dumps(header)), company=results.company, fi=results.fi, year=results.year, **results.metrics)
+        os.replace(temporary_path, cache_path)
+        return results
+
+    def sector_of(self, ticker: str) -> str:
+        if self.sectors is None:
+            from utilities.urgewald import get_urgewald_sectors
+            try:
+                self.sectors = get_urgewald_sectors()
+            except FileNotFoundError:
+                # Without the Urgewald lists every company is "Unknown"
+                self.sectors = {}
+        return self.sectors.get(ticker, "Unknown")
+
+    def select(self, fi: Filter = None, year: Filter = None, ticker: Filter = None, sector: Filter = None) -> np.ndarray:
+        """Row numbers matching every given filter, in table order."""
+        candidates : Optional[np.ndarray] = None
+        for key, accepted in (("fi", fi), ("year", year), ("ticker", ticker)):
+            if accepted is None:
+                continue
+            values = [accepted] if isinstance(accepted, (str, int)) else list(accepted)
+            index = self._indexes[key]
+            # np.unique sorts and drops the repeats of a value given twice,
+            # so both sides of the intersection are unique
+            rows = np.unique(np.concatenate([index.get(int(value) if key == "year" else value, np.empty(0, dtype=np.int64)) for value in values])) if values else np.empty(0, dtype=np.int64)
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+        if candidates is None:
+            candidates = np.arange(len(self.company))
+        if sector is not None:
+            accepted_sectors = {sector} if isinstance(sector, str) else set(sector)
+            keep = np.array([self.sector_of(ticker) in accepted_sectors for ticker in self.tickers], dtype=bool)
+            candidates = candidates[keep[self.company[candidates]]]
+        return candidates
+
+    def _group_labels(self, by: str, rows: np.ndarray) -> Tuple[np.ndarray, List[Any]]:
+        if by == "fi":
+            return self.fi[rows], self.financial_institutions
+        if by == "ticker":
+            return self.company[rows], self.tickers
+        if by == "year":
+            years = sorted({int(year) for year in np.unique(self.year[rows])})
+            return np.searchsorted(years, self.year[rows]), years
+        if by == "sector":
+            sectors = sorted({self.sector_of(ticker) for ticker in self.tickers})
+            company_sector = np.array([sectors.index(self.sector_of(ticker)) for ticker in self.tickers], dtype=np.int32)
+            return company_sector[self.company[rows]], sectors
+        raise ValueError(f"Can only group by one of {GROUP_KEYS}, not {by}")
+
+    def group_by(self, by: str, metric: str = "total_financed_emissions", **filters: Filter) -> Dict[Any, float]:
+        """Sum of metric over the rows matching filters, per fi, year, ticker or sector."""
+        rows = self.select(**filters)
+        groups, labels = self._group_labels(by, rows)
+        totals = np.bincount(groups, weights=self.metrics[metric][rows], minlength=len(labels))
+        present = np.bincount(groups, minlength=len(labels)) > 0
+        return {labels[i]: float(totals[i]) for i in range(len(labels)) if present[i]}
+
+    def top(self, metric: str = "total_financed_emissions", k: int = 10, by: str = "ticker", **filters: Filter) -> List[Tuple[Any, float]]:
+        """The k largest groups (companies by default) by metric among the rows matching filters."""
+        return heapq.nlargest(k, self.group_by(by, metric, **filters).items(), key=lambda item: item[1])
+
+    def rows(self, **filters: Filter) -> List[Dict[str, Any]]:
+        return [
+            {"ticker": self.tickers[self.company[row]], "name": self.names[self.company[row]], "fi": self.financial_institutions[self.fi[row]], "year": int(self.year[row]),
+             **{metric: float(self.metrics[metric][row]) for metric in METRICS}}
+            for row in self.select(**filters)
+        ]
+
+
+def _print_records(records: List[Dict[str, Any]], output_format: str) -> None:
+    if output_format == "json":
+        json.dump(records, sys.stdout, indent=2)
+        print()
+        return
+    if not records:
+        return
+    header = list(records[0])
+    if output_format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(header)
+        writer.writerows([record[column] for column in header] for record in records)
+        return
+    print("|" + "|".join(header) + "|")
+    print("|" + "|".join(" --- " for _ in header) + "|")
+    for record in records:
+        print("|" + "|".join(f"{value:,.2f}" if isinstance(value, float) else str(value) for value in record.values()) + "|")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Query the financed emissions computed by data_processing")
+    parser.add_argument("--output-dir", default=DIR_processed_info, help="where data_processing wrote financed_emissions_<year>.csv")
+    parser.add_argument("--format", choices=["table", "csv", "json"], default="table")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_filters(subparser: argparse.ArgumentParser) -> None:
+        subparser.add_argument("--fi", nargs="+", help="financial institutions")
+        subparser.add_argument("--year", type=int, nargs="+")
+        subparser.add_argument("--ticker", nargs="+", help='Bloomberg tickers, e.g. "XOM US Equity"')
+        subparser.add_argument("--sector", nargs="+", help='"Oil & Gas", "Coal" or "Unknown", from the Urgewald lists')
+
+    top_parser = subparsers.add_parser("top", help="largest groups by a metric, e.g. top 20 companies by financed scope 3 for TD in 2023")
+    top_parser.add_argument("-k", type=int, default=10)
+    top_parser.add_argument("--metric", choices=METRICS, default="total_financed_emissions")
+    top_parser.add_argument("--by", choices=GROUP_KEYS, default="ticker")
+    add_filters(top_parser)
+    group_parser = subparsers.add_parser("group", help="sum of a metric per fi, year, ticker or sector")
+    group_parser.add_argument("--by", choices=GROUP_KEYS, required=True)
+    group_parser.add_argument("--metric", choices=METRICS, default="total_financed_emissions")
+    add_filters(group_parser)
+    rows_parser = subparsers.add_parser("rows", help="the matching company x FI x year rows")
+    add_filters(rows_parser)
+    args = parser.parse_args(argv)
+
+    results = FinancedEmissionsResults.load(args.output_dir)
+    filters = {"fi": args.fi, "year": args.year, "ticker": args.ticker, "sector": args.sector}
+    if args.command == "top":
+        records = [{args.by: label, args.metric: value} for label, value in results.top(args.metric, args.k, args.by, **filters)]
+    elif args.command == "group":
+        records = [{args.by: label, args.metric: value} for label, value in results.group_by(args.by, args.metric, **filters).items()]
+    else:
+        records = results.rows(**filters)
+    _print_records(records, args.format)
+
+
+if __name__ == "__main__":
+    main()
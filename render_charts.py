@@ -0,0 +1,97 @@
+import os
+import csv
+import json
+import hashlib
+import argparse
+from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+DIR_graphs = "./data/output_data/serialized_fi_data"
+CHART_MANIFEST_FILENAME = ".chart_manifest.json"
+# Bump whenever the look of the charts changes, so every chart is drawn again
+CHART_VERSION = 2
+
+# (financial institution, years, financed emissions of each year)
+ChartData = Tuple[str, List[int], List[float]]
+
+
+def read_summary(graph_dir: str) -> List[ChartData]:
+    """The per institution totals data_processing saved to graph_dir/data.csv, years in ascending order."""
+    with open(os.path.join(graph_dir, "data.csv"), mode='r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        years = [int(year) for year in header[1:]]
+        order = sorted(range(len(years)), key=lambda i: years[i])
+        return [(row[0], [years[i] for i in order], [float(row[1 + i]) for i in order]) for row in reader if row]
+
+
+def chart_path(graph_dir: str, fi: str) -> str:
+    return os.path.join(graph_dir, f"{fi}_plot.png")
+
+
+def chart_fingerprint(chart: ChartData) -> str:
+    # Rounded to 12 significant digits so floating point noise in the totals
+    # does not redraw a chart that would look the same
+    fi, years, values = chart
+    return hashlib.sha1(json.dumps([CHART_VERSION, fi, years, [float(f"{value:.12g}") for value in values]]).encode()).hexdigest()
+
+
+def render_chart(chart: ChartData, path: str) -> str:
+    """Draw one institution's bar chart to path. Runs in worker processes."""
+    # Imported here so runs without charts never load matplotlib, and drawn
+    # on a standalone Figure so no pyplot state is shared between charts
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+    fi, years, values = chart
+    figure = Figure()
+    axes = figure.subplots()
+    axes.bar(years, values)
+    axes.set_title(f"{fi} Emissions data")
+    axes.set_xlabel("Year")
+    axes.set_ylabel("Financed CO2 Emission")
+    figure.savefig(path)
+    return path
+
+
+def render_charts(graph_dir: str = DIR_graphs, workers: int = 1, force: bool = False) -> List[str]:
+    """
+    Draw the chart of every institution in graph_dir/data.csv, skipping the
+    charts whose data is the same as when they were last drawn (recorded in
+    graph_dir/.chart_manifest.json). Returns the paths that were drawn.
+    """
+    manifest_path = os.path.join(graph_dir, CHART_MANIFEST_FILENAME)
+    manifest : Dict[str, str] = {}
+    if not force:
+        try:
+            with open(manifest_path, mode='r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    charts = read_summary(graph_dir)
+    fingerprints = {fi: chart_fingerprint((fi, years, values)) for fi, years, values in charts}
+    stale = [chart for chart in charts if manifest.get(chart[0]) != fingerprints[chart[0]] or not os.path.isfile(chart_path(graph_dir, chart[0]))]
+    paths = [chart_path(graph_dir, chart[0]) for chart in stale]
+    if workers > 1 and len(stale) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(render_chart, stale, paths))
+    else:
+        for chart, path in zip(stale, paths):
+            render_chart(chart, path)
+
+    temporary_path = manifest_path + ".tmp"
+    with open(temporary_path, mode='w') as f:
+        json.dump(fingerprints, f)
+    os.replace(temporary_path, manifest_path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Draw the per institution charts from the summary written by data_processing")
+    parser.add_argument("graph_dir", nargs="?", default=DIR_graphs)
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes, 1 draws serially")
+    parser.add_argument("--force", action="store_true", help="redraw every chart, even if its data is unchanged")
+    args = parser.parse_args()
+    drawn = render_charts(args.graph_dir, args.workers, args.force)
+    print(f"Drew {len(drawn)} charts in {args.graph_dir}")
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules are imported from the repository root, like the scripts run them
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
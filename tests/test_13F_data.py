@@ -0,0 +1,66 @@
+import os
+import random
+
+import pytest
+
+from extraction_methods.extract_13F_data import DIR_13F, get_share_value_from_directory, get_share_value_from_index, index_directory, is_year_end_filing, parse_quarter, _share_value_from_node, symbol_roots_in
+from extraction_methods.extract_13F_quarterly import QuarterlyHoldings
+from global_values import FINANCIAL_INSTITUTIONS
+
+HEADER = "Sym,Issuer Name,Cl,CUSIP,Value ($000),%,Shares,Principal,Option Type\n"
+
+
+def write_filing(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w', newline='') as f:
+        f.write(HEADER)
+        for symbol, cusip, value, shares in rows:
+            f.write(f"{symbol},Issuer,COM,{cusip},{value},0.1,{shares},SH,\n")
+
+
+def test_parse_quarter():
+    assert parse_quarter("Fund Q3 2021 13F Top Portfolio Holdings.csv") == (2021, 3)
+    assert parse_quarter("Fund 2021 holdings.csv") is None
+
+
+def test_year_end_filing():
+    assert is_year_end_filing("Fund Q4 2022 13F Top Portfolio Holdings.csv", 2022)
+    assert not is_year_end_filing("Fund Q2 2022 13F Top Portfolio Holdings.csv", 2022)
+    assert not is_year_end_filing("Fund Q4 2021 13F Top Portfolio Holdings.csv", 2022)
+    assert is_year_end_filing("Fund 2022 holdings.csv", 2022)
+
+
+def test_other_quarters_are_ignored(tmp_path):
+    directory = str(tmp_path / "Fund")
+    write_filing(os.path.join(directory, "Fund Q4 2022 13F Top Portfolio Holdings.csv"), [("XOM", "30231G102", 11142, 100)])
+    write_filing(os.path.join(directory, "Fund Q2 2022 13F Top Portfolio Holdings.csv"), [("XOM", "30231G102", 99999999, 900)])
+    assert get_share_value_from_directory("XOM US Equity 2022", directory, 2022, max) == 11142000
+    node = index_directory(directory, 2022)
+    assert _share_value_from_node(symbol_roots_in("XOM US Equity 2022"), node, max) == 11142000
+
+
+def test_quarterly_store_matches_yearly_lookup(tmp_path):
+    directory = str(tmp_path / "Fund")
+    write_filing(os.path.join(directory, "Fund Q4 2022 13F Top Portfolio Holdings.csv"), [("XOM", "30231G102", 500, 10), ("CVX", "166764100", 70, 1)])
+    write_filing(os.path.join(directory, "Sub", "Sub Q4 2022 13F Top Portfolio Holdings.csv"), [("XOM", "30231G102", 800, 20)])
+    write_filing(os.path.join(directory, "Sub", "Sub Q3 2022 13F Top Portfolio Holdings.csv"), [("XOM", "30231G102", 5, 1)])
+    store = QuarterlyHoldings("Fund", directory)
+    for ticker in ["XOM US Equity 2022", "CVX US Equity 2022", "SU CN Equity 2022"]:
+        holding = store.holding(store.match_ticker(ticker), (2022, 4), max)
+        assert holding[0] == get_share_value_from_directory(ticker, directory, 2022, max)
+    assert store.holding(store.match_ticker("XOM US Equity 2022"), (2022, 3), max) == (5000, 1)
+
+
+@pytest.mark.skipif(not os.path.isdir(DIR_13F), reason="no 13F downloads")
+def test_quarterly_store_matches_index_on_downloads():
+    # Q4 of the quarterly store against the yearly index data_processing uses,
+    # on random company-years of the symbols held
+    rng = random.Random(0)
+    for fi in FINANCIAL_INSTITUTIONS:
+        store = QuarterlyHoldings(fi, os.path.join(DIR_13F, fi))
+        symbols = sorted({symbol for _, symbol in store.securities if symbol})
+        for _ in range(min(300, len(symbols))):
+            year = rng.randrange(2018, 2025)
+            ticker = f"{rng.choice(symbols).split('.')[0]} US Equity {year}"
+            holding = store.holding(store.match_ticker(ticker), (year, 4), max)
+            assert (holding[0] if holding is not None else 0) == pytest.approx(get_share_value_from_index(ticker, fi, year, max))
@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+from helper_scripts.benchmark import STAGES
+from helper_scripts.synthetic_data import generate_dataset
+
+
+def test_generate_dataset_layout(tmp_path):
+    generate_dataset(str(tmp_path), scale=0.01, years=(2022,))
+    input_dir = tmp_path / "data" / "input_data"
+    # At this scale there are no loan tables, less than one bank's worth
+    for directory in ["13f_data", "Bloomberg", "tickers"]:
+        assert os.listdir(input_dir / directory)
+    assert all("2022" in file for _, _, files in os.walk(input_dir / "13f_data") for file in files)
+
+
+def test_benchmark_smoke(tmp_path):
+    # Every stage at a tiny scale, in the fresh processes the benchmark uses
+    output = tmp_path / "benchmark.json"
+    subprocess.run([sys.executable, "-m", "helper_scripts.benchmark", "--scale", "0.02", "--years", "1", "--samples", "5", "--data-dir", str(tmp_path / "data"), "--output", str(output)], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        report = json.load(f)
+    assert list(report) == ["0.02"]
+    assert sorted(report["0.02"]["stages"]) == sorted(STAGES)
+    assert all(stage["seconds"] >= 0 and stage["peak_rss_mb"] > 0 for stage in report["0.02"]["stages"].values())
@@ -0,0 +1,21 @@
+import pytest
+
+from extraction_methods.extract_bloomberg_data import resolve_universe
+
+
+@pytest.fixture
+def extract_dir(tmp_path):
+    with open(tmp_path / "GHG_emissions_a.csv", mode='w', newline='') as f:
+        for row in ["XOM US Equity 2022", "SU CN Equity 2022", "SU CN Equity 2021", "CVX US Equity 2022"]:
+            f.write(row + ",1,2,3\n")
+    return str(tmp_path)
+
+
+def test_bloomberg_tickers_are_kept(extract_dir):
+    assert resolve_universe(["XOM US Equity", "SU CN Equity"], extract_dir) == (["XOM US Equity", "SU CN Equity"], [])
+
+
+def test_bare_symbols_are_resolved(extract_dir):
+    tickers, unmatched = resolve_universe(["XOM", "SU.TO", "SU", "BP", "BP US Equity"], extract_dir)
+    assert tickers == ["XOM US Equity", "SU CN Equity"]
+    assert unmatched == ["BP", "BP US Equity"]
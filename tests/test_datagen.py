@@ -0,0 +1,10 @@
+from datagen import partition_alphabetical
+
+
+def test_partition_alphabetical_order():
+    partitions = partition_alphabetical(["XOM US Equity", "1605 JP Equity", "xop US Equity", "SU CN Equity", "XLE US Equity", "_X Equity"])
+    # A letter's tickers in reverse order, like the original pop-based split; the others in order
+    assert partitions["x"] == ["XLE US Equity", "xop US Equity", "XOM US Equity"]
+    assert partitions["s"] == ["SU CN Equity"]
+    assert partitions["others"] == ["1605 JP Equity", "_X Equity"]
+    assert partitions["a"] == []
@@ -0,0 +1,46 @@
+import csv
+import os
+
+from helper_scripts.filter_fossil_fuel import select_top_bulk_csv, select_top_csv
+
+HEADER = ["Sym", "Issuer Name", "Cl", "CUSIP", "Value ($000)"]
+ROWS = [
+    ["JPM", "JPMorgan", "COM", "1", "900"],
+    ["XOM", "Exxon", "COM", "2", "100"],
+    ["CVX", "Chevron", "COM", "3", "300"],
+    ["SU", "Suncor", "COM", "4", "n/a"],
+    ["COP", "ConocoPhillips", "COM", "5", "300"],
+    ["ENB", "Enbridge", "COM", "6", "50"],
+]
+CLASSIFICATIONS = {symbol: (symbol, f"{symbol} US Equity") for symbol in ["XOM", "CVX", "SU", "COP", "ENB"]}
+
+
+def write_csv(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w', newline='') as f:
+        csv.writer(f).writerows([HEADER] + rows)
+
+
+def read_symbols(path):
+    with open(path, mode='r', newline='') as f:
+        return [row[0] for row in csv.reader(f)][1:]
+
+
+def test_select_top_csv(tmp_path):
+    source, destination = str(tmp_path / "in.csv"), str(tmp_path / "out.csv")
+    write_csv(source, ROWS)
+    # Largest first, ties in file order, values that are not numbers last
+    assert select_top_csv(source, destination, 4, -1, CLASSIFICATIONS.get) == set(CLASSIFICATIONS.values())
+    assert read_symbols(destination) == ["CVX", "COP", "XOM", "ENB", "SU"]
+    assert select_top_csv(source, destination, 4, 2, CLASSIFICATIONS.get) == {CLASSIFICATIONS["CVX"], CLASSIFICATIONS["COP"]}
+    assert read_symbols(destination) == ["CVX", "COP"]
+
+
+def test_select_top_bulk_csv_with_workers(tmp_path):
+    source_root = str(tmp_path / "13f")
+    write_csv(os.path.join(source_root, "Fund", "Fund Q4 2021 13F.csv"), ROWS[:3])
+    write_csv(os.path.join(source_root, "Fund", "Sub", "Sub Q4 2022 13F.csv"), ROWS[3:])
+    serial = select_top_bulk_csv(source_root, str(tmp_path / "serial"), 4, CLASSIFICATIONS, top_number=1)
+    pooled = select_top_bulk_csv(source_root, str(tmp_path / "pooled"), 4, CLASSIFICATIONS, top_number=1, workers=2)
+    assert serial == pooled == {"2021": {CLASSIFICATIONS["CVX"]}, "2022": {CLASSIFICATIONS["COP"]}}
+    assert read_symbols(str(tmp_path / "pooled" / "Fund" / "Sub" / "Sub Q4 2022 13F_fossil_fuel.csv")) == ["COP"]
@@ -0,0 +1,61 @@
+import itertools
+import math
+
+import pytest
+
+from utilities.company_data import BLOOMBERG_FIELDS, FossilFuelCompanyYear
+from utilities.financed_emissions import SCOPES, FinancedEmissionsMatrix
+from global_values import FINANCIAL_INSTITUTIONS
+
+YEAR = 2022
+# Denominators and emissions that must behave the same way in both implementations
+DENOMINATORS = [1500.0, 0.0, None, math.nan]
+EMISSIONS = [2000.0, 0.0, None, math.nan]
+
+
+def make_company(ticker, market_cap, enterprise_value, scope_1, scope_2, scope_3):
+    line = [f"{ticker} US Equity {YEAR}"] + ["1"] * len(BLOOMBERG_FIELDS)
+    known = {fi: (1e6 * (i + 1), 2e6 * (i + 1)) for i, fi in enumerate(FINANCIAL_INSTITUTIONS)}
+    company = FossilFuelCompanyYear(None, YEAR, ticker, line=line, known=known)
+    company.historical_market_cap = market_cap
+    company.enterprise_value = enterprise_value
+    company.ghg_scope_1 = scope_1
+    company.ghg_scope_2_location_based = scope_2
+    for field in BLOOMBERG_FIELDS[3:19]:
+        setattr(company, field, None)
+    company.ghg_scope_3 = None
+    company.scope_3_purch_goods_srvcs = scope_3
+    company.scope_3_use_sold_products = 500.0
+    return company
+
+
+def test_matrix_matches_company_methods():
+    companies = [
+        make_company(f"T{n}", market_cap, enterprise_value, scope, EMISSIONS[(n + 1) % len(EMISSIONS)], EMISSIONS[(n + 2) % len(EMISSIONS)])
+        for n, (market_cap, enterprise_value, scope) in enumerate(itertools.product(DENOMINATORS, DENOMINATORS, EMISSIONS))
+    ]
+    financed = FinancedEmissionsMatrix(companies, FINANCIAL_INSTITUTIONS, [YEAR]).financed_emissions()
+    assert financed.shape == (len(SCOPES), len(companies), len(FINANCIAL_INSTITUTIONS), 1)
+    for c, company in enumerate(companies):
+        for f, fi in enumerate(FINANCIAL_INSTITUTIONS):
+            expected = [company.get_financed_scope_1_emission(fi), company.get_financed_scope_2_emission(fi), company.get_financed_scope_3_emission(fi)]
+            assert all(math.isfinite(value) for value in expected)
+            assert financed[:, c, f, 0].tolist() == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize("market_cap", [0.0, None, math.nan])
+@pytest.mark.parametrize("enterprise_value", [0.0, None, math.nan])
+def test_missing_denominators_contribute_nothing(market_cap, enterprise_value):
+    company = make_company("XOM", market_cap, enterprise_value, 2000.0, 2000.0, 2000.0)
+    for fi in FINANCIAL_INSTITUTIONS:
+        assert company.get_total_financed_emission(fi) == 0.0
+
+
+@pytest.mark.parametrize("scope", [0.0, None, math.nan])
+def test_missing_scope_contributes_nothing(scope):
+    company = make_company("XOM", 1500.0, 3000.0, scope, 2000.0, 2000.0)
+    share_value, loan_value = company._values_of("RBC")
+    assert company.get_financed_scope_1_emission("RBC") == 0.0
+    assert company.get_financed_scope_2_emission("RBC") == pytest.approx((share_value / 1500e6 + loan_value / 3000e6) * 2000.0 * 1000)
+    # A NaN scope 3 field is left out of the scope 3 total like a missing one
+    assert make_company("XOM", 1500.0, 3000.0, 1.0, 1.0, scope).total_scope_3_emissions() == 500.0
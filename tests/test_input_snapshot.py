@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from extraction_methods import BOCC_IICC, cusip_crosswalk, extract_bloomberg_data, extract_loan_data, input_snapshot
+import global_values
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(extract_bloomberg_data.DIR_bloomberg), reason="no input data")
+
+
+@pytest.fixture
+def fresh_caches(monkeypatch):
+    # Every cache the snapshot fills, put back as they were after the test
+    monkeypatch.setattr(cusip_crosswalk, "_cusip_tables", {})
+    monkeypatch.setattr(extract_loan_data, "_loan_indexes", {})
+    monkeypatch.setattr(BOCC_IICC, "_BOCC_indexes", {})
+    monkeypatch.setattr(BOCC_IICC, "_IICC_indexes", {})
+    monkeypatch.setattr(extract_bloomberg_data, "_bloomberg_stores", {})
+    monkeypatch.setattr(global_values, "TICKER_PROVIDERS", dict(global_values.TICKER_PROVIDERS))
+
+
+def test_snapshot_matches_the_csv_inputs(tmp_path, fresh_caches):
+    snapshot_dir = str(tmp_path / "snapshot")
+    bloomberg_dir = extract_bloomberg_data.DIR_bloomberg
+    input_snapshot.compile_inputs(snapshot_dir, bloomberg_dir)
+    assert input_snapshot.is_snapshot_current(snapshot_dir, bloomberg_dir)
+    expected_store = extract_bloomberg_data.load_bloomberg_store(bloomberg_dir)
+
+    for module, cache in [(cusip_crosswalk, "_cusip_tables"), (extract_loan_data, "_loan_indexes"), (BOCC_IICC, "_BOCC_indexes"), (BOCC_IICC, "_IICC_indexes")]:
+        setattr(module, cache, {})
+    extract_bloomberg_data._bloomberg_stores.clear()
+    assert input_snapshot.load_snapshot(snapshot_dir, bloomberg_dir)
+
+    # Nothing is built before it is asked for
+    assert len(cusip_crosswalk._cusip_tables) == 0 and cusip_crosswalk._cusip_tables.builders
+    assert len(BOCC_IICC._BOCC_indexes) == 0 and BOCC_IICC._BOCC_indexes.builders
+
+    store = extract_bloomberg_data.get_bloomberg_store(bloomberg_dir)
+    assert len(store) == len(expected_store)
+    for key in list(expected_store)[::97]:
+        assert store[key] == expected_store[key]
+    for path in list(cusip_crosswalk._cusip_tables.builders)[::10]:
+        table = cusip_crosswalk.read_cusip_table(path)
+        # Parsed from the csv once it is out of the cache
+        del cusip_crosswalk._cusip_tables[path]
+        assert cusip_crosswalk.read_cusip_table(path) == table
+    for bank in list(extract_loan_data._loan_indexes.builders):
+        assert extract_loan_data.get_loan_index(bank) == extract_loan_data.build_loan_index(bank)
+    for bank in list(BOCC_IICC._BOCC_indexes.builders):
+        assert BOCC_IICC.get_BOCC_index(bank) == BOCC_IICC.build_BOCC_index(bank)
+    for fi in list(BOCC_IICC._IICC_indexes.builders):
+        assert BOCC_IICC.get_IICC_index(fi) == BOCC_IICC.build_IICC_index(fi)
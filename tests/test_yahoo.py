@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from utilities import yahoo
+from utilities.yahoo import TokenBucket, YahooClassifier
+
+OIL = {"sector": "Energy", "industry": "Oil & Gas Integrated", "exchange": "NYSE", "country": ""}
+BANK = {"sector": "Financial Services", "industry": "Banks", "exchange": "NYSE", "country": ""}
+
+
+class FakeClock:
+    """Stands in for time.time, time.monotonic and time.sleep, sleeping only advances it."""
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(yahoo.time, "time", clock.time)
+    monkeypatch.setattr(yahoo.time, "monotonic", clock.time)
+    monkeypatch.setattr(yahoo.time, "sleep", clock.sleep)
+    # No jitter, so the backoff waits are exact
+    monkeypatch.setattr(yahoo.random, "uniform", lambda low, high: 1.0)
+    return clock
+
+
+class StubFetch:
+    """fetch_info that raises for the first `failures` calls of each symbol, then answers from infos."""
+    def __init__(self, infos, failures=0):
+        self.infos = infos
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, symbol):
+        self.calls.append(symbol)
+        if self.calls.count(symbol) <= self.failures:
+            raise ConnectionError("Too Many Requests")
+        return self.infos[symbol]
+
+
+def make_classifier(tmp_path, fetch, **kwargs):
+    kwargs.setdefault("requests_per_second", 1000)
+    kwargs.setdefault("burst", 1000)
+    return YahooClassifier(cache_path=str(tmp_path / "yahoo_cache.json"), workers=1, fetch_info=fetch, **kwargs)
+
+
+def test_retries_with_exponential_backoff(tmp_path, clock):
+    fetch = StubFetch({"XOM": OIL}, failures=3)
+    classifier = make_classifier(tmp_path, fetch, backoff_seconds=2, max_backoff_seconds=5)
+    assert classifier.classify("XOM") == ("XOM", "XOM_US")
+    assert fetch.calls == ["XOM"] * 4
+    # 2, 4, then 8 capped at max_backoff_seconds
+    assert clock.sleeps == [2, 4, 5]
+
+
+def test_failed_lookups_are_not_cached(tmp_path, clock):
+    fetch = StubFetch({"XOM": OIL}, failures=3)
+    classifier = make_classifier(tmp_path, fetch, max_retries=2)
+    assert classifier.classify_many(["XOM"]) == {"XOM": None}
+    assert classifier.failed == {"XOM"}
+    # Not requested again in the same run, and not written to the cache
+    assert classifier.classify("XOM") is None
+    assert len(fetch.calls) == 2
+    with open(tmp_path / "yahoo_cache.json") as f:
+        assert json.load(f) == {}
+    # The next run asks again and succeeds
+    assert make_classifier(tmp_path, fetch).classify_many(["XOM"]) == {"XOM": ("XOM", "XOM_US")}
+    assert len(fetch.calls) == 4
+
+
+def test_cache_entries_expire(tmp_path, clock):
+    fetch = StubFetch({"XOM": OIL, "JPM": BANK})
+    make_classifier(tmp_path, fetch, ttl_seconds=100).classify_many(["XOM", "JPM", "XOM"])
+    assert sorted(fetch.calls) == ["JPM", "XOM"]
+    # Fresh entries, including negative answers, are served from the cache
+    classifier = make_classifier(tmp_path, fetch, ttl_seconds=100)
+    assert classifier.classify_many(["XOM", "JPM"]) == {"XOM": ("XOM", "XOM_US"), "JPM": None}
+    assert len(fetch.calls) == 2
+    clock.now += 101
+    assert make_classifier(tmp_path, fetch, ttl_seconds=100).classify_many(["XOM"]) == {"XOM": ("XOM", "XOM_US")}
+    assert len(fetch.calls) == 3
+
+
+def test_token_bucket_limits_the_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=4)
+    start = clock.now
+    for _ in range(10):
+        bucket.acquire()
+    # The burst of 4 is free, the 6 others come at 2 per second
+    assert clock.now - start == pytest.approx(3)
+
+
+def test_classifier_requests_go_through_the_bucket(tmp_path, clock):
+    fetch = StubFetch({symbol: BANK for symbol in ["A", "B", "C", "D", "E"]}, failures=1)
+    start = clock.now
+    make_classifier(tmp_path, fetch, requests_per_second=1, burst=1, backoff_seconds=0.001).classify_many(["A", "B", "C", "D", "E"])
+    # 10 requests (each symbol fails once) at one per second after the first
+    assert len(fetch.calls) == 10
+    assert clock.now - start == pytest.approx(9, abs=0.01)
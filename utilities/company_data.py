@@ -1,122 +1,156 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
+from array import array
 import csv
-from utilities.helper_functions import safe_to_float
+import numpy as np
+from utilities.helper_functions import safe_to_float, parse_float_rows
+from utilities import instrumentation
 from global_values import FINANCIAL_INSTITUTIONS, LOAN_DATA_COLLECTION, HOLDINGS_DATA_COLLECTION
 
+# Columns 1 to 28 of a Bloomberg extract row, in order
+BLOOMBERG_FIELDS = [
+    'ghg_scope_1', 'ghg_scope_2_location_based', 'ghg_scope_3',
+    'scope_3_purch_goods_srvcs', 'scope_3_capital_goods', 'scope_3_fuel_enrg_relatd_act',
+    'scope_3_upstream_trans_dist', 'scope_3_waste_genrtd_in_op', 'scope_3_business_trvl_emissions',
+    'scope_3_employee_commuting', 'scope_3_upstream_leased_assets', 'scope_3_dwnstrm_trans_dist',
+    'scope_3_prcss_of_sold_prods', 'scope_3_use_sold_products', 'scope_3_eol_trtmnt_prods',
+    'scope_3_dwnstrm_lease_assts', 'scope_3_franchises', 'scope_3_investments',
+    'scope_3_emissions_other', 'enterprise_value', 'is_comp_sales', 'historical_market_cap',
+    'name', 'is_avg_num_sh_for_eps', 'px_last', 'short_and_long_term_debt',
+    'cash_and_marketable_securities', 'bs_tot_asset'
+]
+SCOPE_3_FIELDS = BLOOMBERG_FIELDS[3:19]
+# Extract columns holding numbers, everything but the name
+NUMERIC_COLUMNS = [column for column, field in enumerate(BLOOMBERG_FIELDS, start=1) if field != 'name']
+
+
+def parse_bloomberg_values(lines: List[List[str]]) -> np.ndarray:
+    """The numeric fields of many extract rows at once, a row of NUMERIC_COLUMNS per line, NaN where there is no value."""
+    return parse_float_rows(lines, NUMERIC_COLUMNS)
+
+def _is_missing(value: Optional[float]) -> bool:
+    # NaN (e.g. a "nan" cell read with safe_to_float) counts as missing like None
+    return value is None or value != value
+
+# Columns of the long format output, one row per company-year and financial institution
+LONG_FORMAT_HEADER = ['year', 'ticker'] + BLOOMBERG_FIELDS + [
+    'financial_institution', 'share_value', 'loan_value',
+    'financed_scope_1', 'financed_scope_2', 'financed_scope_3', 'total_financed_emissions'
+]
+
 class FossilFuelCompanyYear:
+    # No per-instance __dict__, and the holdings and loans of each financial
+    # institution are packed in arrays (in FINANCIAL_INSTITUTIONS order) so
+    # every company-year of the universe fits in memory at once
+    __slots__ = ('year', 'ticker', *BLOOMBERG_FIELDS, 'holdings', 'loans')
+
     year : int
     ticker : str
-    ghg_scope_1 : Optional[float] = None
-    ghg_scope_2_location_based : Optional[float] = None
-    ghg_scope_3 : Optional[float] = None
-    scope_3_purch_goods_srvcs : Optional[float] = None
-    scope_3_capital_goods : Optional[float] = None
-    scope_3_fuel_enrg_relatd_act : Optional[float] = None
-    scope_3_upstream_trans_dist : Optional[float] = None
-    scope_3_waste_genrtd_in_op : Optional[float] = None
-    scope_3_business_trvl_emissions : Optional[float] = None
-    scope_3_employee_commuting : Optional[float] = None
-    scope_3_upstream_leased_assets : Optional[float] = None
-    scope_3_dwnstrm_trans_dist : Optional[float] = None
-    scope_3_prcss_of_sold_prods : Optional[float] = None
-    scope_3_use_sold_products : Optional[float] = None
-    scope_3_eol_trtmnt_prods : Optional[float] = None
-    scope_3_dwnstrm_lease_assts : Optional[float] = None
-    scope_3_franchises : Optional[float] = None
-    scope_3_investments : Optional[float] = None
-    scope_3_emissions_other : Optional[float] = None
-    enterprise_value : Optional[float] = None
-    is_comp_sales : Optional[float] = None
-    historical_market_cap : Optional[float] = None
-    name : Optional[str] = None
-    is_avg_num_sh_for_eps : Optional[float] = None
-    px_last :  Optional[float] = None
-    short_and_long_term_debt : Optional[float] = None
-    cash_and_marketable_securities : Optional[float] = None
-    bs_tot_asset : Optional[float] = None
-
-    share_values : Dict[str, float] = {}
-    loan_values : Dict[str, float] = {}
-
-    
+    ghg_scope_1 : Optional[float]
+    ghg_scope_2_location_based : Optional[float]
+    ghg_scope_3 : Optional[float]
+    scope_3_purch_goods_srvcs : Optional[float]
+    scope_3_capital_goods : Optional[float]
+    scope_3_fuel_enrg_relatd_act : Optional[float]
+    scope_3_upstream_trans_dist : Optional[float]
+    scope_3_waste_genrtd_in_op : Optional[float]
+    scope_3_business_trvl_emissions : Optional[float]
+    scope_3_employee_commuting : Optional[float]
+    scope_3_upstream_leased_assets : Optional[float]
+    scope_3_dwnstrm_trans_dist : Optional[float]
+    scope_3_prcss_of_sold_prods : Optional[float]
+    scope_3_use_sold_products : Optional[float]
+    scope_3_eol_trtmnt_prods : Optional[float]
+    scope_3_dwnstrm_lease_assts : Optional[float]
+    scope_3_franchises : Optional[float]
+    scope_3_investments : Optional[float]
+    scope_3_emissions_other : Optional[float]
+    enterprise_value : Optional[float]
+    is_comp_sales : Optional[float]
+    historical_market_cap : Optional[float]
+    name : Optional[str]
+    is_avg_num_sh_for_eps : Optional[float]
+    px_last :  Optional[float]
+    short_and_long_term_debt : Optional[float]
+    cash_and_marketable_securities : Optional[float]
+    bs_tot_asset : Optional[float]
+
+    holdings : array
+    loans : array
+
+    @property
+    def share_values(self) -> Dict[str, float]:
+        return dict(zip(FINANCIAL_INSTITUTIONS, self.holdings))
+
+    @property
+    def loan_values(self) -> Dict[str, float]:
+        return dict(zip(FINANCIAL_INSTITUTIONS, self.loans))
+
+    def _values_of(self, fi: str) -> Tuple[float, float]:
+        """(holdings value, loan value) of financial institution fi"""
+        i = FINANCIAL_INSTITUTIONS.index(fi)
+        return self.holdings[i], self.loans[i]
+
     def _read_from_csv(self, path_to_csv: str, year: int, ticker: str):
-        self.year = year
         with open(path_to_csv, mode='r', newline='') as source_file:
             reader = csv.reader(source_file)
             for line in reader:
                 if str(year) in line[0] and ticker in line[0]:
-                    self.ticker = line[0]
-                    fields = [safe_to_float(val) for val in line]
-                    self.ghg_scope_1 = fields[1] 
-                    self.ghg_scope_2_location_based = fields[2] 
-                    self.ghg_scope_3 = fields[3]
-                    self.scope_3_purch_goods_srvcs = fields[4]
-                    self.scope_3_capital_goods = fields[5]
-                    self.scope_3_fuel_enrg_relatd_act = fields[6]
-                    self.scope_3_upstream_trans_dist = fields[7]
-                    self.scope_3_waste_genrtd_in_op = fields[8]
-                    self.scope_3_business_trvl_emissions = fields[9]
-                    self.scope_3_employee_commuting = fields[10]
-                    self.scope_3_upstream_leased_assets = fields[11]
-                    self.scope_3_dwnstrm_trans_dist = fields[12]
-                    self.scope_3_prcss_of_sold_prods = fields[13]
-                    self.scope_3_use_sold_products = fields[14]
-                    self.scope_3_eol_trtmnt_prods = fields[15]
-                    self.scope_3_dwnstrm_lease_assts = fields[16]
-                    self.scope_3_franchises = fields[17]
-                    self.scope_3_investments = fields[18]
-                    self.scope_3_emissions_other = fields[19]
-                    self.enterprise_value = fields[20]
-                    self.is_comp_sales = fields[21]
-                    self.historical_market_cap = fields[22]
-                    self.name = line[23] if len(line) > 23 else ""
-                    self.is_avg_num_sh_for_eps = safe_to_float(line[24]) if len(line) > 24 else None
-                    self.px_last = safe_to_float(line[25]) if len(line) > 25 else None
-                    self.short_and_long_term_debt = safe_to_float(line[26]) if len(line) > 26 else None
-                    self.cash_and_marketable_securities = safe_to_float(line[27]) if len(line) > 27 else None
-                    self.bs_tot_asset = safe_to_float(line[28]) if len(line) > 28 else None
+                    self._read_from_line(line, year)
                     return
             raise StopIteration
+
+    def _read_from_line(self, line: List[str], year: int, values: Optional[np.ndarray] = None):
+        self.year = year
+        self.ticker = line[0]
+        if values is not None:
+            self.name = line[23] if len(line) > 23 else ""
+            for field, value in zip((field for field in BLOOMBERG_FIELDS if field != 'name'), values.tolist()):
+                setattr(self, field, None if value != value else value)
+            return
+        fields = [safe_to_float(val) for val in line]
+        for i, field in enumerate(BLOOMBERG_FIELDS[:22], start=1):
+            setattr(self, field, fields[i])
+        self.name = line[23] if len(line) > 23 else ""
+        # The last columns are missing from older extracts
+        for i, field in enumerate(BLOOMBERG_FIELDS[23:], start=24):
+            setattr(self, field, fields[i] if len(line) > i else None)
             
-    def __init__(self, path_to_csv: str, year: int, ticker: str):
-        self._read_from_csv(path_to_csv, year, ticker)
-        for financial_institution in FINANCIAL_INSTITUTIONS:
-            if self.ticker is not None:
-                self.share_values[financial_institution] = HOLDINGS_DATA_COLLECTION(self.ticker, self.name, financial_institution, year)
-            if self.name is not None:    
-                self.loan_values[financial_institution] = LOAN_DATA_COLLECTION(self.ticker, self.name, financial_institution, year)
+    def __init__(self, path_to_csv: Optional[str], year: int, ticker: str, line: Optional[List[str]] = None, values: Optional[np.ndarray] = None, known: Optional[Dict[str, Tuple[float, float]]] = None):
+        """
+        Load the Bloomberg fields either from an already parsed extract row
+        (see extraction_methods.extract_bloomberg_data) or by scanning path_to_csv.
+        values are the numeric fields of line if they were already parsed with
+        parse_bloomberg_values. known maps financial institutions to their
+        (holdings, loan) value when it is already known (e.g. from the result
+        cache), only the others are looked up.
+        """
+        if line is not None:
+            self._read_from_line(line, year, values)
+        else:
+            self._read_from_csv(path_to_csv, year, ticker)
+        instrumentation.count("companies.loaded")
+        known = known or {}
+        with instrumentation.stage("companies.holdings_lookup"):
+            self.holdings = array('d', (known[financial_institution][0] if financial_institution in known else HOLDINGS_DATA_COLLECTION(self.ticker, self.name, financial_institution, year) for financial_institution in FINANCIAL_INSTITUTIONS))
+        with instrumentation.stage("companies.loan_lookup"):
+            self.loans = array('d', (known[financial_institution][1] if financial_institution in known else LOAN_DATA_COLLECTION(self.ticker, self.name, financial_institution, year) for financial_institution in FINANCIAL_INSTITUTIONS))
 
 
             
     def total_scope_3_emissions(self) -> float:
-        scope_3_fields = [
-            self.scope_3_purch_goods_srvcs,
-            self.scope_3_capital_goods,
-            self.scope_3_fuel_enrg_relatd_act,
-            self.scope_3_upstream_trans_dist,
-            self.scope_3_waste_genrtd_in_op,
-            self.scope_3_business_trvl_emissions,
-            self.scope_3_employee_commuting,
-            self.scope_3_upstream_leased_assets,
-            self.scope_3_dwnstrm_trans_dist,
-            self.scope_3_prcss_of_sold_prods,
-            self.scope_3_use_sold_products,
-            self.scope_3_eol_trtmnt_prods,
-            self.scope_3_dwnstrm_lease_assts,
-            self.scope_3_franchises,
-            self.scope_3_investments,
-            self.scope_3_emissions_other,
-        ]
-        return sum(v for v in scope_3_fields if v is not None)
+        scope_3_fields = [getattr(self, field) for field in SCOPE_3_FIELDS]
+        return sum(v for v in scope_3_fields if not _is_missing(v))
 
+    # A missing (None or NaN) or zero market cap / enterprise value leaves out
+    # the shares / loans term, and a missing scope both terms, like
+    # FinancedEmissionsMatrix.financed_emissions
     def get_financed_scope_1_emission(self, fi: str) -> Optional[float]:
-        share_value = self.share_values[fi]
-        loan_value = self.loan_values[fi]
+        share_value, loan_value = self._values_of(fi)
         total = 0.0
-        if self.historical_market_cap is not None and self.ghg_scope_1 is not None :
+        if self.historical_market_cap and not _is_missing(self.historical_market_cap) and not _is_missing(self.ghg_scope_1) :
             emissions_from_shares = (share_value / (self.historical_market_cap * (10 ** 6))) * self.ghg_scope_1 * 1000
             total += emissions_from_shares
-        if self.enterprise_value is not None and self.ghg_scope_1 is not None:
+        if self.enterprise_value and not _is_missing(self.enterprise_value) and not _is_missing(self.ghg_scope_1):
             emissions_from_loans = (loan_value / (self.enterprise_value * (10 ** 6))) * self.ghg_scope_1 * 1000
             total += emissions_from_loans
         return total
@@ -124,26 +158,25 @@ class FossilFuelCompanyYear:
 
         
     def get_financed_scope_2_emission(self, fi: str) -> Optional[float]:
-        share_value = self.share_values[fi]
-        loan_value = self.loan_values[fi]
+        share_value, loan_value = self._values_of(fi)
         total = 0.0
-        if self.historical_market_cap is not None and self.ghg_scope_2_location_based is not None :
+        if self.historical_market_cap and not _is_missing(self.historical_market_cap) and not _is_missing(self.ghg_scope_2_location_based) :
             emissions_from_shares = (share_value / (self.historical_market_cap * (10 ** 6))) * self.ghg_scope_2_location_based * 1000
             total += emissions_from_shares
-        if self.enterprise_value is not None and self.ghg_scope_2_location_based is not None:
+        if self.enterprise_value and not _is_missing(self.enterprise_value) and not _is_missing(self.ghg_scope_2_location_based):
             emissions_from_loans = (loan_value / (self.enterprise_value * (10 ** 6))) * self.ghg_scope_2_location_based * 1000
             total += emissions_from_loans
         return total
 
     def get_financed_scope_3_emission(self, fi: str) -> Optional[float]:
-        share_value = self.share_values[fi]
-        loan_value = self.loan_values[fi]
+        share_value, loan_value = self._values_of(fi)
         total = 0.0
-        if self.historical_market_cap is not None and self.total_scope_3_emissions() is not None :
-            emissions_from_shares = (share_value / (self.historical_market_cap * (10 ** 6))) * self.total_scope_3_emissions() * 1000
+        total_scope_3 = self.total_scope_3_emissions()
+        if self.historical_market_cap and not _is_missing(self.historical_market_cap) and not _is_missing(total_scope_3) :
+            emissions_from_shares = (share_value / (self.historical_market_cap * (10 ** 6))) * total_scope_3 * 1000
             total += emissions_from_shares
-        if self.enterprise_value is not None and self.total_scope_3_emissions() is not None:
-            emissions_from_loans = (loan_value / (self.enterprise_value * (10 ** 6))) * self.total_scope_3_emissions() * 1000
+        if self.enterprise_value and not _is_missing(self.enterprise_value) and not _is_missing(total_scope_3):
+            emissions_from_loans = (loan_value / (self.enterprise_value * (10 ** 6))) * total_scope_3 * 1000
             total += emissions_from_loans
         return total
 
@@ -158,21 +191,12 @@ class FossilFuelCompanyYear:
         
 
     def export_with_financed_data_to_csv(self, output_path: str):
-        with open(output_path, mode='w', newline='') as f:
+        instrumentation.count("companies.exported")
+        with instrumentation.stage("companies.export_csv"), open(output_path, mode='w', newline='') as f:
             writer = csv.writer(f)
 
             # Write raw data (header and values)
-            raw_fields = [
-                'year', 'ticker', 'ghg_scope_1', 'ghg_scope_2_location_based', 'ghg_scope_3',
-                'scope_3_purch_goods_srvcs', 'scope_3_capital_goods', 'scope_3_fuel_enrg_relatd_act',
-                'scope_3_upstream_trans_dist', 'scope_3_waste_genrtd_in_op', 'scope_3_business_trvl_emissions',
-                'scope_3_employee_commuting', 'scope_3_upstream_leased_assets', 'scope_3_dwnstrm_trans_dist',
-                'scope_3_prcss_of_sold_prods', 'scope_3_use_sold_products', 'scope_3_eol_trtmnt_prods',
-                'scope_3_dwnstrm_lease_assts', 'scope_3_franchises', 'scope_3_investments',
-                'scope_3_emissions_other', 'enterprise_value', 'is_comp_sales', 'historical_market_cap',
-                'name', 'is_avg_num_sh_for_eps', 'px_last', 'short_and_long_term_debt',
-                'cash_and_marketable_securities', 'bs_tot_asset'
-            ]
+            raw_fields = ['year', 'ticker'] + BLOOMBERG_FIELDS
             writer.writerow(raw_fields)
             writer.writerow([getattr(self, field) for field in raw_fields])
 
@@ -191,3 +215,16 @@ class FossilFuelCompanyYear:
                 ]
                 writer.writerow(row)
 
+    def long_format_rows(self) -> List[List]:
+        """The company-year's rows of the long format output (see LONG_FORMAT_HEADER)"""
+        raw = [self.year, self.ticker] + [getattr(self, field) for field in BLOOMBERG_FIELDS]
+        return [
+            raw + [
+                fi, share_value, loan_value,
+                self.get_financed_scope_1_emission(fi),
+                self.get_financed_scope_2_emission(fi),
+                self.get_financed_scope_3_emission(fi),
+                self.get_total_financed_emission(fi)
+            ]
+            for fi, share_value, loan_value in zip(FINANCIAL_INSTITUTIONS, self.holdings, self.loans)
+        ]
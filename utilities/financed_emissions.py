@@ -0,0 +1,104 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from utilities.company_data import FossilFuelCompanyYear
+from extraction_methods.extract_bloomberg_data import parse_row_key
+
+SCOPES = ["Financed Scope 1", "Financed Scope 2", "Financed Scope 3"]
+
+
+def _to_nan(value: Optional[float]) -> float:
+    return np.nan if value is None else value
+
+
+class FinancedEmissionsMatrix:
+    """
+    Holdings, loans and Bloomberg fields of many company-years laid out as
+    arrays so that every financed emission is computed with a few broadcasted
+    operations instead of per object and per financial institution.
+
+    holdings, loans: (company, financial institution, year)
+    scope_1, scope_2, scope_3, market_cap, enterprise_value: (company, year)
+    Missing Bloomberg values are NaN.
+    """
+    tickers : List[str]
+    financial_institutions : List[str]
+    years : List[int]
+
+    def __init__(self, companies: Iterable[FossilFuelCompanyYear], financial_institutions: List[str], years: List[int]):
+        companies = list(companies)
+        self.financial_institutions = list(financial_institutions)
+        self.years = list(years)
+        self.tickers = []
+        company_index : Dict[str, int] = {}
+        positions : List[Tuple[int, int]] = []
+        year_index = {year: j for j, year in enumerate(self.years)}
+        for company in companies:
+            key = parse_row_key(company.ticker)
+            ticker = key[0] if key is not None else company.ticker
+            if ticker not in company_index:
+                company_index[ticker] = len(self.tickers)
+                self.tickers.append(ticker)
+            positions.append((company_index[ticker], year_index[company.year]))
+
+        shape = (len(self.tickers), len(self.years))
+        fi_shape = (len(self.tickers), len(self.financial_institutions), len(self.years))
+        self.holdings = np.zeros(fi_shape)
+        self.loans = np.zeros(fi_shape)
+        self.scope_1 = np.full(shape, np.nan)
+        self.scope_2 = np.full(shape, np.nan)
+        self.scope_3 = np.full(shape, np.nan)
+        self.market_cap = np.full(shape, np.nan)
+        self.enterprise_value = np.full(shape, np.nan)
+
+        for company, (c, y) in zip(companies, positions):
+            share_values, loan_values = company.share_values, company.loan_values
+            self.holdings[c, :, y] = [share_values.get(fi, 0) for fi in self.financial_institutions]
+            self.loans[c, :, y] = [loan_values.get(fi, 0) for fi in self.financial_institutions]
+            self.scope_1[c, y] = _to_nan(company.ghg_scope_1)
+            self.scope_2[c, y] = _to_nan(company.ghg_scope_2_location_based)
+            self.scope_3[c, y] = company.total_scope_3_emissions()
+            self.market_cap[c, y] = _to_nan(company.historical_market_cap)
+            self.enterprise_value[c, y] = _to_nan(company.enterprise_value)
+
+    def financed_emissions(self) -> np.ndarray:
+        """
+        Financed scope 1, 2 and 3 emissions with shape (3, company, financial
+        institution, year), following FossilFuelCompanyYear.get_financed_scope_*_emission.
+        A term whose denominator is missing or zero contributes nothing, in
+        both implementations.
+        """
+        emissions = np.stack([self.scope_1, self.scope_2, self.scope_3])[:, :, np.newaxis, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share_ratio = self.holdings / (self.market_cap * (10 ** 6))[:, np.newaxis, :]
+            loan_ratio = self.loans / (self.enterprise_value * (10 ** 6))[:, np.newaxis, :]
+            from_shares = share_ratio * emissions * 1000
+            from_loans = loan_ratio * emissions * 1000
+        return np.where(np.isfinite(from_shares), from_shares, 0.0) + np.where(np.isfinite(from_loans), from_loans, 0.0)
+
+    def total_financed_emissions(self) -> np.ndarray:
+        """(company, financial institution, year) sum of the three scopes"""
+        return self.financed_emissions().sum(axis=0)
+
+    def financial_institution_totals(self) -> np.ndarray:
+        """(financial institution, year) total financed emissions over all companies"""
+        return self.total_financed_emissions().sum(axis=0)
+
+
+if __name__ == "__main__":
+    # Parity check against the per-object implementation
+    from global_values import FINANCIAL_INSTITUTIONS, get_fossil_fuel_tickers
+    from extraction_methods.extract_bloomberg_data import get_bloomberg_store
+    store = get_bloomberg_store()
+    year = 2022
+    companies = [FossilFuelCompanyYear(None, year, ticker, line=store[(ticker, year)]) for ticker in get_fossil_fuel_tickers() if (ticker, year) in store]
+    matrix = FinancedEmissionsMatrix(companies, FINANCIAL_INSTITUTIONS, [year])
+    financed = matrix.financed_emissions()
+    worst = 0.0
+    for company in companies:
+        c = matrix.tickers.index(parse_row_key(company.ticker)[0])
+        for f, fi in enumerate(FINANCIAL_INSTITUTIONS):
+            expected = [company.get_financed_scope_1_emission(fi), company.get_financed_scope_2_emission(fi), company.get_financed_scope_3_emission(fi)]
+            for s in range(len(SCOPES)):
+                worst = max(worst, abs(financed[s, c, f, 0] - expected[s]) / max(abs(expected[s]), 1.0))
+    print(f"Compared {len(companies)} companies, largest relative difference: {worst}")
+    assert worst <= 1e-9, f"FinancedEmissionsMatrix differs from FossilFuelCompanyYear by {worst}"
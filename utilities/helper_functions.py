@@ -1,6 +1,8 @@
 import sys
-from typing import Any, List, Optional
+from functools import lru_cache
+from typing import Any, FrozenSet, List, Optional, Sequence, Set
 import os, shutil
+import numpy as np
 
 def print_cond(cond: bool, *objects: Any, sep: str = ' ', end: str = '\n', file = sys.stdout, flush: bool = False) -> None:
     if cond:
@@ -20,6 +22,46 @@ def safe_to_float(value: Any, default: float | None = None) -> float | None:
     except (ValueError, TypeError):
         return default
 
+# Characters safe_to_float drops before converting, deleted from a whole column at once
+_NUMBER_FORMATTING = str.maketrans("", "", ", $\t\r")
+# A cell that does not start with a digit or one of these is not a number ("#N/A N/A", "", "  -  ")
+_NUMBER_START = [".", "+", "-"]
+
+def _float_or_nan(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+def parse_float_column(cells: Sequence[str]) -> np.ndarray:
+    """
+    Column at a time version of safe_to_float: the cells as a float64 array,
+    NaN wherever safe_to_float would return its default. Thousands
+    separators, spaces and $ are removed from the whole column in one pass
+    and the conversion is done by numpy instead of a float() per cell.
+    """
+    if len(cells) == 0:
+        return np.empty(0, dtype=np.float64)
+    cleaned = "\n".join(cells).translate(_NUMBER_FORMATTING).split("\n")
+    if len(cleaned) != len(cells):
+        # A cell has a line break in it
+        cleaned = [cell.translate(_NUMBER_FORMATTING) for cell in cells]
+    # Variable width strings, a single long cell would blow up a fixed width '<U' array
+    text = np.array(cleaned, dtype=np.dtypes.StringDType())
+    first = np.array(cleaned, dtype='<U1')
+    text[~(np.strings.isdigit(first) | np.isin(first, _NUMBER_START))] = 'nan'
+    try:
+        return text.astype(np.float64)
+    except ValueError:
+        # Some cell starts like a number but is not one, convert the distinct values one by one
+        distinct, inverse = np.unique(text, return_inverse=True)
+        return np.array([_float_or_nan(value) for value in distinct.tolist()], dtype=np.float64)[inverse]
+
+def parse_float_rows(rows: Sequence[Sequence[str]], columns: Sequence[int]) -> np.ndarray:
+    """The given columns of csv rows as a (rows, columns) float64 array, missing cells are NaN."""
+    cells = [row[column] if len(row) > column else '' for row in rows for column in columns]
+    return parse_float_column(cells).reshape(len(rows), len(columns))
+
 def contains_which(str : str, list : List[str]) -> Optional[str]:
     for item in list:
         if item in str:
@@ -27,6 +69,21 @@ def contains_which(str : str, list : List[str]) -> Optional[str]:
     return None
 
 
+def all_substrings(value: str) -> Set[str]:
+    """
+    Every non-empty substring of value. Looking these up in a dict answers
+    "which keys k satisfy `k in value`" without scanning all the keys.
+    """
+    return {value[i:j] for i in range(len(value)) for j in range(i + 1, len(value) + 1)}
+
+@lru_cache(maxsize=1024)
+def lowercase_substrings(value: str) -> FrozenSet[str]:
+    """
+    all_substrings of value.lower(), cached: a company's ticker and name are
+    looked up once per financial institution in a row.
+    """
+    return frozenset(all_substrings(value.lower()))
+
 
 def remove_folder_contents(path: str)-> None:
     folder = path
@@ -0,0 +1,45 @@
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# Global counters and per-stage wall time (seconds) of the current process.
+# Worker processes send theirs back with snapshot() and the parent adds them
+# up with merge(), so stage times of a parallel run are summed over workers.
+counters : Dict[str, int] = {}
+timings : Dict[str, float] = {}
+
+
+def count(name: str, amount: int = 1) -> None:
+    counters[name] = counters.get(name, 0) + amount
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def reset() -> None:
+    counters.clear()
+    timings.clear()
+
+
+def snapshot() -> Dict[str, Dict]:
+    return {"counters": dict(counters), "timings": dict(timings)}
+
+
+def merge(other: Dict[str, Dict]) -> None:
+    for name, amount in other["counters"].items():
+        count(name, amount)
+    for name, seconds in other["timings"].items():
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def write_report(path: str, **extra) -> None:
+    """Write the counters and stage timings as json, along with any extra fields."""
+    with open(path, mode='w') as f:
+        json.dump({**extra, **snapshot()}, f, indent=2, sort_keys=True)
@@ -0,0 +1,59 @@
+import os
+import csv
+from typing import List
+from utilities.company_data import FossilFuelCompanyYear, LONG_FORMAT_HEADER
+from utilities import instrumentation
+
+# "long" writes one financed_emissions_<year>.csv per year with a row per
+# company-year and financial institution, "per-file" is the original layout of
+# one small csv per company-year under <output_dir>/<year>/
+OUTPUT_FORMATS = ["long", "per-file"]
+
+# Rows are written through a large buffer, the file is only flushed a few times
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def long_output_path(output_dir: str, year: int) -> str:
+    return os.path.join(output_dir, f"financed_emissions_{year}.csv")
+
+
+class LongFormatWriter:
+    """Streams long format rows to one csv file."""
+    def __init__(self, path: str):
+        self.file = open(path, mode='w', newline='', buffering=WRITE_BUFFER_SIZE)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(LONG_FORMAT_HEADER)
+
+    def write_company(self, company: FossilFuelCompanyYear) -> None:
+        instrumentation.count("companies.exported")
+        with instrumentation.stage("companies.export_long"):
+            self.writer.writerows(company.long_format_rows())
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> "LongFormatWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def part_path(path: str, index: int) -> str:
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f".{filename}.part{index}")
+
+
+def concatenate_parts(part_paths: List[str], path: str) -> None:
+    """
+    Join the long format files written by worker processes into path, in
+    order and with a single header, and delete them.
+    """
+    with open(path, mode='w', newline='', buffering=WRITE_BUFFER_SIZE) as destination_file:
+        csv.writer(destination_file).writerow(LONG_FORMAT_HEADER)
+        for part in part_paths:
+            with open(part, mode='r', newline='') as part_file:
+                part_file.readline()
+                for line in part_file:
+                    destination_file.write(line)
+            os.remove(part)
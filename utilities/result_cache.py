@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+from extraction_methods.extract_13F_data import DIR_13F, is_year_end_filing
+from extraction_methods.extract_loan_data import DIR_loan_data
+from extraction_methods import BOCC_IICC
+from extraction_methods.cusip_crosswalk import ticker_cusips
+
+# Bump whenever the way results are computed changes, so old entries are ignored
+CACHE_VERSION = 5
+CACHE_FILENAME = ".result_cache.json"
+
+
+class CacheEntry(TypedDict):
+    # Fingerprint of what the company-year itself contributes, see company_fingerprint
+    fingerprint: str
+    # financial institution -> [fi_fingerprint, share value, loan value]
+    institutions: Dict[str, List[Any]]
+
+
+# key "<ticker>|<year>" -> holdings and loans of that company-year, each
+# financial institution reused on its own as long as its inputs are unchanged
+ResultCache = Dict[str, CacheEntry]
+
+# Global caches, so each input file is hashed at most once per process
+_file_fingerprints: Dict[Tuple[str, int, float], str] = {}
+_fi_fingerprints: Dict[Tuple[str, int], str] = {}
+
+
+def cache_key(ticker: str, year: int) -> str:
+    return f"{ticker}|{year}"
+
+
+def file_fingerprint(path: str) -> str:
+    """sha1 of the file contents, or 'missing' if there is no such file."""
+    if not os.path.isfile(path):
+        return "missing"
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    if key not in _file_fingerprints:
+        with open(path, mode='rb') as source_file:
+            _file_fingerprints[key] = hashlib.sha1(source_file.read()).hexdigest()
+    return _file_fingerprints[key]
+
+
+def _13F_paths(directory: str, year: int) -> List[str]:
+    """The files get_share_value_from_directory would read for year, in a stable order."""
+    paths = []
+    if not os.path.isdir(directory):
+        return paths
+    for filename in sorted(os.listdir(directory)):
+        filepath = os.path.join(directory, filename)
+        if os.path.isfile(filepath) and is_year_end_filing(filename, year):
+            paths.append(filepath)
+        elif os.path.isdir(filepath):
+            paths.extend(_13F_paths(filepath, year))
+    return paths
+
+
+def fi_fingerprint(financial_institution: str, year: int) -> str:
+    """
+    Fingerprint of the inputs of a financial institution for a year: its 13F
+    files for the year and its loan, BOCC and IICC files.
+    """
+    key = (financial_institution, year)
+    if key not in _fi_fingerprints:
+        paths = _13F_paths(os.path.join(DIR_13F, financial_institution), year) + [
+            os.path.join(DIR_loan_data, financial_institution+".csv"),
+            os.path.join(BOCC_IICC.DIR_loan_data, financial_institution+".csv"),
+            os.path.join(BOCC_IICC.DIR_share_data, financial_institution+".csv"),
+        ]
+        digest = hashlib.sha1()
+        for path in paths:
+            digest.update(f"{path}:{file_fingerprint(path)}\n".encode())
+        _fi_fingerprints[key] = digest.hexdigest()
+    return _fi_fingerprints[key]
+
+
+def company_fingerprint(ticker: str, name: str) -> str:
+    """
+    Fingerprint of what a company contributes to its holdings and loans
+    whatever the institution: the methodology, its name (loans are matched
+    on it) and the CUSIPs the crosswalk resolves to its ticker.
+    """
+    from global_values import HOLDINGS_METHODOLOGY, LOAN_METHODOLOGY
+    cusips = ",".join(ticker_cusips(ticker))
+    return hashlib.sha1(f"{CACHE_VERSION}\n{HOLDINGS_METHODOLOGY}\n{LOAN_METHODOLOGY}\n{name}\n{cusips}".encode()).hexdigest()
+
+
+def lookup(cache: ResultCache, ticker: str, year: int, fingerprint: str, financial_institution: str) -> Optional[Tuple[float, float]]:
+    """(share value, loan value) of a company-year and institution if none of their inputs changed."""
+    entry = cache.get(cache_key(ticker, year))
+    if entry is None or entry["fingerprint"] != fingerprint:
+        return None
+    values = entry["institutions"].get(financial_institution)
+    if values is None or values[0] != fi_fingerprint(financial_institution, year):
+        return None
+    return values[1], values[2]
+
+
+def load_cache(path: str) -> ResultCache:
+    try:
+        with open(path, mode='r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_cache(path: str, cache: ResultCache) -> None:
+    # Write to a temporary file first so an interrupted run never leaves a truncated cache
+    temporary_path = path + ".tmp"
+    with open(temporary_path, mode='w') as f:
+        json.dump(cache, f)
+    os.replace(temporary_path, path)
@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Set, Tuple, TypedDict
+from utilities.result_cache import ResultCache
+
+# Bump whenever the records change, so journals of older versions are ignored
+JOURNAL_VERSION = 2
+JOURNAL_FILENAME = ".run_journal.jsonl"
+
+# data_processing works through (year, shard of tickers) units. After each one
+# it appends a line to the journal in the output directory:
+#
+#     {"type": "start", "run": {...}}                                  what the run is
+#     {"type": "shard", "year": 2021, "shard": 3, "rows": [...], "cache": {...}}
+#     {"type": "year", "year": 2021}                                  output file of the year is complete
+#
+# Each line is flushed and fsynced before the next unit starts. A run with
+# the same parameters finding a journal skips the units it lists and takes
+# their results from it. The journal is removed once a run completes.
+
+
+class ShardRecord(TypedDict):
+    rows: List[List[float]]
+    cache: ResultCache
+
+
+class Journal(TypedDict):
+    shards: Dict[Tuple[int, int], ShardRecord]
+    years: Set[int]
+
+
+def run_key(**parameters: Any) -> Dict[str, Any]:
+    """
+    What a journal is valid for: the run parameters, the ticker list as a
+    hash. The tickers are sorted first, a universe read into a set comes out
+    in a different order in every process.
+    """
+    key = {"version": JOURNAL_VERSION, **parameters}
+    key["tickers"] = hashlib.sha1("\n".join(sorted(key["tickers"])).encode()).hexdigest()
+    return key
+
+
+def _append(path: str, record: Dict[str, Any]) -> None:
+    with open(path, mode='a') as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_journal(path: str, key: Dict[str, Any]) -> Journal:
+    """
+    The completed units of an interrupted run with the same key, empty if
+    there is none. A journal of a different run is discarded and a new one
+    is started either way.
+    """
+    journal : Journal = {"shards": {}, "years": set()}
+    records = []
+    try:
+        with open(path, mode='r') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Last line cut short by the interruption
+                    break
+    except FileNotFoundError:
+        pass
+    if not records or records[0].get("type") != "start" or records[0].get("run") != key:
+        if os.path.exists(path):
+            os.remove(path)
+        _append(path, {"type": "start", "run": key})
+        return journal
+    for record in records[1:]:
+        if record["type"] == "shard":
+            journal["shards"][(record["year"], record["shard"])] = {"rows": record["rows"], "cache": record["cache"]}
+        elif record["type"] == "year":
+            journal["years"].add(record["year"])
+    return journal
+
+
+def record_shard(path: str, year: int, shard: int, rows: List[List[float]], cache: ResultCache) -> None:
+    _append(path, {"type": "shard", "year": year, "shard": shard, "rows": rows, "cache": cache})
+
+
+def record_year(path: str, year: int) -> None:
+    _append(path, {"type": "year", "year": year})
+
+
+def finish_journal(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
@@ -1,6 +1,21 @@
 import csv
+from functools import lru_cache
+from typing import List
 
-with open("data/input_data/tickers/SFH_data.csv", 'r', encoding='iso-8859-1') as file:
-    reader = csv.reader(file)
-    next(reader)
-    sfh_tickers = [row[19] for row in reader]
\ No newline at end of file
+DIR_SFH = "data/input_data/tickers/SFH_data.csv"
+
+
+@lru_cache(maxsize=None)
+def get_sfh_tickers() -> List[str]:
+    """Tickers of the Bay Street Report 2024 company set, read on first use."""
+    with open(DIR_SFH, 'r', encoding='iso-8859-1') as file:
+        reader = csv.reader(file)
+        next(reader)
+        return [row[19] for row in reader]
+
+
+def __getattr__(name: str):
+    # Keep `from utilities.sfh import sfh_tickers` working without reading the file at import
+    if name == "sfh_tickers":
+        return get_sfh_tickers()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
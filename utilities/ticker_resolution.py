@@ -0,0 +1,95 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from utilities.helper_functions import all_substrings
+
+# Yahoo Finance / 13F symbol suffix -> Bloomberg exchange code. Symbols
+# without a suffix are US listings.
+SUFFIX_TO_BLOOMBERG = {
+    "": "US",
+    "TO": "CN", "V": "CN", "NE": "CN", "CN": "CN",
+    "L": "LN", "IL": "LN",
+    "AX": "AU",
+    "HK": "HK",
+    "T": "JP",
+    "PA": "FP",
+    "DE": "GY", "F": "GY",
+    "SS": "CH", "SZ": "CH",
+    "SW": "SW",
+    "OL": "NO",
+    "AS": "NA",
+    "MI": "IM",
+    "MC": "SM",
+    "SA": "BZ",
+    "MX": "MM",
+    "JO": "SJ",
+    "NS": "IN", "BO": "IN",
+    "KS": "KS",
+    "SI": "SP",
+    "JK": "IJ",
+}
+
+
+def split_bloomberg_ticker(ticker: str) -> Tuple[str, str]:
+    """"XOM US Equity" -> ("XOM", "US"), the exchange is "" if there is none."""
+    parts = ticker.split(" ")
+    return parts[0], parts[1] if len(parts) > 2 else ""
+
+
+def split_symbol(symbol: str) -> Tuple[str, str]:
+    """"SU.TO" -> ("SU", "TO"), "XOM" -> ("XOM", "")."""
+    root, _, suffix = symbol.partition(".")
+    return root, suffix.upper()
+
+
+class TickerResolver:
+    """
+    Matches 13F / Yahoo symbols and ticker fragments against a list of
+    Bloomberg tickers without scanning the list:
+
+    - resolve() maps a symbol to a Bloomberg ticker with the same root symbol,
+      preferring the listing on the exchange given by the symbol's suffix.
+      With strict set only that listing is returned.
+    - containing() returns the tickers that contain a fragment, like
+      `[t for t in tickers if fragment in t]`, through a substring index
+      built on first use.
+    """
+    def __init__(self, tickers: Iterable[str]):
+        self.tickers = sorted(set(tickers))
+        # root symbol -> exchange -> Bloomberg ticker
+        self.by_root : Dict[str, Dict[str, str]] = {}
+        for ticker in self.tickers:
+            root, exchange = split_bloomberg_ticker(ticker)
+            self.by_root.setdefault(root, {}).setdefault(exchange, ticker)
+        self._substrings : Optional[Dict[str, List[str]]] = None
+
+    def resolve(self, symbol: str, strict: bool = False) -> Optional[str]:
+        root, suffix = split_symbol(symbol)
+        listings = self.by_root.get(root)
+        if not listings:
+            return None
+        exchange = SUFFIX_TO_BLOOMBERG.get(suffix)
+        if exchange in listings:
+            return listings[exchange]
+        if strict:
+            return None
+        # Unknown suffix or not listed there, any listing of the root will do
+        return next(iter(listings.values()))
+
+    def containing(self, fragment: str) -> List[str]:
+        if fragment == "":
+            return list(self.tickers)
+        if self._substrings is None:
+            self._substrings = {}
+            for ticker in self.tickers:
+                for substring in all_substrings(ticker):
+                    self._substrings.setdefault(substring, []).append(ticker)
+        return self._substrings.get(fragment, [])
+
+    def contains(self, fragment: str) -> bool:
+        return len(self.containing(fragment)) > 0
+
+
+if __name__ == "__main__":
+    resolver = TickerResolver(["XOM US Equity", "SU CN Equity", "SU US Equity", "BP/ LN Equity", "7203 JP Equity"])
+    print(resolver.resolve("XOM"), resolver.resolve("SU.TO"), resolver.resolve("SU"), resolver.resolve("SU.XX"), resolver.resolve("CVX"))
+    print(resolver.resolve("BP/", strict=True), resolver.resolve("SU.L", strict=True))
+    print(resolver.containing("BP"), resolver.contains("Equity"), resolver.contains("CVX"))
@@ -1,42 +1,99 @@
 import csv
+from functools import lru_cache
+from typing import Dict, List, Set
+from utilities.ticker_resolution import TickerResolver
 
-urgewald_tickers_set = set()
-with open("data/input_data/tickers/urgewald GOGEL 2024.csv", 'r', encoding='iso-8859-1') as file:
-    reader = csv.reader(file)
-    found_ticker_index = False
-    found_business_sector = False
-    while not found_ticker_index or not found_business_sector:
-        try:
-            row = list(next(reader))
-            if not found_business_sector:
-                business_sector_index = row.index("Primary Business Sectors")
-                found_business_sector = True
-            bb_ticker_index = row.index("BB Ticker")
-            found_ticker_index = True
-        except ValueError:
-            pass
-        except StopIteration:
-            raise Exception("Make sure the Urgewald file has a column 'BB Ticker' and Primary Business Sectors")
-    tickers = {line[bb_ticker_index] for line in reader if  line[bb_ticker_index] != "ticker" and line[bb_ticker_index] != "! - n.a." and line[bb_ticker_index] != "" and line[bb_ticker_index] != " " and "Oil & Gas" in line[business_sector_index]}
-    urgewald_tickers_set |= tickers
-
-with open("data/input_data/tickers/urgewald GCEL 2024 for FI.csv", encoding='iso-8859-1') as file:
-    reader = csv.reader(file)
-    found_ticker_index = False
-    found_business_sector = False
-    while not found_ticker_index or not found_business_sector:
-        try:
-            row = list(next(reader))
-            if not found_business_sector:
-                business_sector_index = row.index("Coal Industry Sector")
-                found_business_sector = True
-            bb_ticker_index = row.index("BB Ticker")
-            found_ticker_index = True
-        except ValueError:
-            pass
-        except StopIteration:
-            raise Exception("Make sure the Urgewald file has a column 'BB Ticker'")
-    tickers = {line[bb_ticker_index] for line in reader if line[bb_ticker_index] != "! - n.a." and line[bb_ticker_index] != "" and line[bb_ticker_index] != " "}
-    urgewald_tickers_set |= tickers
-
-urgewald_tickers = list(urgewald_tickers_set)
\ No newline at end of file
+DIR_GOGEL = "data/input_data/tickers/urgewald GOGEL 2024.csv"
+DIR_GCEL = "data/input_data/tickers/urgewald GCEL 2024 for FI.csv"
+
+
+@lru_cache(maxsize=None)
+def get_urgewald_tickers_set() -> Set[str]:
+    """
+    Bloomberg tickers of the oil & gas companies in GOGEL and every company in
+    GCEL. The files are only read the first time this is called.
+    """
+    urgewald_tickers_set = set()
+    with open(DIR_GOGEL, 'r', encoding='iso-8859-1') as file:
+        reader = csv.reader(file)
+        found_ticker_index = False
+        found_business_sector = False
+        while not found_ticker_index or not found_business_sector:
+            try:
+                row = list(next(reader))
+                if not found_business_sector:
+                    business_sector_index = row.index("Primary Business Sectors")
+                    found_business_sector = True
+                bb_ticker_index = row.index("BB Ticker")
+                found_ticker_index = True
+            except ValueError:
+                pass
+            except StopIteration:
+                raise Exception("Make sure the Urgewald file has a column 'BB Ticker' and Primary Business Sectors")
+        tickers = {line[bb_ticker_index] for line in reader if  line[bb_ticker_index] != "ticker" and line[bb_ticker_index] != "! - n.a." and line[bb_ticker_index] != "" and line[bb_ticker_index] != " " and "Oil & Gas" in line[business_sector_index]}
+        urgewald_tickers_set |= tickers
+
+    with open(DIR_GCEL, encoding='iso-8859-1') as file:
+        reader = csv.reader(file)
+        found_ticker_index = False
+        found_business_sector = False
+        while not found_ticker_index or not found_business_sector:
+            try:
+                row = list(next(reader))
+                if not found_business_sector:
+                    business_sector_index = row.index("Coal Industry Sector")
+                    found_business_sector = True
+                bb_ticker_index = row.index("BB Ticker")
+                found_ticker_index = True
+            except ValueError:
+                pass
+            except StopIteration:
+                raise Exception("Make sure the Urgewald file has a column 'BB Ticker'")
+        tickers = {line[bb_ticker_index] for line in reader if line[bb_ticker_index] != "! - n.a." and line[bb_ticker_index] != "" and line[bb_ticker_index] != " "}
+        urgewald_tickers_set |= tickers
+    return urgewald_tickers_set
+
+
+@lru_cache(maxsize=None)
+def get_urgewald_tickers() -> List[str]:
+    # Sorted, so shards and output rows are in the same order in every process
+    return sorted(get_urgewald_tickers_set())
+
+
+def _read_sectors(path: str, sector_column: str) -> Dict[str, str]:
+    """BB Ticker -> sector column of an Urgewald file, whose header may follow a few title rows."""
+    with open(path, 'r', encoding='iso-8859-1') as file:
+        reader = csv.reader(file)
+        for row in reader:
+            if "BB Ticker" in row and sector_column in row:
+                ticker_index, sector_index = row.index("BB Ticker"), row.index(sector_column)
+                break
+        else:
+            raise Exception(f"Make sure the Urgewald file has a column 'BB Ticker' and {sector_column}")
+        return {line[ticker_index]: line[sector_index] for line in reader if len(line) > max(ticker_index, sector_index) and line[ticker_index].strip() not in ("", "! - n.a.")}
+
+
+@lru_cache(maxsize=None)
+def get_urgewald_sectors() -> Dict[str, str]:
+    """
+    Bloomberg ticker -> "Oil & Gas" for the GOGEL companies or "Coal" for
+    the GCEL ones (coal wins for companies in both lists).
+    """
+    sectors = {ticker: "Oil & Gas" for ticker, sector in _read_sectors(DIR_GOGEL, "Primary Business Sectors").items() if "Oil & Gas" in sector}
+    sectors.update((ticker, "Coal") for ticker in _read_sectors(DIR_GCEL, "Coal Industry Sector"))
+    return sectors
+
+
+@lru_cache(maxsize=None)
+def get_urgewald_resolver() -> TickerResolver:
+    return TickerResolver(get_urgewald_tickers_set())
+
+
+def __getattr__(name: str):
+    # Keep `from utilities.urgewald import urgewald_tickers` working, but only
+    # read the files when the list is actually asked for
+    if name == "urgewald_tickers":
+        return get_urgewald_tickers()
+    if name == "urgewald_tickers_set":
+        return get_urgewald_tickers_set()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,11 +1,17 @@
-import yfinance as yf
-import pycountry
-from typing import Tuple, Optional, List
+from typing import Any, Callable, Dict, Iterable, Tuple, Optional, List, Set
+from concurrent.futures import ThreadPoolExecutor
+import os
+import json
 import time
+import random
+import threading
+from utilities.helper_functions import print_cond
 
-# Global caches
-fossil_fuel_symbols = set()
-non_fossil_fossil_symbols = set()
+# yfinance and pycountry are imported inside the functions that use them so
+# that importing this module (e.g. for get_yahoo_tickers) stays cheap
+
+DIR_yahoo_cache = "./data/output_data/yahoo_cache.json"
+DIR_yahoo_tickers = "./data/input_data/tickers/yahoo_tickers.txt"
 
 # Bloomberg-style suffix mapping for major exchanges
 EXCHANGE_TO_BLOOMBERG = {
@@ -34,6 +40,7 @@ def _to_bloomberg_code(symbol: str, exchange: str, country: str) -> str:
     Convert Yahoo Finance exchange/country to a Bloomberg-style suffix.
     Uses a predefined exchange mapping first; falls back to ISO country codes.
     """
+    import pycountry
     exchange = exchange.upper() if exchange else ""
     
     # Use predefined Bloomberg mapping for known exchanges
@@ -51,57 +58,177 @@ def _to_bloomberg_code(symbol: str, exchange: str, country: str) -> str:
     # Fallback if nothing else works
     return f"{symbol}_UN"  # UN = Unknown
 
-def is_fossil_fuel_company(symbol: str) -> Optional[Tuple[str,str]]:
+def classify_info(symbol: str, info: Dict[str, Any]) -> Optional[Tuple[str, str]]:
     """
-    Check if a company is a fossil fuel company by querying Yahoo Finance,
-    and store its Bloomberg-style exchange code in `fossil_fuel_country_codes`.
-    return the bloomberg ticker and country code if true, return None if not
-    fossil fuel.
+    Given the Yahoo Finance info of a symbol, return the symbol and its
+    Bloomberg-style code if it is a fossil fuel company, None otherwise.
     """
-    symbol = symbol.split("/")[0]
-    if symbol in non_fossil_fossil_symbols:
-        return None
+    sector = str(info.get("sector", "")).lower()
+    industry = str(info.get("industry", "")).lower()
+
+    fossil_keywords = ["oil", "gas", "coal", "fossil", "petroleum"]
 
-    if not isinstance(symbol, str) or not symbol.strip():
+    is_fossil = any(keyword in sector for keyword in fossil_keywords) or \
+                any(keyword in industry for keyword in fossil_keywords)
+    if not is_fossil:
         return None
 
-    for _ in range(3):  # retry up to 3 times
+    # Retrieve exchange and country and convert to Bloomberg-style format
+    exchange = info.get("exchange", "")
+    country = info.get("country", "")
+    return (symbol, _to_bloomberg_code(symbol, exchange, country))
+
+
+def fetch_yahoo_info(symbol: str) -> Dict[str, Any]:
+    import yfinance as yf
+    return yf.Ticker(symbol).info
+
+
+def normalize_symbol(symbol: str) -> str:
+    return symbol.split("/")[0]
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows `rate` requests per second on average
+    with bursts of up to `capacity`. acquire() blocks until a token is free.
+    """
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class YahooClassifier:
+    """
+    Classifies symbols as fossil fuel companies through Yahoo Finance with a
+    bounded pool of worker threads, a token bucket rate limit shared by all
+    workers, exponential backoff on errors and a json cache on disk whose
+    entries expire after ttl_seconds.
+
+    fetch_info is what talks to Yahoo; pass a stub to run without network.
+    Only one classifier should talk to Yahoo at a time, the rate limit is not
+    shared with other processes: give worker processes the dict returned by
+    classify_many instead.
+    """
+    def __init__(self,
+                 cache_path: Optional[str] = DIR_yahoo_cache,
+                 ttl_seconds: float = 30 * 24 * 60 * 60,
+                 workers: int = 8,
+                 requests_per_second: float = 2,
+                 burst: int = 4,
+                 max_retries: int = 5,
+                 backoff_seconds: float = 2,
+                 max_backoff_seconds: float = 5 * 60,
+                 fetch_info: Callable[[str], Dict[str, Any]] = fetch_yahoo_info):
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self.workers = workers
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.fetch_info = fetch_info
+        self.lock = threading.Lock()
+        # symbol -> {"result": [symbol, bloomberg code] or None, "fetched_at": unix time}
+        self.cache : Dict[str, Dict[str, Any]] = self._load_cache()
+        # Symbols given up on in this run, not requested again until the next
+        # one (they are not written to the cache)
+        self.failed : Set[str] = set()
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        if self.cache_path is None:
+            return {}
         try:
-            stock = yf.Ticker(symbol)
-            info = stock.info
-
-            sector = str(info.get("sector", "")).lower()
-            industry = str(info.get("industry", "")).lower()
-            
-            fossil_keywords = ["oil", "gas", "coal", "fossil", "petroleum"]
-
-            is_fossil = any(keyword in sector for keyword in fossil_keywords) or \
-                        any(keyword in industry for keyword in fossil_keywords)
-
-            if is_fossil:
-                fossil_fuel_symbols.add(symbol)
-                
-                # Retrieve exchange and country
-                exchange = info.get("exchange", "")
-                country = info.get("country", "")
-
-                # Convert to Bloomberg-style format
-                bloomberg_code = _to_bloomberg_code(symbol, exchange, country)
-                
-                return (symbol, bloomberg_code)
-
-            non_fossil_fossil_symbols.add(symbol)
+            with open(self.cache_path, mode='r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self) -> None:
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with self.lock:
+            data = json.dumps(self.cache)
+        temporary_path = self.cache_path + ".tmp"
+        with open(temporary_path, mode='w') as f:
+            f.write(data)
+        os.replace(temporary_path, self.cache_path)
+
+    def cached(self, symbol: str) -> Tuple[bool, Optional[Tuple[str, str]]]:
+        """(True, result) if symbol has a fresh cache entry, (False, None) otherwise."""
+        entry = self.cache.get(normalize_symbol(symbol))
+        if entry is None or time.time() - entry["fetched_at"] > self.ttl_seconds:
+            return False, None
+        return True, tuple(entry["result"]) if entry["result"] is not None else None
+
+    def _fetch(self, symbol: str) -> Optional[Tuple[str, str]]:
+        for attempt in range(self.max_retries):
+            self.bucket.acquire()
+            try:
+                result = classify_info(symbol, self.fetch_info(symbol))
+            except Exception as error:
+                wait = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"{error}: {symbol}, retrying in {wait:.0f}s")
+                time.sleep(wait)
+                continue
+            with self.lock:
+                self.cache[symbol] = {"result": list(result) if result is not None else None, "fetched_at": time.time()}
+            return result
+        # Not cached, so the next run tries again
+        print(f"Giving up on {symbol} after {self.max_retries} attempts")
+        with self.lock:
+            self.failed.add(symbol)
+        return None
+
+    def classify(self, symbol: str) -> Optional[Tuple[str, str]]:
+        if not isinstance(symbol, str) or not symbol.strip():
             return None
+        symbol = normalize_symbol(symbol)
+        found, result = self.cached(symbol)
+        if found or symbol in self.failed:
+            return result
+        return self._fetch(symbol)
 
-        except Exception as error:
-            print(f"{error}: {symbol}")
-            print("pausing for request limit")
-            time.sleep(5 * 60)
-            print("Resuming.")
+    def classify_many(self, symbols: Iterable[str], verbose: bool = False) -> Dict[str, Optional[Tuple[str, str]]]:
+        """
+        Classify every distinct symbol once, only requesting the ones without
+        a fresh cache entry, then save the cache. Returns symbol -> result for
+        each of the given symbols, symbols given up on map to None.
+        """
+        requested = [symbol for symbol in symbols if isinstance(symbol, str) and symbol.strip()]
+        results : Dict[str, Optional[Tuple[str, str]]] = {}
+        missing = []
+        for symbol in sorted({normalize_symbol(symbol) for symbol in requested}):
+            found, result = self.cached(symbol)
+            if found or symbol in self.failed:
+                results[symbol] = result
+            else:
+                missing.append(symbol)
+        print_cond(verbose, f"{len(results) + len(missing)} distinct symbols, {len(missing)} to request from Yahoo Finance")
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results.update(zip(missing, executor.map(self._fetch, missing)))
+        finally:
+            self.save()
+        return {symbol: results[normalize_symbol(symbol)] for symbol in requested}
 
-    non_fossil_fossil_symbols.add(symbol)
-    return None
 
 def get_yahoo_tickers() -> List[str]:
-    with open("./data/input_data/tickers/yahoo_tickers.txt") as f:
+    with open(DIR_yahoo_tickers) as f:
         return f.read().split("\n")
\ No newline at end of file